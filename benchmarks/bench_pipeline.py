@@ -0,0 +1,202 @@
+"""Benchmark headless du pipeline (chargement, filtres, agrégats, figures, export).
+
+    python -m benchmarks.bench_pipeline --rows 10000 100000 1000000
+
+Chaque taille est générée par optiques.synthetic ; les temps (meilleur et
+médiane sur --repeat passes) sont ajoutés en JSON lines à --results et
+comparés au run précédent de même taille pour repérer les régressions.
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from optiques.aggregates import AggregateService
+from optiques.config import MAP_GRID_CELLS, MAP_POINT_LIMIT
+from optiques.correlation import CorrelationService
+from optiques.dedup import deduplicate
+from optiques.distance import DistanceIndex
+from optiques.export import EXPORT_FORMATS, export_bytes
+from optiques.figures import (
+    correlation_figure, digital_scatter_figure, map_cells_figure, map_points_figure, performance_figure
+)
+from optiques.filters import FilterIndex, filter_frame
+from optiques.ingestion import coerce_frame, ensure_snapshot, read_snapshot, source_fingerprint, write_snapshot
+from optiques.spatial import CoverageIndex, grid_aggregate, grid_cell_size
+from optiques.scoring import ScoringEngine
+from optiques.synthetic import generate, write
+
+RESULTS_PATH = Path(__file__).parent / "results.jsonl"
+# Au-delà, la conversion openpyxl prendrait plusieurs minutes par passe
+XLSX_MAX_ROWS = 100_000
+REGRESSION_RATIO = 1.2
+# Écart minimal (s) pour signaler une régression : ignore le bruit des étapes sub-milliseconde
+REGRESSION_MIN_DELTA = 0.002
+
+
+def _time(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return result, {"best": min(timings), "median": statistics.median(timings)}
+
+
+def _queries(filter_index):
+    top_city = filter_index.city_counts(filter_index.all_rows).index[0]
+    return {
+        "toutes": dict(),
+        "ville": dict(city=top_city),
+        "note": dict(note_range=(4.0, 5.0)),
+        "distance": dict(max_distance=10.0),
+        "combinee": dict(city=top_city, note_range=(4.0, 5.0), max_distance=10.0),
+    }
+
+
+def _map_figure(df):
+    geo_df = df.dropna(subset=["Latitude", "Longitude"])
+    if len(geo_df) <= MAP_POINT_LIMIT:
+        return map_points_figure(geo_df, "viridis")
+    lat = geo_df["Latitude"].to_numpy(dtype=float)
+    lon = geo_df["Longitude"].to_numpy(dtype=float)
+    note = geo_df["Note_Google"].to_numpy(dtype=float, na_value=np.nan)
+    cells = grid_aggregate(lat, lon, note, grid_cell_size(lat, lon, MAP_GRID_CELLS))
+    return map_cells_figure(cells, "viridis")
+
+
+def run(rows, repeat=3, seed=0, xlsx_max_rows=XLSX_MAX_ROWS):
+    stages = {}
+    raw, stages["generate"] = _time(lambda: generate(rows, seed), 1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        if rows <= xlsx_max_rows:
+            source = tmp / "synth.xlsx"
+            write(raw, source)
+            # Passe froide : parsing openpyxl + écriture du snapshot
+            _, stages["load.xlsx"] = _time(lambda: ensure_snapshot(source, tmp / "cache_xlsx"), 1)
+
+        source = tmp / "synth.parquet"
+        write(raw, source)
+        fingerprint, sha256 = source_fingerprint(source), "bench"
+        manifest, stages["load.convert"] = _time(
+            lambda: write_snapshot(coerce_frame(raw.copy()), source, fingerprint, sha256, tmp / "cache"), repeat
+        )
+        df, stages["load.snapshot"] = _time(lambda: read_snapshot(manifest), repeat)
+    # Blocages, paires candidates, composantes et fusion (inclus dans load.xlsx)
+    _, stages["load.dedup"] = _time(lambda: deduplicate(df), repeat)
+
+    def build_index():
+        filter_index = FilterIndex(df)
+        return filter_index, AggregateService(df, filter_index)
+
+    (filter_index, aggregates), stages["index"] = _time(build_index, repeat)
+    queries = _queries(filter_index)
+
+    selections = {}
+    for name, query in queries.items():
+        selections[name], stages[f"filter.{name}"] = _time(lambda: filter_index.select(**query), repeat)
+    for name, selected in selections.items():
+        _, stages[f"aggregate.{name}"] = _time(lambda: aggregates.compute(selected), repeat)
+
+    correlations, stages["correlation.index"] = _time(lambda: CorrelationService(df, filter_index), repeat)
+    for name, query in queries.items():
+        # Sans cache : statistiques sommées par ville ou relues sur la sélection
+        _, stages[f"correlation.{name}"] = _time(
+            lambda: correlations.stats(rows=selections[name], **query), repeat
+        )
+
+    scoring, stages["scoring.index"] = _time(lambda: ScoringEngine(df, filter_index), repeat)
+    # Sans cache : un produit matrice-vecteur par configuration de poids
+    _, stages["scoring.scores"] = _time(lambda: scoring.cache.clear() or scoring.scores(), repeat)
+    _, stages["scoring.top_k"] = _time(lambda: scoring.top_k(k=10, rows=selections["toutes"]), repeat)
+    _, stages["scoring.top_k_by_city"] = _time(lambda: scoring.top_k_by_city(k=10), repeat)
+
+    distance_index, stages["spatial.kdtree"] = _time(lambda: DistanceIndex(df), repeat)
+    coverage, stages["spatial.coverage"] = _time(lambda: CoverageIndex(distance_index), repeat)
+    _, stages["spatial.hex_density"] = _time(lambda: coverage.hex_density(selections["toutes"], 5), repeat)
+
+    df_all = filter_frame(df, selections["toutes"])
+    agg = aggregates.compute(selections["toutes"])
+    figures = {
+        "map": lambda: _map_figure(df_all),
+        "performance": lambda: performance_figure(df_all, agg["top5_city_notes"], filter_index.distance_col),
+        "digital_scatter": lambda: digital_scatter_figure(df_all),
+        "correlation": lambda: correlation_figure(df_all, "viridis"),
+    }
+    for name, build in figures.items():
+        _, stages[f"figure.{name}"] = _time(build, repeat)
+    for fmt in EXPORT_FORMATS:
+        _, stages[f"export.{fmt}"] = _time(lambda: export_bytes(df_all, fmt), repeat)
+
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "rows": rows,
+        "repeat": repeat,
+        "stages": stages,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _previous(results_path, rows):
+    previous = None
+    if results_path.exists():
+        with open(results_path, encoding="utf-8") as fh:
+            for line in fh:
+                record = json.loads(line)
+                if record.get("rows") == rows:
+                    previous = record
+    return previous
+
+
+def report(record, previous=None):
+    print(f"\n{record['rows']:,} lignes ({record['commit']})")
+    for stage, timing in record["stages"].items():
+        line = f"  {stage:<28}{timing['median'] * 1000:>10.2f} ms"
+        before = previous and previous["stages"].get(stage)
+        if before and before["median"] > 0:
+            ratio = timing["median"] / before["median"]
+            slower = timing["median"] - before["median"] > REGRESSION_MIN_DELTA
+            flag = "  <- régression" if ratio > REGRESSION_RATIO and slower else ""
+            line += f"   x{ratio:.2f} vs {previous['commit']}{flag}"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--xlsx-max-rows", type=int, default=XLSX_MAX_ROWS)
+    parser.add_argument("--results", type=Path, default=RESULTS_PATH)
+    args = parser.parse_args(argv)
+
+    for rows in args.rows:
+        record = run(rows, args.repeat, args.seed, args.xlsx_max_rows)
+        report(record, _previous(args.results, rows))
+        with open(args.results, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    main()
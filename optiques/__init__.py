@@ -0,0 +1 @@
+"""Pipeline de données du dashboard optiques (ingestion, filtres, agrégats)."""
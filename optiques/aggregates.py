@@ -0,0 +1,169 @@
+"""Agrégats du dashboard calculés en une passe par état de filtre.
+
+Les cartes de métriques, les onglets et le résumé exécutif lisent tous le
+même dictionnaire, mis en cache (LRU borné) par clé (ville, plage de notes,
+distance max).
+"""
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from .binning import HISTOGRAM_BINS, Histograms
+from .cache import LRUCache
+from .filters import NOTE_COL
+
+AVIS_COL = "Nb_Avis_Google"
+DIGITAL_COL = "Score_Presence_Digitale"
+SIZE_COL = "Taille_Entreprise"
+DIGITAL_CHANNELS = ["Site web", "Réseaux sociaux", "Email"]
+
+
+def share(count, total):
+    """Pourcentage de total, 0 si la sélection est vide."""
+    return count / total * 100 if total else 0.0
+
+
+def _nan_stat(func, values, *args):
+    # Même convention que pandas : NaN ignorés, NaN si aucune valeur
+    if values is None or not np.any(~np.isnan(values)):
+        return np.nan
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return float(func(values, *args))
+
+
+class AggregateService:
+    def __init__(self, df, filter_index, max_entries=256, max_bytes=32 * 1024 * 1024):
+        self.df = df
+        self.filter_index = filter_index
+        self.cache = LRUCache(max_entries=max_entries, max_bytes=max_bytes)
+        # Colonnes gardées dans leur type compact, converties en float64 par sélection
+        self.distance_col = filter_index.distance_col
+        self._numeric = {
+            col: df[col].to_numpy() for col in (NOTE_COL, AVIS_COL, DIGITAL_COL, self.distance_col)
+            if col in df.columns
+        }
+        # Canaux digitaux, utilisés seulement via notna() : booléens calculés une
+        # fois par version, hors du DataFrame affiché et exporté
+        self._present = {col: df[col].notna().to_numpy() for col in DIGITAL_CHANNELS if col in df.columns}
+
+        # Histogrammes à bornes fixes, avec partiels par ville et par strate
+        # (note renseignée, distance renseignée) pour les sélections « ville seule »
+        self._strata_cols = [col for col in (NOTE_COL, self.distance_col) if filter_index.has(col)]
+        strata = np.zeros(len(df), dtype=np.int64)
+        for bit, col in enumerate(self._strata_cols):
+            strata |= pd.notna(self._numeric[col]).astype(np.int64) << bit
+        self.histograms = Histograms(
+            {col: df[col].to_numpy(dtype=np.float64, na_value=np.nan) for col in HISTOGRAM_BINS if col in df.columns},
+            city_codes=filter_index.city_codes(filter_index.all_rows),
+            n_cities=len(filter_index.city_names),
+            strata=strata,
+            n_strata=2 ** len(self._strata_cols),
+        )
+
+    @staticmethod
+    def key(city=None, note_range=None, max_distance=None):
+        return (city, None if note_range is None else tuple(note_range), max_distance)
+
+    def get(self, city=None, note_range=None, max_distance=None, rows=None):
+        """Agrégats de la sélection ; rows évite de refaire la sélection si connue."""
+        key = self.key(city, note_range, max_distance)
+
+        def compute():
+            selected = rows if rows is not None else self.filter_index.select(city, note_range, max_distance)
+            return self.compute(selected, self._partial_histograms(city, note_range, max_distance))
+
+        return self.cache.get_or_compute(key, compute)
+
+    def _partial_histograms(self, city, note_range, max_distance):
+        """Histogrammes sommés depuis les partiels si les plages ne retiennent
+        que les valeurs renseignées (curseurs aux extrémités), sinon None."""
+        limits = {NOTE_COL: note_range, self.distance_col: None if max_distance is None else (None, max_distance)}
+        strata = np.arange(2 ** len(self._strata_cols))
+        for bit, col in enumerate(self._strata_cols):
+            if limits.get(col) is None:
+                continue
+            if not self.filter_index.covers(col, *limits[col]):
+                return None
+            strata = strata[(strata >> bit) & 1 == 1]
+        city_code = None
+        if city is not None:
+            city_code = self.filter_index.city_code(city)
+            if city_code < 0:
+                return None
+        return self.histograms.get(city_code=city_code, strata=strata)
+
+    def updated(self, df, filter_index, old_index, changed):
+        """Service pour la version suivante du jeu de données.
+
+        Une entrée en cache reste valide si aucune ligne touchée (modifiée,
+        avant ou après changement, ou ajoutée) n'entre dans sa sélection :
+        seules les sélections réellement affectées seront recalculées.
+        """
+        new = AggregateService(df, filter_index, self.cache.max_entries, self.cache.max_bytes)
+        changed = np.asarray(changed, dtype=np.intp)
+        touched = np.concatenate([changed, np.arange(old_index.n_rows, len(df), dtype=np.intp)])
+        for key, agg in self.cache.items():
+            if old_index.matches(changed, *key).any() or filter_index.matches(touched, *key).any():
+                continue
+            new.cache.put(key, agg)
+        return new
+
+    def compute(self, rows, histograms=None):
+        n = len(rows)
+        col = {name: values[rows].astype(np.float64) for name, values in self._numeric.items()}
+        note = col.get(NOTE_COL)
+        avis = col.get(AVIS_COL)
+        digital = col.get(DIGITAL_COL)
+        distance = col.get(self.distance_col)
+
+        agg = {"n_rows": n}
+
+        if note is not None:
+            agg["note_mean"] = _nan_stat(np.nanmean, note)
+            agg["note_q75"] = _nan_stat(np.nanquantile, note, 0.75)
+            agg["note_ge_4"] = int(np.count_nonzero(note >= 4.0))
+            agg["note_ge_4_5"] = int(np.count_nonzero(note >= 4.5))
+        if avis is not None:
+            agg["avis_median"] = _nan_stat(np.nanmedian, avis)
+            agg["avis_ge_50"] = int(np.count_nonzero(avis >= 50))
+        if note is not None and avis is not None:
+            agg["top_performers"] = int(np.count_nonzero((note >= 4.0) & (avis >= 20)))
+        if digital is not None:
+            agg["digital_mean"] = _nan_stat(np.nanmean, digital)
+            agg["digital_q90"] = _nan_stat(np.nanquantile, digital, 0.90)
+        if distance is not None:
+            agg["distance_mean"] = _nan_stat(np.nanmean, distance)
+            agg["distance_le_10"] = int(np.count_nonzero(distance <= 10))
+
+        # Présence digitale par canal
+        present = {name: mask[rows] for name, mask in self._present.items()}
+        agg["channels"] = {name: int(mask.sum()) for name, mask in present.items()}
+        if len(present) == len(DIGITAL_CHANNELS):
+            agg["complete_digital"] = int(np.count_nonzero(np.logical_and.reduce(list(present.values()))))
+
+        # Villes : comptages et notes moyennes du top 5
+        city_counts = self.filter_index.city_counts(rows)
+        agg["city_counts"] = city_counts
+        agg["n_cities"] = len(city_counts)
+        codes = self.filter_index.city_codes(rows)
+        if note is not None and codes is not None:
+            valid = (codes >= 0) & ~np.isnan(note)
+            n_codes = len(self.filter_index.city_names)
+            sums = np.bincount(codes[valid], weights=note[valid], minlength=n_codes)
+            counts = np.bincount(codes[valid], minlength=n_codes)
+            top5 = [self.filter_index.city_code(city) for city in city_counts.index[:5]]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                means = sums[top5] / counts[top5]
+            agg["top5_city_notes"] = pd.Series(means, index=pd.Index(city_counts.index[:5], name="Ville"),
+                                               name=NOTE_COL).sort_index()
+
+        if SIZE_COL in self.df.columns:
+            sizes = self.df[SIZE_COL].to_numpy()[rows]
+            frame = pd.DataFrame({c: col[c] for c in (NOTE_COL, AVIS_COL, DIGITAL_COL) if c in col})
+            agg["size_analysis"] = frame.groupby(pd.Index(sizes, name=SIZE_COL)).mean().round(2)
+
+        # {colonne: (comptages, bornes)} : seuls ces tableaux partent vers les graphiques
+        agg["histograms"] = histograms if histograms is not None else self.histograms.get(rows)
+        return agg
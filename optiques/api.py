@@ -0,0 +1,322 @@
+"""API HTTP en lecture seule, servie depuis le même jeu de données que le dashboard.
+
+    uvicorn optiques.api:app --port 8000      # ou python -m optiques.api
+
+Les calculs passent par optiques.core : même Dataset partagé, mêmes index et
+agrégats en cache, donc les mêmes chiffres que les curseurs du dashboard.
+
+Paramètres de filtre, tous optionnels (par défaut : curseurs à leur position
+initiale) : ville, note_min, note_max, distance_max, reference (TARMIZ, nom
+de site, « Site le plus proche » ou « Point personnalisé » avec lat et lon).
+
+    GET /health    version du jeu de données (503 pendant le premier chargement)
+    GET /villes    villes et nombre d'optiques
+    GET /metrics   chiffres clés de la sélection (JSON)
+    GET /data      lignes de la sélection : columns, sort, q, offset, limit ;
+                   JSON (liste d'objets) ou Arrow IPC (format=arrow ou
+                   Accept: application/vnd.apache.arrow.stream)
+
+Chaque réponse porte un ETag (version du jeu de données + paramètres) : une
+requête avec If-None-Match reçoit 304 sans aucun calcul tant que le classeur
+n'a pas changé.
+"""
+import asyncio
+import hashlib
+import json
+import math
+
+import numpy as np
+import pyarrow as pa
+
+from . import core
+from .table import SORT_COLS
+
+try:
+    from starlette.applications import Starlette
+    from starlette.concurrency import run_in_threadpool
+    from starlette.responses import JSONResponse, Response
+    from starlette.routing import Route
+except ImportError:  # dépendance optionnelle
+    raise ImportError("L'API nécessite starlette et uvicorn (pip install starlette uvicorn)") from None
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 10_000
+
+
+def _float_param(params, name):
+    value = params.get(name, "")
+    if value == "":
+        return None
+    try:
+        value = float(value)
+    except ValueError:
+        raise ValueError(f"{name} : nombre attendu, reçu {value!r}")
+    if not math.isfinite(value):
+        raise ValueError(f"{name} : nombre fini attendu, reçu {value}")
+    return value
+
+
+def _int_param(params, name, default, low, high):
+    value = params.get(name, "")
+    if value == "":
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError(f"{name} : entier attendu, reçu {value!r}")
+    if not low <= value <= high:
+        raise ValueError(f"{name} : doit être entre {low} et {high}")
+    return value
+
+
+def selection(dataset, state, params):
+    """(état, ville, plage de notes, distance max, clé de filtre) des paramètres de requête."""
+    reference = params.get("reference", core.DEFAULT_REFERENCE)
+    lat, lon = _float_param(params, "lat"), _float_param(params, "lon")
+    point = (lat, lon) if lat is not None and lon is not None else None
+    state = core.reference_state(dataset, state, reference, point)
+
+    # Bornes absentes : celles des curseurs à leur position initiale
+    note_range, max_distance = core.default_ranges(state.filter_index)
+    note_min, note_max = _float_param(params, "note_min"), _float_param(params, "note_max")
+    if note_range is not None and (note_min is not None or note_max is not None):
+        note_range = (note_range[0] if note_min is None else note_min,
+                      note_range[1] if note_max is None else note_max)
+    distance_max = _float_param(params, "distance_max")
+    if max_distance is not None and distance_max is not None:
+        max_distance = distance_max
+
+    city = params.get("ville", core.ALL_CITIES)
+    key = core.filter_key(city, note_range, max_distance, reference, core.reference_point(reference, point))
+    return state, city, note_range, max_distance, key
+
+
+def _wants_arrow(request):
+    fmt = request.query_params.get("format")
+    if fmt is not None:
+        if fmt not in ("json", "arrow"):
+            raise ValueError(f"format : json ou arrow, reçu {fmt!r}")
+        return fmt == "arrow"
+    return ARROW_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def etag(path, version, params, arrow=False):
+    # Paramètres triés : l'ordre dans l'URL ne change pas l'ETag
+    payload = repr((path, version, sorted(params.items()), arrow)).encode()
+    return '"' + hashlib.sha1(payload).hexdigest()[:20] + '"'
+
+
+def _not_modified(request, tag):
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return False
+    tags = {t.strip().removeprefix("W/") for t in header.split(",")}
+    return tag in tags or "*" in tags
+
+
+def json_records(page):
+    """Lignes en JSON, flottants aux valeurs du classeur.
+
+    Un float32 est écrit par sa plus courte écriture décimale (celle de
+    l'export CSV : 179.98), pas par son développement en float64
+    (179.9799957275). Les float64 (coordonnées, 7 décimales au classeur)
+    gardent les 10 décimales de to_json.
+    """
+    compact = [col for col in page.columns if page[col].dtype == np.float32]
+    page = page.assign(**{col: page[col].to_numpy().astype(str).astype(np.float64) for col in compact})
+    return page.to_json(orient="records", force_ascii=False, date_format="iso")
+
+
+def health(dataset, state, params, arrow):
+    return JSONResponse({"version": state.version, "lignes": len(state.df)})
+
+
+def cities(dataset, state, params, arrow):
+    city_counts = core.aggregates(state)["city_counts"]
+    return JSONResponse([{"ville": city, "nombre": int(count)} for city, count in city_counts.items()])
+
+
+def metrics(dataset, state, params, arrow):
+    state, city, note_range, max_distance, _ = selection(dataset, state, params)
+    _, agg = core.select(state, city, note_range, max_distance)
+    filters = {"ville": city, "note": None if note_range is None else list(note_range),
+               "distance_max": max_distance, "reference": params.get("reference", core.DEFAULT_REFERENCE)}
+    return JSONResponse({"version": state.version, "filtres": filters, **core.summary(agg)})
+
+
+def data(dataset, state, params, arrow):
+    state, city, note_range, max_distance, key = selection(dataset, state, params)
+    df = state.df
+    columns = [c for c in params.get("columns", "").split(",") if c] or list(df.columns)
+    unknown = [c for c in columns if c not in df.columns]
+    if unknown:
+        raise ValueError(f"columns : colonnes inconnues {unknown}")
+    sort_col = params.get("sort") or None
+    sortable = [c for c in SORT_COLS + [state.filter_index.distance_col] if c in df.columns]
+    if sort_col is not None and sort_col not in sortable:
+        raise ValueError(f"sort : une de {sortable}")
+    offset = _int_param(params, "offset", 0, 0, len(df))
+    limit = _int_param(params, "limit", DEFAULT_LIMIT, 1, MAX_LIMIT)
+
+    rows = core.selected_rows(state, city, note_range, max_distance)
+    # Recherche et tri en cache avec les vues : une page suivante ne coûte que le take
+    table_rows = dataset.table_rows(state, key, rows, sort_col=sort_col, query=params.get("q", ""))
+    page = df[columns].take(table_rows[offset:offset + limit])
+    headers = {"X-Total-Count": str(len(table_rows))}
+    if arrow:
+        table = pa.Table.from_pandas(page, preserve_index=False)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return Response(sink.getvalue().to_pybytes(), media_type=ARROW_MEDIA_TYPE, headers=headers)
+    return Response(json_records(page), media_type="application/json", headers=headers)
+
+
+def endpoint(handler, wait=True):
+    """Point d'entrée Starlette : rafraîchissement, ETag, calcul hors de la boucle d'événements.
+
+    Avec wait=False, la route répond 503 tant que le premier chargement dure
+    au lieu de l'attendre (sonde de disponibilité).
+    """
+    async def handle(request):
+        # Premier chargement dans le thread de core : la boucle d'événements
+        # continue de servir les autres requêtes pendant la lecture du classeur
+        loading = core.load_in_background()
+        if not wait and not loading.done():
+            return JSONResponse({"statut": "chargement"}, status_code=503, headers={"Retry-After": "1"})
+        dataset = await asyncio.wrap_future(loading)
+        await run_in_threadpool(dataset.refresh)
+        # Un seul état pour la requête, même si une nouvelle version arrive entre-temps
+        state = dataset.state
+        params = dict(request.query_params)
+        try:
+            arrow = _wants_arrow(request)
+            tag = etag(request.url.path, state.version, params, arrow)
+            if _not_modified(request, tag):
+                response = Response(status_code=304)
+            else:
+                response = await run_in_threadpool(handler, dataset, state, params, arrow)
+        except ValueError as e:
+            return JSONResponse({"erreur": str(e)}, status_code=400)
+        response.headers["ETag"] = tag
+        # Toujours revalider : l'ETag suffit à éviter le transfert
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["Vary"] = "Accept"
+        return response
+    return handle
+
+
+app = Starlette(routes=[
+    Route("/health", endpoint(health, wait=False)),
+    Route("/villes", endpoint(cities)),
+    Route("/metrics", endpoint(metrics)),
+    Route("/data", endpoint(data)),
+])
+
+
+async def _get(path, query=""):
+    # Requête ASGI en mémoire : (statut, corps décodé)
+    scope = {"type": "http", "method": "GET", "path": path, "query_string": query.encode(),
+             "headers": [], "scheme": "http", "server": ("test", 80), "root_path": ""}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    body = b"".join(m.get("body", b"") for m in messages if m["type"] == "http.response.body")
+    return messages[0]["status"], json.loads(body) if body else None
+
+
+async def _check_loading(source):
+    """/health répond pendant qu'une session du dashboard construit le Dataset à froid."""
+    import threading
+    import time
+
+    # Cache vide à côté de `source` : conversion complète du classeur
+    session = threading.Thread(target=core.shared_dataset, args=(source,))
+    session.start()
+    await asyncio.sleep(0.02)
+    start = time.perf_counter()
+    status, _ = await _get("/health")
+    elapsed = time.perf_counter() - start
+    ok = status == 503 and elapsed < 0.1 and session.is_alive()
+    print(f"/health pendant le chargement : {status} en {elapsed * 1000:.0f} ms")
+    await run_in_threadpool(session.join)
+    ok &= (await _get("/health"))[0] == 200
+    return ok
+
+
+async def _check_values():
+    """Valeurs JSON de /data identiques à l'export CSV et au classeur."""
+    import io
+
+    import pandas as pd
+
+    from .export import export_bytes
+    from .ingestion import DEFAULT_SOURCE
+
+    state = core.shared_dataset().state
+    columns = [col for col in state.df.columns if pd.api.types.is_float_dtype(state.df[col])]
+    status, records = await _get("/data", f"columns={','.join(columns)}&limit={MAX_LIMIT}")
+    page = pd.DataFrame(records, columns=columns).astype(np.float64)
+    rows = core.selected_rows(state, core.ALL_CITIES, *core.default_ranges(state.filter_index))
+    exported = pd.read_csv(io.BytesIO(export_bytes(state.df[columns].take(rows))))
+    # float32 : valeurs exactes ; float64 : à 1e-10 près (10 décimales écrites)
+    tolerance = {col: 0 if state.df[col].dtype == np.float32 else 1e-10 for col in columns}
+    ok = status == 200 and len(page) == len(exported)
+    workbook = pd.read_excel(DEFAULT_SOURCE)
+    for col in columns:
+        ok &= bool(np.isclose(page[col], exported[col], rtol=0, atol=tolerance[col], equal_nan=True).all())
+        if col not in workbook.columns:
+            continue
+        source = np.sort(pd.to_numeric(workbook[col], errors="coerce").dropna().to_numpy(dtype=np.float64))
+        values = page[col].dropna().to_numpy()
+        at = np.searchsorted(source, values)
+        below, above = source[np.clip(at - 1, 0, len(source) - 1)], source[np.clip(at, 0, len(source) - 1)]
+        ok &= bool((np.isclose(values, below, rtol=0, atol=tolerance[col])
+                    | np.isclose(values, above, rtol=0, atol=tolerance[col])).all())
+    print(f"valeurs JSON ({', '.join(columns)}) : {'ok' if ok else 'ÉCHEC'}")
+    return ok
+
+
+async def _check_params():
+    """Paramètres non finis refusés (400) avec le nom du paramètre."""
+    ok = True
+    for name, value in [("note_min", "nan"), ("distance_max", "inf"), ("lat", "-inf")]:
+        status, body = await _get("/data", f"{name}={value}&lon=0")
+        ok &= status == 400 and body["erreur"].startswith(f"{name} :")
+        print(f"{name}={value} : {status} {body}")
+    return ok
+
+
+def check():
+    """Contrôle de l'API en mémoire sur une copie du classeur ; nombre d'échecs (code de sortie)."""
+    import shutil
+    import tempfile
+
+    from .ingestion import DEFAULT_SOURCE
+
+    async def run(source):
+        return [await _check_loading(source), await _check_values(), await _check_params()]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = shutil.copy(DEFAULT_SOURCE, tmp)
+        return sum(not ok for ok in asyncio.run(run(source)))
+
+
+def main():
+    import sys
+
+    if "--check" in sys.argv[1:]:
+        raise SystemExit(check())
+    import uvicorn
+    uvicorn.run(app, host="127.0.0.1", port=8000)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Binning côté serveur : le navigateur reçoit des cases, pas des lignes."""
+import numpy as np
+import pandas as pd
+
+
+def _bin_index(values, bins):
+    low, high = values.min(), values.max()
+    width = (high - low) / bins if high > low else 1.0
+    return np.minimum(np.floor((values - low) / width).astype(np.int64), bins - 1)
+
+
+def density_bins(x, y, bins=200, groups=None):
+    """Regroupe un nuage (x, y) dans une grille bins x bins.
+
+    Une ligne par case non vide (et par groupe si `groups` est donné, codes
+    entiers >= 0) : position moyenne des points de la case et leur nombre.
+    Les valeurs discrètes (notes au dixième, nombre d'avis) restent donc à
+    leur position exacte. Les points avec un NaN sont ignorés.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    valid = ~(np.isnan(x) | np.isnan(y))
+    if groups is not None:
+        groups = np.asarray(groups)
+        valid &= groups >= 0
+    x, y = x[valid], y[valid]
+    if len(x) == 0:
+        return pd.DataFrame({"x": [], "y": [], "Nombre": [], "groupe": []} if groups is not None
+                            else {"x": [], "y": [], "Nombre": []})
+
+    keys = _bin_index(x, bins) * bins + _bin_index(y, bins)
+    if groups is not None:
+        keys = groups[valid].astype(np.int64) * bins * bins + keys
+    unique_keys, cell = np.unique(keys, return_inverse=True)
+    n_cells = len(unique_keys)
+
+    counts = np.bincount(cell, minlength=n_cells)
+    cells = pd.DataFrame({
+        "x": np.bincount(cell, weights=x, minlength=n_cells) / counts,
+        "y": np.bincount(cell, weights=y, minlength=n_cells) / counts,
+        "Nombre": counts,
+    })
+    if groups is not None:
+        cells["groupe"] = unique_keys // (bins * bins)
+    return cells
+
+
+# ----------------------------
+# HISTOGRAMMES PRÉ-CALCULÉS
+# ----------------------------
+# Nombre de cases par colonne (mêmes valeurs que les graphiques d'origine)
+HISTOGRAM_BINS = {
+    "Note_Google": 20,
+    "Nb_Avis_Google": 30,
+    "Score_Presence_Digitale": 20,
+    "Anciennete_Estimee": 15,
+}
+
+
+def histogram(values, bins):
+    """(comptages, bornes) de np.histogram, NaN ignorés ; bornes None si aucune valeur."""
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return np.zeros(0, dtype=np.int64), None
+    return np.histogram(values, bins=bins)
+
+
+def bin_codes(values, edges):
+    """Case de chaque valeur selon `edges` (dernière case fermée, comme np.histogram), -1 si NaN."""
+    n_bins = len(edges) - 1
+    codes = np.searchsorted(edges, values, side="right") - 1
+    codes[values == edges[-1]] = n_bins - 1
+    codes[(codes < 0) | (codes >= n_bins)] = -1
+    return codes.astype(np.int16)
+
+
+class Histograms:
+    """Histogrammes à bornes fixes, calculées une fois sur tout le jeu de données.
+
+    Chaque ligne reçoit son numéro de case ; une sélection se compte par un
+    bincount sur ses positions. Comme les bornes ne dépendent pas de la
+    sélection, les comptages de sous-ensembles disjoints s'additionnent : des
+    partiels par (ville, strate) répondent sans parcourir les lignes aux
+    sélections qui ne filtrent que par ville.
+    """
+
+    def __init__(self, columns, bins=HISTOGRAM_BINS, city_codes=None, n_cities=0, strata=None, n_strata=1):
+        self.edges = {}
+        self._codes = {}
+        self._partials = {}
+        n_rows = len(next(iter(columns.values()))) if columns else 0
+        # Dernier groupe de ville : lignes sans ville
+        groups = np.full(n_rows, n_cities, dtype=np.int64) if city_codes is None else \
+            np.where(city_codes >= 0, city_codes, n_cities)
+        if strata is not None:
+            groups = groups * n_strata + strata
+        self._shape = (n_cities + 1, n_strata)
+
+        for col, values in columns.items():
+            values = np.asarray(values, dtype=np.float64)
+            _, edges = histogram(values, bins[col])
+            if edges is None:
+                continue
+            codes = bin_codes(values, edges)
+            valid = codes >= 0
+            n_bins = len(edges) - 1
+            partial = np.bincount(groups[valid] * n_bins + codes[valid], minlength=np.prod(self._shape) * n_bins)
+            self.edges[col] = edges
+            self._codes[col] = codes
+            self._partials[col] = partial.reshape(*self._shape, n_bins)
+
+    def counts(self, col, rows):
+        codes = self._codes[col][rows]
+        return np.bincount(codes[codes >= 0], minlength=len(self.edges[col]) - 1)
+
+    def partial_counts(self, col, city_code=None, strata=None):
+        """Somme des partiels : une ville (toutes si None), strates retenues (toutes si None)."""
+        partial = self._partials[col]
+        partial = partial.sum(axis=0) if city_code is None else partial[city_code]
+        return partial.sum(axis=0) if strata is None else partial[strata].sum(axis=0)
+
+    def get(self, rows=None, city_code=None, strata=None):
+        """{colonne: (comptages, bornes)} d'une sélection (rows) ou depuis les partiels."""
+        return {
+            col: (self.counts(col, rows) if rows is not None else self.partial_counts(col, city_code, strata), edges)
+            for col, edges in self.edges.items()
+        }
@@ -0,0 +1,74 @@
+"""Paramètres du dashboard, surchargeables par variables d'environnement."""
+import json
+import os
+
+
+def _load_sites(path):
+    """Sites de référence {nom: (lat, lon)} depuis un JSON optionnel."""
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return {name: (float(lat), float(lon)) for name, (lat, lon) in json.load(fh).items()}
+    except (OSError, ValueError, TypeError):
+        return {}
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+# Source des données : fichier (.xlsx, .csv, .parquet), dossier ou motif glob
+# (ex. "donnees/*.xlsx", un classeur par région)
+DATA_SOURCE = os.environ.get("OPTIQUES_SOURCE", "OPTIQUESS.xlsx")
+# Processus de lecture en parallèle des fichiers sources (0 = un par cœur)
+INGEST_WORKERS = _env_int("OPTIQUES_INGEST_WORKERS", 0)
+
+# Dédoublonnage à l'import : deux fiches d'une même ville à moins de ce rayon
+# (mètres), de noms proches ou partageant un contact, sont fusionnées (0 = désactivé)
+DEDUP_RADIUS_M = _env_int("OPTIQUES_DEDUP_RADIUS_M", 150)
+
+# Moteur des agrégats : "pandas" (en mémoire) ou "duckdb" (SQL sur le snapshot
+# Parquet, paquet duckdb optionnel)
+QUERY_BACKEND = os.environ.get("OPTIQUES_BACKEND", "pandas").lower()
+
+# Vues filtrées partagées entre sessions (Mo) : une copie par sélection distincte
+VIEW_CACHE_MB = _env_int("OPTIQUES_VIEW_CACHE_MB", 256)
+
+# Préchauffage des caches en arrière-plan : « Toutes » + les N villes les plus
+# représentées (0 : « Toutes » seulement, -1 : désactivé)
+WARMUP_CITIES = _env_int("OPTIQUES_WARMUP_CITIES", 5)
+
+# Score composite des prospects : nombre d'avis « fictifs » à la note moyenne
+# ajoutés à chaque optique (note bayésienne), et distance (km) à laquelle la
+# proximité vaut 1/e
+SCORE_PRIOR_REVIEWS = _env_int("OPTIQUES_SCORE_PRIOR_REVIEWS", 10)
+SCORE_DISTANCE_KM = _env_int("OPTIQUES_SCORE_DISTANCE_KM", 25)
+
+# Au-delà de ce nombre de points, la carte passe en mode agrégé (grille)
+MAP_POINT_LIMIT = _env_int("OPTIQUES_MAP_POINT_LIMIT", 5000)
+# Nombre de cellules sur le plus grand côté de l'emprise affichée
+MAP_GRID_CELLS = _env_int("OPTIQUES_MAP_GRID_CELLS", 80)
+
+# Couverture du marché (onglet Géographie) : une optique est isolée si son
+# concurrent le plus proche est à plus de ISOLATION_KM ; son rayon de couverture
+# est la distance de ses COVERAGE_NEIGHBORS plus proches concurrents
+ISOLATION_KM = _env_int("OPTIQUES_ISOLATION_KM", 5)
+COVERAGE_NEIGHBORS = _env_int("OPTIQUES_COVERAGE_NEIGHBORS", 5)
+# Au-delà de ce nombre d'hexagones, la carte de densité passe à la taille supérieure
+MAP_HEX_LIMIT = _env_int("OPTIQUES_MAP_HEX_LIMIT", 3000)
+
+# Au-delà de ce nombre de lignes, les nuages de points passent en WebGL,
+# regroupés par densité sur une grille SCATTER_BINS x SCATTER_BINS
+SCATTER_POINT_LIMIT = _env_int("OPTIQUES_SCATTER_POINT_LIMIT", 5000)
+SCATTER_BINS = _env_int("OPTIQUES_SCATTER_BINS", 150)
+
+# Autres sites de l'entreprise, pour mesurer les distances depuis un autre point que TARMIZ
+# (fichier JSON {"Nom du site": [latitude, longitude], ...})
+REFERENCE_SITES = _load_sites(os.environ.get("OPTIQUES_SITES_FILE", "sites.json"))
+
+# Profilage : fichier JSON lines des temps par étape (désactivé si vide),
+# panneau de debug visible avec ?debug=1 ou OPTIQUES_DEBUG=1
+PROFILE_LOG = os.environ.get("OPTIQUES_PROFILE_LOG") or None
+DEBUG_PANEL = os.environ.get("OPTIQUES_DEBUG") == "1"
@@ -0,0 +1,195 @@
+"""Calculs du dashboard indépendants de l'interface.
+
+Le script Streamlit et l'API HTTP (optiques.api) passent par ces fonctions :
+même jeu de données partagé, mêmes filtres, mêmes agrégats en cache, donc
+les mêmes chiffres.
+"""
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .aggregates import share
+from .config import REFERENCE_SITES
+from .dataset import Dataset
+from .filters import NOTE_COL
+from .ingestion import DEFAULT_SOURCE
+
+ALL_CITIES = "Toutes"
+DEFAULT_REFERENCE = "TARMIZ"
+NEAREST_SITE = "Site le plus proche"
+CUSTOM_POINT = "Point personnalisé"
+
+# Aucun verrou n'est tenu pendant la construction du Dataset : le thread de
+# chargement publie le résultat sous _dataset_lock, _loading_lock ne protège
+# que la future. Un appelant n'attend donc jamais qu'un chargement en cours.
+_dataset = None
+_dataset_lock = threading.Lock()
+_loading = None
+_loading_lock = threading.Lock()
+_load_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="optiques-load")
+
+
+def _load(source):
+    global _dataset
+    dataset = Dataset(source)
+    with _dataset_lock:
+        if _dataset is None:
+            _dataset = dataset
+        return _dataset
+
+
+def shared_dataset(source=DEFAULT_SOURCE):
+    """Dataset unique du processus, partagé par le dashboard et l'API.
+
+    Attend le chargement en cours (un seul, dans le thread de core) s'il y en a un.
+    """
+    with _dataset_lock:
+        if _dataset is not None:
+            return _dataset
+    return load_in_background(source).result()
+
+
+def load_in_background(source=DEFAULT_SOURCE):
+    """Future du Dataset partagé, chargé dans un thread : l'appelant n'attend pas.
+
+    Un chargement en échec est relancé au prochain appel.
+    """
+    global _loading
+    with _loading_lock:
+        if _loading is None or (_loading.done() and _loading.exception() is not None):
+            _loading = _load_executor.submit(_load, source)
+        return _loading
+
+
+def filter_key(city, note_range, max_distance, reference=DEFAULT_REFERENCE, reference_point=None):
+    """Clé d'un état de filtre (vues et figures partagées)."""
+    return (city, note_range, max_distance, reference, reference_point)
+
+
+def default_ranges(filter_index):
+    """(plage de notes, distance max) des curseurs à leur position initiale."""
+    note_range = filter_index.bounds(NOTE_COL) if filter_index.has(NOTE_COL) else None
+    distance_col = filter_index.distance_col
+    max_distance = filter_index.bounds(distance_col)[1] if filter_index.has(distance_col) else None
+    return note_range, max_distance
+
+
+def reference_options(sites=REFERENCE_SITES):
+    options = [DEFAULT_REFERENCE] + list(sites)
+    if len(sites) > 1:
+        options.append(NEAREST_SITE)
+    return options + [CUSTOM_POINT]
+
+
+def reference_point(reference, point=None, sites=REFERENCE_SITES):
+    """Point (lat, lon) de la référence, None pour TARMIZ et le site le plus proche."""
+    if reference == CUSTOM_POINT:
+        return tuple(point)
+    if reference in (DEFAULT_REFERENCE, NEAREST_SITE):
+        return None
+    return sites[reference]
+
+
+def reference_state(dataset, state, reference=DEFAULT_REFERENCE, point=None, sites=REFERENCE_SITES):
+    """État dont la colonne de distance est mesurée depuis `reference`.
+
+    TARMIZ : colonne du classeur ; un nom de site ; NEAREST_SITE (site le plus
+    proche de chaque magasin) ; CUSTOM_POINT avec point=(lat, lon).
+    """
+    if reference == DEFAULT_REFERENCE:
+        return state
+    if reference == CUSTOM_POINT:
+        if point is None:
+            raise ValueError("Point personnalisé : latitude et longitude requises")
+        return dataset.with_reference("Point", *point, state=state)
+    if reference == NEAREST_SITE:
+        if len(sites) < 2:
+            raise ValueError("Moins de deux sites de référence configurés")
+        site_lats, site_lons = zip(*sites.values())
+        return dataset.with_reference("Sites", site_lats, site_lons, state=state)
+    if reference not in sites:
+        raise ValueError(f"Référence inconnue : {reference}")
+    return dataset.with_reference(reference, *sites[reference], state=state)
+
+
+def city_filter(city):
+    """Ville du filtre, None pour « Toutes »."""
+    return None if city == ALL_CITIES else city
+
+
+def selected_rows(state, city=None, note_range=None, max_distance=None):
+    """Positions des lignes de la sélection (index pré-calculé, sans copie)."""
+    return state.filter_index.select(city=city_filter(city), note_range=note_range, max_distance=max_distance)
+
+
+def aggregates(state, city=None, note_range=None, max_distance=None, rows=None):
+    """Agrégats de la sélection, en cache par état de filtre."""
+    return state.aggregates.get(city_filter(city), note_range, max_distance, rows=rows)
+
+
+def select(state, city=None, note_range=None, max_distance=None):
+    """(positions, agrégats) de la sélection."""
+    rows = selected_rows(state, city, note_range, max_distance)
+    return rows, aggregates(state, city, note_range, max_distance, rows=rows)
+
+
+def _number(value):
+    # NaN (sélection vide, colonne vide) -> None pour le JSON
+    if value is None:
+        return None
+    value = float(value)
+    return None if math.isnan(value) else value
+
+
+def _count(agg, name):
+    count = agg[name]
+    return {"nombre": count, "pourcentage": share(count, agg["n_rows"])}
+
+
+def summary(agg, top_n=10):
+    """Chiffres affichés par le dashboard pour une sélection, en types JSON.
+
+    Un indicateur est absent si la colonne dont il dépend manque au classeur.
+    """
+    n_rows = agg["n_rows"]
+    city_counts = agg["city_counts"]
+    result = {"total_optiques": n_rows, "villes_couvertes": agg["n_cities"]}
+
+    # Cartes de métriques
+    for name, key in [("note_moyenne", "note_mean"), ("distance_moyenne", "distance_mean"),
+                      ("score_digital", "digital_mean")]:
+        if key in agg:
+            result[name] = _number(agg[key])
+    if "Site web" in agg["channels"]:
+        result["presence_web"] = share(agg["channels"]["Site web"], n_rows)
+
+    # Géographie
+    result["top_villes"] = [
+        {"ville": city, "nombre": int(count)} for city, count in city_counts.head(top_n).items()
+    ]
+    result["concentration"] = share(int(city_counts.iloc[0]), n_rows) if len(city_counts) else 0.0
+    result["leader"] = {"ville": city_counts.index[0], "nombre": int(city_counts.iloc[0])} \
+        if len(city_counts) else None
+
+    # Performance, présence digitale
+    result["performance"] = {
+        name: _count(agg, key)
+        for name, key in [("notes_ge_4", "note_ge_4"), ("notes_ge_4_5", "note_ge_4_5"),
+                          ("avis_ge_50", "avis_ge_50"), ("top_performers", "top_performers")]
+        if key in agg
+    }
+    result["canaux_digitaux"] = {channel: {"nombre": count, "pourcentage": share(count, n_rows)}
+                                 for channel, count in agg["channels"].items()}
+    if "complete_digital" in agg:
+        result["presence_complete"] = _count(agg, "complete_digital")
+
+    # Benchmarking (quantiles)
+    result["benchmarking"] = {
+        name: _number(agg[key])
+        for name, key in [("top25_note", "note_q75"), ("mediane_avis", "avis_median"),
+                          ("top10_digital", "digital_q90")]
+        if key in agg
+    }
+    if "distance_le_10" in agg:
+        result["benchmarking"]["proches_reference_10km"] = agg["distance_le_10"]
+    return result
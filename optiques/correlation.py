@@ -0,0 +1,199 @@
+"""Matrices de corrélation par état de filtre, à partir de statistiques suffisantes.
+
+Pour chaque partition (ville x strate « note renseignée / distance
+renseignée ») sont gardés, sur k colonnes : effectifs, sommes, sommes des
+carrés et produits croisés, par paire de colonnes renseignées (corrélation
+par paire, comme DataFrame.corr) et sur les lignes complètes. Une sélection
+par ville, curseurs aux extrémités, se calcule en sommant les partitions
+(O(villes x k²)) ; une plage intermédiaire relit seulement ses lignes.
+Les statistiques s'additionnent : une nouvelle version du jeu de données
+retire l'apport des lignes modifiées et ajoute celui des lignes touchées.
+
+Spearman (corrélation des rangs) ne se décompose pas : il est calculé sur
+la sélection et mis en cache comme le reste.
+"""
+import numpy as np
+import pandas as pd
+
+from .cache import LRUCache
+from .filters import NOTE_COL
+
+# Coordonnées : numériques mais sans sens comme variables à corréler
+EXCLUDED_COLS = ["Latitude", "Longitude"]
+# Libellé affiché -> méthode
+CORRELATION_METHODS = {"Pearson": "pearson", "Spearman (rangs)": "spearman"}
+
+
+def correlation_columns(df):
+    return [col for col in df.select_dtypes(include=[np.number]).columns if col not in EXCLUDED_COLS]
+
+
+def sufficient_stats(values):
+    """Statistiques additives d'un bloc de lignes (n, k), NaN = valeur manquante.
+
+    Par paire (i, j), sur les lignes où i et j sont renseignés : effectif
+    n[i, j], somme s[i, j] et somme des carrés ss[i, j] de i, produit croisé
+    sp[i, j]. Sur les lignes complètes : effectif, sommes et produits croisés.
+    """
+    present = ~np.isnan(values)
+    x = np.where(present, values, 0.0)
+    m = present.astype(np.float64)
+    complete = present.all(axis=1)
+    xc = x[complete]
+    return {
+        "n": m.T @ m,
+        "s": x.T @ m,
+        "ss": (x * x).T @ m,
+        "sp": x.T @ x,
+        "n_complete": np.float64(len(xc)),
+        "s_complete": xc.sum(axis=0),
+        "sp_complete": xc.T @ xc,
+    }
+
+
+def _pearson(n, s_i, s_j, ss_i, ss_j, sp):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = sp - s_i * s_j / n
+        var_i = ss_i - s_i * s_i / n
+        var_j = ss_j - s_j * s_j / n
+        r = cov / np.sqrt(var_i * var_j)
+    # Moins de deux valeurs ou variance nulle (aux arrondis près) : NaN, comme pandas
+    r[(n < 2) | (var_i <= 1e-12 * ss_i) | (var_j <= 1e-12 * ss_j)] = np.nan
+    return np.clip(r, -1.0, 1.0)
+
+
+def pearson_matrix(stats, complete=False):
+    """Matrice de Pearson par paire (pandas) ou sur les lignes complètes."""
+    if complete:
+        n, s, sp = stats["n_complete"], stats["s_complete"], stats["sp_complete"]
+        diag = np.diag(sp)
+        return _pearson(np.full(sp.shape, n), s[:, None], s[None, :], diag[:, None], diag[None, :], sp)
+    n, s, ss = stats["n"], stats["s"], stats["ss"]
+    return _pearson(n, s, s.T, ss, ss.T, stats["sp"])
+
+
+class CorrelationService:
+    """Corrélations des colonnes numériques par (sélection, méthode), en cache LRU."""
+
+    def __init__(self, df, filter_index, max_entries=128):
+        self.filter_index = filter_index
+        self.columns = correlation_columns(df)
+        self.cache = LRUCache(max_entries=max_entries, max_bytes=16 * 1024 * 1024)
+        self._values = df[self.columns].to_numpy(dtype=np.float64, na_value=np.nan)
+        # Mêmes strates que les histogrammes : seules les plages qui gardent
+        # toutes les valeurs renseignées se déduisent des partitions
+        self._strata_cols = [col for col in (NOTE_COL, filter_index.distance_col) if filter_index.has(col)]
+        self._n_strata = 2 ** len(self._strata_cols)
+        self._strata = self._row_strata(df)
+        self._partials = self._partition_stats(np.arange(len(df)), len(filter_index.city_names))
+
+    def _row_strata(self, df):
+        strata = np.zeros(len(df), dtype=np.int64)
+        for bit, col in enumerate(self._strata_cols):
+            strata |= df[col].notna().to_numpy().astype(np.int64) << bit
+        return strata
+
+    def _groups(self, rows):
+        # Partition d'une ligne : (ville + 1, 0 = sans ville) x strate
+        codes = self.filter_index.city_codes(rows)
+        city = np.zeros(len(rows), dtype=np.int64) if codes is None else codes.astype(np.int64) + 1
+        return city * self._n_strata + self._strata[rows]
+
+    def _partition_stats(self, rows, n_cities):
+        k = len(self.columns)
+        n_groups = (n_cities + 1) * self._n_strata
+        partials = {
+            "n": np.zeros((n_groups, k, k)), "s": np.zeros((n_groups, k, k)),
+            "ss": np.zeros((n_groups, k, k)), "sp": np.zeros((n_groups, k, k)),
+            "n_complete": np.zeros(n_groups), "s_complete": np.zeros((n_groups, k)),
+            "sp_complete": np.zeros((n_groups, k, k)),
+        }
+        groups = self._groups(rows)
+        order = np.argsort(groups, kind="stable")
+        bounds = np.searchsorted(groups[order], np.arange(n_groups + 1))
+        for group in np.flatnonzero(np.diff(bounds)):
+            stats = sufficient_stats(self._values[rows[order[bounds[group]:bounds[group + 1]]]])
+            for name, value in stats.items():
+                partials[name][group] = value
+        return partials
+
+    def _covered_groups(self, city, note_range, max_distance):
+        """Partitions qui composent la sélection, None si une plage coupe des valeurs."""
+        limits = {NOTE_COL: note_range,
+                  self.filter_index.distance_col: None if max_distance is None else (None, max_distance)}
+        strata = np.arange(self._n_strata)
+        for bit, col in enumerate(self._strata_cols):
+            if limits.get(col) is None:
+                continue
+            if not self.filter_index.covers(col, *limits[col]):
+                return None
+            strata = strata[(strata >> bit) & 1 == 1]
+        n_cities = len(self.filter_index.city_names)
+        if city is None:
+            cities = np.arange(n_cities + 1)
+        else:
+            code = self.filter_index.city_code(city)
+            if code < 0:
+                return None
+            cities = np.array([code + 1])
+        return (cities[:, None] * self._n_strata + strata[None, :]).ravel()
+
+    def stats(self, city=None, note_range=None, max_distance=None, rows=None):
+        """Statistiques suffisantes de la sélection (partitions sommées si possible)."""
+        groups = self._covered_groups(city, note_range, max_distance)
+        if groups is not None:
+            return {name: partial[groups].sum(axis=0) for name, partial in self._partials.items()}
+        if rows is None:
+            rows = self.filter_index.select(city, note_range, max_distance)
+        return sufficient_stats(self._values[rows])
+
+    def get(self, city=None, note_range=None, max_distance=None, method="pearson", complete=False, rows=None):
+        """DataFrame de corrélation ; `complete` : lignes sans valeur manquante uniquement."""
+        key = (city, None if note_range is None else tuple(note_range), max_distance, method, complete)
+
+        def compute():
+            if method == "spearman":
+                if rows is None:
+                    selected = self.filter_index.select(city, note_range, max_distance)
+                else:
+                    selected = rows
+                frame = pd.DataFrame(self._values[selected], columns=self.columns)
+                if complete:
+                    frame = frame.dropna()
+                return frame.corr(method="spearman")
+            matrix = pearson_matrix(self.stats(city, note_range, max_distance, rows), complete)
+            return pd.DataFrame(matrix, index=self.columns, columns=self.columns)
+
+        return self.cache.get_or_compute(key, compute)
+
+    def updated(self, df, filter_index, changed):
+        """Service de la version suivante (lignes `changed` modifiées, ajouts en fin).
+
+        Les partitions sont mises à jour par différence : l'apport des lignes
+        modifiées (anciennes valeurs, anciennes partitions) est retiré, celui
+        des lignes modifiées et ajoutées (nouvelles valeurs) est ajouté.
+        """
+        if correlation_columns(df) != self.columns:
+            return CorrelationService(df, filter_index, self.cache.max_entries)
+        changed = np.asarray(changed, dtype=np.intp)
+        touched = np.concatenate([changed, np.arange(len(self._values), len(df), dtype=np.intp)])
+
+        new = CorrelationService.__new__(CorrelationService)
+        new.filter_index = filter_index
+        new.columns = self.columns
+        new.cache = LRUCache(max_entries=self.cache.max_entries, max_bytes=self.cache.max_bytes)
+        new._strata_cols = self._strata_cols
+        new._n_strata = self._n_strata
+        new._values = df[self.columns].to_numpy(dtype=np.float64, na_value=np.nan)
+        new._strata = new._row_strata(df)
+
+        # Nouvelles villes : partitions ajoutées en fin (codes de ville conservés)
+        n_groups = (len(filter_index.city_names) + 1) * self._n_strata
+        removed = self._partition_stats(changed, len(filter_index.city_names))
+        added = new._partition_stats(touched, len(filter_index.city_names))
+        new._partials = {}
+        for name, partial in self._partials.items():
+            grown = np.zeros((n_groups,) + partial.shape[1:])
+            grown[:len(partial)] = partial
+            new._partials[name] = grown - removed[name] + added[name]
+        return new
@@ -0,0 +1,230 @@
+"""Jeu de données courant et structures dérivées, rafraîchis de façon incrémentale.
+
+Un seul `Dataset` par processus (st.cache_resource) : toutes les sessions lisent
+les mêmes DataFrame, index et agrégats, jamais modifiés en place. Une nouvelle
+version remplace l'état d'un bloc ; une session ne garde que sa sélection.
+"""
+import threading
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from .aggregates import AggregateService
+from .cache import LRUCache
+from .config import QUERY_BACKEND, VIEW_CACHE_MB
+from .correlation import CorrelationService
+from .distance import DistanceIndex
+from .filters import FilterIndex, filter_frame
+from .ingestion import (
+    DEFAULT_SOURCE, ensure_snapshot, read_duplicates, read_snapshot, read_snapshot_keys, refresh_snapshot,
+    source_fingerprint
+)
+from .schema import align_categories
+from .scoring import ScoringEngine
+from .spatial import CoverageIndex
+from .table import SORT_COLS, SearchIndex, SortIndex, sorted_rows
+
+# Version cohérente (DataFrame + index + agrégats), remplacée d'un bloc ;
+# partagée entre sessions, donc en lecture seule. `reference` identifie les points
+# d'où est mesurée la colonne de distance (None : colonne du classeur)
+DatasetState = namedtuple("DatasetState", ["version", "df", "filter_index", "aggregates", "reference"],
+                          defaults=[None])
+
+
+def aggregate_service(manifest, df, filter_index, reference=None, backend=QUERY_BACKEND):
+    """Service d'agrégats du moteur configuré ; `reference` = (lats, lons) des
+    points d'où est mesurée la colonne de distance de filter_index."""
+    if backend == "duckdb":
+        from .duckdb_backend import DuckDBAggregateService
+        return DuckDBAggregateService(manifest["snapshot"], filter_index, reference)
+    if backend != "pandas":
+        raise ValueError(f"Moteur inconnu : {backend} (pandas ou duckdb)")
+    return AggregateService(df, filter_index)
+
+
+def correlation_service(state):
+    """Corrélations du moteur de l'état : SQL avec le service DuckDB, sinon statistiques en mémoire."""
+    if not isinstance(state.aggregates, AggregateService):
+        from .duckdb_backend import DuckDBCorrelationService
+        return DuckDBCorrelationService(state.aggregates)
+    return CorrelationService(state.df, state.filter_index)
+
+
+def merge_rows(df, new_df, delta):
+    """Applique un RowDelta sans suppression : lignes modifiées remplacées
+    à leur position, lignes ajoutées en fin."""
+    df, new_df = align_categories(df, new_df)
+    merged = pd.concat([df, new_df.iloc[delta.appended]], ignore_index=True)
+    if len(delta.changed_old):
+        changed_rows = new_df.iloc[delta.changed_new]
+        merged.iloc[delta.changed_old] = changed_rows.set_axis(merged.index[delta.changed_old])
+    return merged
+
+
+class Dataset:
+    def __init__(self, source=DEFAULT_SOURCE, cache_dir=None):
+        self.source = source
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        # États dérivés (autre point de référence) de la version courante
+        self._derived = LRUCache(max_entries=16, max_bytes=float("inf"), sizeof=lambda state: 0)
+        # Lignes filtrées par sélection, partagées par les sessions qui ont la même
+        self._views = LRUCache(max_entries=64, max_bytes=VIEW_CACHE_MB * 1024 * 1024)
+        manifest = ensure_snapshot(source, cache_dir)
+        self._install(manifest, read_snapshot(manifest), *read_snapshot_keys(manifest))
+
+    def _install(self, manifest, df, keys, hashes, filter_index=None, aggregates=None):
+        filter_index = filter_index or FilterIndex(df)
+        aggregates = aggregates or aggregate_service(manifest, df, filter_index)
+        # Clés des lignes de la version en mémoire, dans l'ordre de df
+        self._keys, self._hashes = keys, hashes
+        self.manifest = manifest
+        self.state = DatasetState(manifest["sha256"][:16], df, filter_index, aggregates)
+        self._derived.clear()
+        self._views.clear()
+
+    def refresh(self):
+        """Intègre les changements du classeur ; True si une nouvelle version est installée.
+
+        Ajouts et modifications (repérés par clé stable) sont appliqués aux
+        index et agrégats existants. Une suppression de lignes, un changement
+        de colonnes ou un snapshot dont l'ordre diffère du nôtre décale les
+        positions : la version est alors reconstruite depuis le snapshot.
+        """
+        if source_fingerprint(self.source) == self.manifest["fingerprint"]:
+            return False
+        with self._lock:
+            refresh = refresh_snapshot(self.manifest, self._keys, self._hashes, self.source, self.cache_dir)
+            if refresh.df is None:
+                self.manifest = refresh.manifest
+                return False
+
+            state, delta = self.state, refresh.delta
+            keys = np.concatenate([self._keys, refresh.keys[delta.appended]])
+            # Snapshot fusionné depuis une autre version (autre worker) : l'ordre
+            # des lignes diffère du nôtre, on installe celui du snapshot
+            if (len(delta.removed) or list(refresh.df.columns) != list(state.df.columns)
+                    or not np.array_equal(keys, refresh.keys)):
+                self._install(refresh.manifest, refresh.df, refresh.keys, refresh.hashes)
+                return True
+
+            df = merge_rows(state.df, refresh.df, delta)
+            hashes = np.concatenate([self._hashes, refresh.hashes[delta.appended]])
+            hashes[delta.changed_old] = refresh.hashes[delta.changed_new]
+            filter_index = state.filter_index.updated(df, delta.changed_old)
+            # Statistiques de corrélation déjà construites : mises à jour par différence
+            correlations = self._derived.get((state.version, "correlations", None))
+            # Le moteur SQL relit le nouveau snapshot : pas de report de cache
+            aggregates = None
+            if isinstance(state.aggregates, AggregateService):
+                aggregates = state.aggregates.updated(df, filter_index, state.filter_index, delta.changed_old)
+            self._install(refresh.manifest, df, keys, hashes, filter_index, aggregates)
+            if isinstance(correlations, CorrelationService):
+                self._derived.put((self.state.version, "correlations", None),
+                                  correlations.updated(df, filter_index, delta.changed_old))
+            return True
+
+    def view(self, state, key, rows):
+        """DataFrame des lignes `rows` de state.df, construit une fois par sélection.
+
+        `key` identifie la sélection (filtres et référence des distances) ; les
+        sessions qui partagent une sélection partagent la même vue.
+        """
+        if len(rows) == len(state.df):
+            return state.df
+        return self._views.get_or_compute((state.version, key), lambda: filter_frame(state.df, rows))
+
+    def distance_index(self, state=None):
+        """KD-tree des magasins de la version donnée (courante par défaut)."""
+        state = state or self.state
+        return self._derived.get_or_compute((state.version, "distance_index"), lambda: DistanceIndex(state.df))
+
+    def coverage(self, state=None):
+        """Concurrence et couverture de chaque optique (indépendantes de la référence)."""
+        state = state or self.state
+        return self._derived.get_or_compute(
+            (state.version, "coverage"), lambda: CoverageIndex(self.distance_index(state))
+        )
+
+    def with_reference(self, name, ref_lat, ref_lon, state=None):
+        """État dont la colonne de distance est calculée depuis d'autres points.
+
+        La colonne `Distance-<name>(KM)` (distance au point le plus proche parmi
+        ref_lat / ref_lon) est ajoutée au DataFrame ; filtres et agrégats
+        portent alors sur elle. Mis en cache par version et par référence.
+        """
+        state = state or self.state
+        ref_lat = tuple(np.atleast_1d(ref_lat).tolist())
+        ref_lon = tuple(np.atleast_1d(ref_lon).tolist())
+
+        def build():
+            distance_col = f"Distance-{name}(KM)"
+            distances = self.distance_index(state).distances_from(ref_lat, ref_lon)
+            df = state.df.assign(**{distance_col: np.round(distances, 2).astype(np.float32)})
+            filter_index = state.filter_index.with_distance(df, distance_col)
+            aggregates = aggregate_service(self.manifest, df, filter_index, (ref_lat, ref_lon))
+            return DatasetState(state.version, df, filter_index, aggregates, (name, ref_lat, ref_lon))
+
+        return self._derived.get_or_compute((state.version, name, ref_lat, ref_lon), build)
+
+    def correlations(self, state=None):
+        """Statistiques de corrélation par ville de la version (et référence) donnée."""
+        state = state or self.state
+        return self._derived.get_or_compute(
+            (state.version, "correlations", state.reference), lambda: correlation_service(state)
+        )
+
+    def scoring(self, state=None):
+        """Scores composites de la version (la proximité dépend de la référence)."""
+        state = state or self.state
+        return self._derived.get_or_compute(
+            (state.version, "scoring", state.reference), lambda: ScoringEngine(state.df, state.filter_index)
+        )
+
+    def duplicates(self, state=None):
+        """Fiches fusionnées au dédoublonnage de l'import (rapport écrit avec le snapshot)."""
+        state = state or self.state
+        return self._derived.get_or_compute((state.version, "duplicates"), lambda: read_duplicates(self.manifest))
+
+    def cache_stats(self, state=None):
+        """Statistiques des caches (vues, agrégats, corrélations et scores si construits) de l'état donné."""
+        state = state or self.state
+        stats = {"Vues": self._views.stats(), "Agrégats": state.aggregates.cache.stats()}
+        names = {"correlations": "Corrélations", "scoring": "Scores"}
+        for (version, kind, *reference), service in self._derived.items():
+            if version == state.version and kind in names and reference == [state.reference]:
+                stats[names[kind]] = service.cache.stats()
+        return stats
+
+    def sort_index(self, state=None):
+        """Ordres de tri des colonnes triables, construits à la première demande."""
+        state = state or self.state
+        columns = SORT_COLS + [state.filter_index.distance_col]
+        return self._derived.get_or_compute(
+            (state.version, "sort_index", state.reference), lambda: SortIndex(state.df, columns)
+        )
+
+    def search_index(self, state=None):
+        """Index de recherche sur Nom / Ville (indépendant de la référence)."""
+        state = state or self.state
+        return self._derived.get_or_compute((state.version, "search_index"), lambda: SearchIndex(state.df))
+
+    def table_rows(self, state, key, rows, sort_col=None, query=""):
+        """Positions de la sélection `rows`, restreintes à la recherche et triées.
+
+        Mises en cache avec les vues : changer de page ne refait ni la
+        recherche ni le tri.
+        """
+        def compute():
+            selected = rows
+            if query.strip():
+                matched = self.search_index(state).search(query)
+                if matched is not None:
+                    selected = np.intersect1d(selected, matched, assume_unique=True)
+            sort_index = self.sort_index(state)
+            if sort_col is None or not sort_index.has(sort_col):
+                return selected
+            return sorted_rows(sort_index.order(sort_col), selected, len(state.df))
+
+        return self._views.get_or_compute((state.version, "table", key, sort_col, query.strip()), compute)
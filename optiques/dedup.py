@@ -0,0 +1,242 @@
+"""Dédoublonnage des fiches à l'import (même magasin listé plusieurs fois).
+
+Les fiches scrapées d'un même magasin diffèrent souvent par un suffixe
+(« : Opticien, Optométriste », nom en arabe) ou par le géocodage. Pas de
+comparaison de toutes les paires : les candidates sont les voisines dans
+l'ordre des noms au sein de blocs (ville x case geohash, la même grille
+décalée d'une demi-case pour les bords, ville x téléphone, ville x email),
+soit au plus DEDUP_WINDOW paires par fiche et par blocage.
+
+Deux fiches sont le même magasin si elles sont à moins de DEDUP_RADIUS_M
+(ou toutes deux sans coordonnées) et :
+- ont les mêmes mots significatifs, ou au moins deux mots communs couvrant
+  80 % des mots du nom le plus court (mots en minuscules, sans accents,
+  hors « optique », « opticien »...) ;
+- ou partagent un téléphone ou un email.
+Les groupes sont fermés par transitivité. La fiche la plus complète est
+gardée ; ses champs vides sont complétés par ceux de ses doublons.
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from .config import DEDUP_RADIUS_M
+from .distance import haversine_pairs_km
+from .filters import CITY_COL
+from .table import _sorted_unique, split_words
+
+NAME_COL = "Nom"
+PHONE_COL = "Téléphone"
+EMAIL_COL = "Email"
+DEDUP_WINDOW = 8
+GEOHASH_PRECISION = 6  # cases d'environ 1,2 x 0,6 km
+MAX_NAME_TOKENS = 8
+# Mots du métier, formes juridiques et liaisons : ils ne distinguent pas deux magasins
+STOPWORDS = {
+    "optique", "optiques", "optic", "optics", "opticien", "opticiens", "opticienne", "optometriste",
+    "optometrie", "contactologue", "contactologie", "lunetterie", "lunettes", "centre", "magasin",
+    "sarl", "ste", "societe", "et", "de", "du", "des", "la", "le", "les", "l", "d", "au", "aux",
+    "بصريات", "نظارات",
+}
+
+# Fiches retirées et fiche conservée, pour contrôle (écrit à côté du snapshot)
+REPORT_COLUMNS = ["Nom", "Ville", "Nom conservé", "Position conservée"]
+
+
+def geohash_cells(lat, lon, precision=GEOHASH_PRECISION):
+    """Case geohash (entier : bits longitude / latitude entrelacés) de chaque point ; -1 sans coordonnées."""
+    bits = 5 * precision
+    lon_bits, lat_bits = (bits + 1) // 2, bits // 2
+    valid = ~(np.isnan(lat) | np.isnan(lon))
+    x = np.floor((np.nan_to_num(lon) + 180.0) / 360.0 * (1 << lon_bits)).astype(np.int64)
+    y = np.floor((np.nan_to_num(lat) + 90.0) / 180.0 * (1 << lat_bits)).astype(np.int64)
+    x = np.clip(x, 0, (1 << lon_bits) - 1)
+    y = np.clip(y, 0, (1 << lat_bits) - 1)
+    cells = np.zeros(len(lat), dtype=np.int64)
+    # Bits de poids fort d'abord, longitude en premier comme le geohash
+    for i in range(bits):
+        if i % 2 == 0:
+            bit = (x >> (lon_bits - 1 - i // 2)) & 1
+        else:
+            bit = (y >> (lat_bits - 1 - i // 2)) & 1
+        cells = (cells << 1) | bit
+    return np.where(valid, cells, -1)
+
+
+def geohash_cell_size(precision=GEOHASH_PRECISION):
+    """(hauteur en degrés de latitude, largeur en degrés de longitude) d'une case."""
+    bits = 5 * precision
+    return 180.0 / (1 << (bits // 2)), 360.0 / (1 << ((bits + 1) // 2))
+
+
+def name_tokens(names):
+    """(codes, jetons) : codes[i] indexe la ligne de jetons du nom i, matrice
+    (noms distincts, MAX_NAME_TOKENS) de mots significatifs triés, -1 en fin."""
+    codes, uniques = pd.factorize(pd.Series(names, dtype=object).fillna(""))
+    parents, ids, vocabulary = split_words(np.asarray(uniques, dtype=object))
+    # Rang alphabétique de chaque mot : les noms proches deviennent voisins au tri
+    words = pa.array(vocabulary, type=pa.string())
+    ranks = np.empty(len(vocabulary), dtype=np.int64)
+    ranks[pc.array_sort_indices(words).to_numpy()] = np.arange(len(vocabulary))
+    keep = ~pc.is_in(words, value_set=pa.array(sorted(STOPWORDS))).to_numpy(zero_copy_only=False)[ids]
+    parents, tokens = parents[keep], ranks[ids[keep]].astype(np.int64)
+
+    # Mots distincts de chaque nom, triés, les MAX_NAME_TOKENS premiers
+    pairs = _sorted_unique(parents.astype(np.int64) * (len(vocabulary) + 1) + tokens)
+    parents, tokens = pairs // (len(vocabulary) + 1), pairs % (len(vocabulary) + 1)
+    starts = np.searchsorted(parents, np.arange(len(uniques)))
+    position = np.arange(len(parents)) - starts[parents]
+    matrix = np.full((len(uniques), MAX_NAME_TOKENS), -1, dtype=np.int64)
+    kept = position < MAX_NAME_TOKENS
+    matrix[parents[kept], position[kept]] = tokens[kept]
+    return codes, matrix
+
+
+def _contact_codes(series, normalize):
+    values = normalize(series.astype("string"))
+    codes, _ = pd.factorize(values.where(values.str.len() > 0))
+    return codes
+
+
+def _phones(values):
+    # Chiffres seuls, 9 derniers : « +212 6 12 34 56 78 » == « 0612345678 »
+    return values.str.replace(r"\D", "", regex=True).str[-9:]
+
+
+def _emails(values):
+    return values.str.strip().str.lower()
+
+
+def _name_match(tokens_a, tokens_b):
+    """Mêmes mots significatifs, ou >= 2 mots communs couvrant 80 % du nom le plus court."""
+    present_a, present_b = tokens_a >= 0, tokens_b >= 0
+    common = ((tokens_a[:, :, None] == tokens_b[:, None, :]) & present_a[:, :, None]).sum(axis=(1, 2))
+    size_a, size_b = present_a.sum(axis=1), present_b.sum(axis=1)
+    same = (common == size_a) & (common == size_b) & (size_a > 0)
+    return same | ((common >= 2) & (common >= 0.8 * np.minimum(size_a, size_b)))
+
+
+class _Records:
+    """Colonnes utiles au dédoublonnage, en tableaux NumPy."""
+
+    def __init__(self, df):
+        self.n = len(df)
+        self.city = pd.factorize(df[CITY_COL])[0].astype(np.int64) if CITY_COL in df.columns \
+            else np.zeros(self.n, dtype=np.int64)
+        if {"Latitude", "Longitude"}.issubset(df.columns):
+            self.lat = df["Latitude"].to_numpy(dtype=np.float64, na_value=np.nan)
+            self.lon = df["Longitude"].to_numpy(dtype=np.float64, na_value=np.nan)
+        else:
+            self.lat = self.lon = np.full(self.n, np.nan)
+        self.name, self.tokens = name_tokens(df[NAME_COL])
+        # Clé de tri : deux premiers mots significatifs
+        first = self.tokens[self.name]
+        self.sort_keys = (first[:, 1], first[:, 0])
+        self.phone = _contact_codes(df[PHONE_COL], _phones) if PHONE_COL in df.columns \
+            else np.full(self.n, -1)
+        self.email = _contact_codes(df[EMAIL_COL], _emails) if EMAIL_COL in df.columns \
+            else np.full(self.n, -1)
+
+    def duplicates(self, a, b, radius_km):
+        """Masque des paires (a, b) qui désignent le même magasin."""
+        no_coords = np.isnan(self.lat[a]) & np.isnan(self.lat[b])
+        with np.errstate(invalid="ignore"):
+            close = haversine_pairs_km(self.lat[a], self.lon[a], self.lat[b], self.lon[b]) <= radius_km
+        close = (close | no_coords) & (self.city[a] == self.city[b])
+        a, b = a[close], b[close]
+        contact = ((self.phone[a] == self.phone[b]) & (self.phone[a] >= 0)) \
+            | ((self.email[a] == self.email[b]) & (self.email[a] >= 0))
+        same_name = self.name[a] == self.name[b]
+        check = ~(contact | same_name)
+        names = same_name.copy()
+        names[check] = _name_match(self.tokens[self.name[a[check]]], self.tokens[self.name[b[check]]])
+        # Un nom sans mot significatif (« Optique ») ne suffit pas
+        names &= (self.tokens[self.name[a], 0] >= 0) | contact
+        mask = np.zeros(len(close), dtype=bool)
+        mask[np.flatnonzero(close)] = contact | names
+        return mask
+
+
+def candidate_pairs(blocks, sort_keys, window=DEDUP_WINDOW):
+    """Paires (a, b) de lignes d'un même bloc, distantes d'au plus `window` dans l'ordre des noms.
+
+    Lignes sans bloc (-1) ignorées ; générées décalage par décalage.
+    """
+    order = np.lexsort(tuple(sort_keys) + (blocks,))
+    order = order[blocks[order] >= 0]
+    sorted_blocks = blocks[order]
+    for offset in range(1, window + 1):
+        same = sorted_blocks[offset:] == sorted_blocks[:-offset]
+        yield order[:-offset][same], order[offset:][same]
+
+
+def duplicate_groups(df, radius_m=DEDUP_RADIUS_M, window=DEDUP_WINDOW):
+    """Numéro de groupe de chaque ligne (un par magasin)."""
+    records = _Records(df)
+    n = records.n
+    lat_step, lon_step = geohash_cell_size()
+    shifted = geohash_cells(records.lat + lat_step / 2, records.lon + lon_step / 2)
+    cells = geohash_cells(records.lat, records.lon)
+    # Sans coordonnées : un bloc par ville
+    no_coords = cells < 0
+    blockings = [
+        np.where(no_coords, records.city * (1 << 32) + (1 << 31), records.city * (1 << 32) + cells),
+        np.where(no_coords, -1, records.city * (1 << 32) + shifted),
+        np.where(records.phone >= 0, records.city * (1 << 32) + records.phone, -1),
+        np.where(records.email >= 0, records.city * (1 << 32) + records.email, -1),
+    ]
+    edges_a, edges_b = [], []
+    for blocks in blockings:
+        for a, b in candidate_pairs(blocks, records.sort_keys, window):
+            keep = records.duplicates(a, b, radius_m / 1000)
+            edges_a.append(a[keep])
+            edges_b.append(b[keep])
+    a = np.concatenate(edges_a) if edges_a else np.empty(0, dtype=np.intp)
+    b = np.concatenate(edges_b) if edges_b else np.empty(0, dtype=np.intp)
+    graph = coo_matrix((np.ones(len(a), dtype=np.int8), (a, b)), shape=(n, n))
+    return connected_components(graph, directed=False)[1]
+
+
+def deduplicate(df, radius_m=DEDUP_RADIUS_M, window=DEDUP_WINDOW):
+    """(fiches dédoublonnées, rapport des fiches retirées), ordre des lignes conservé."""
+    if len(df) < 2 or NAME_COL not in df.columns:
+        return df, pd.DataFrame(columns=REPORT_COLUMNS)
+    groups = duplicate_groups(df, radius_m, window)
+    sizes = np.bincount(groups)
+    if (sizes == 1).all():
+        return df, pd.DataFrame(columns=REPORT_COLUMNS)
+
+    # Fiche gardée : la plus renseignée, puis la plus commentée, puis la première
+    filled = df.notna().sum(axis=1).to_numpy()
+    reviews = np.nan_to_num(df["Nb_Avis_Google"].to_numpy(dtype=np.float64, na_value=np.nan)) \
+        if "Nb_Avis_Google" in df.columns else np.zeros(len(df))
+    positions = np.arange(len(df))
+    order = np.lexsort((positions, -reviews, -filled, groups))
+    first = np.r_[True, groups[order][1:] != groups[order][:-1]]
+    survivor_of_group = order[first]
+    keep = np.zeros(len(df), dtype=bool)
+    keep[survivor_of_group] = True
+
+    # Champs vides de la fiche gardée : premier doublon (même ordre) qui les renseigne
+    in_group = order[sizes[groups[order]] > 1]
+    filled_values = df.iloc[in_group].groupby(groups[in_group], sort=False).first()
+    survivors = survivor_of_group[sizes[groups[survivor_of_group]] > 1]
+    result = df.copy()
+    for i, col in enumerate(df.columns):
+        result.iloc[survivors, i] = filled_values.loc[groups[survivors], col].to_numpy()
+
+    # Fiche gardée de chaque fiche retirée, et sa position après dédoublonnage
+    survivor = np.empty(sizes.size, dtype=np.intp)
+    survivor[groups[survivor_of_group]] = survivor_of_group
+    removed = np.flatnonzero(~keep)
+    kept = survivor[groups[removed]]
+    report = pd.DataFrame({
+        "Nom": df[NAME_COL].to_numpy()[removed],
+        "Ville": df[CITY_COL].astype(object).to_numpy()[removed] if CITY_COL in df.columns else None,
+        "Nom conservé": df[NAME_COL].to_numpy()[kept],
+        "Position conservée": (np.cumsum(keep) - 1)[kept],
+    })
+    return result[keep].reset_index(drop=True), report
@@ -0,0 +1,134 @@
+"""Distances géodésiques vectorisées depuis n'importe quel point de référence.
+
+Les magasins sont projetés sur la sphère unité (x, y, z) : la distance
+euclidienne (corde) y est monotone avec la distance orthodromique, ce qui
+permet d'utiliser un KD-tree pour les requêtes de rayon et des k plus proches.
+"""
+import numpy as np
+from scipy.spatial import cKDTree
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat, lon, ref_lat, ref_lon):
+    """Distance (km) de chaque point à chaque référence.
+
+    lat/lon de forme (n,) ; références scalaires -> (n,), de forme (m,) -> (n, m).
+    """
+    scalar_ref = np.ndim(ref_lat) == 0
+    lat = np.radians(np.asarray(lat, dtype=np.float64))[:, None]
+    lon = np.radians(np.asarray(lon, dtype=np.float64))[:, None]
+    ref_lat = np.radians(np.atleast_1d(np.asarray(ref_lat, dtype=np.float64)))[None, :]
+    ref_lon = np.radians(np.atleast_1d(np.asarray(ref_lon, dtype=np.float64)))[None, :]
+    a = (np.sin((ref_lat - lat) / 2) ** 2
+         + np.cos(lat) * np.cos(ref_lat) * np.sin((ref_lon - lon) / 2) ** 2)
+    distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+    return distances[:, 0] if scalar_ref else distances
+
+
+def haversine_pairs_km(lat1, lon1, lat2, lon2):
+    """Distance (km) entre les points de même rang de deux séries de coordonnées."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def to_unit_xyz(lat, lon):
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+
+def km_to_chord(km):
+    return 2 * np.sin(np.asarray(km, dtype=np.float64) / (2 * EARTH_RADIUS_KM))
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord, dtype=np.float64) / 2, 0, 1))
+
+
+class DistanceIndex:
+    """KD-tree des magasins géolocalisés, construit une fois par version."""
+
+    def __init__(self, df, lat_col="Latitude", lon_col="Longitude"):
+        lat = df[lat_col].to_numpy(dtype=np.float64)
+        lon = df[lon_col].to_numpy(dtype=np.float64)
+        valid = ~(np.isnan(lat) | np.isnan(lon))
+        self.n_rows = len(df)
+        self.lat, self.lon = lat, lon
+        # Positions (dans df) des points indexés
+        self.positions = np.flatnonzero(valid)
+        self.tree = cKDTree(to_unit_xyz(lat[valid], lon[valid]))
+
+    def distances_from(self, ref_lat, ref_lon):
+        """Distance (km) de chaque ligne à la référence la plus proche (NaN sans coordonnées).
+
+        Une seule référence : haversine exacte sur toutes les lignes. Plusieurs
+        sites : KD-tree des sites, interrogé pour tous les magasins d'un coup.
+        """
+        ref_lat = np.atleast_1d(np.asarray(ref_lat, dtype=np.float64))
+        ref_lon = np.atleast_1d(np.asarray(ref_lon, dtype=np.float64))
+        distances = np.full(self.n_rows, np.nan)
+        lat, lon = self.lat[self.positions], self.lon[self.positions]
+        if len(ref_lat) == 1:
+            distances[self.positions] = haversine_km(lat, lon, ref_lat[0], ref_lon[0])
+        else:
+            chord, _ = cKDTree(to_unit_xyz(ref_lat, ref_lon)).query(to_unit_xyz(lat, lon))
+            distances[self.positions] = chord_to_km(chord)
+        return distances
+
+    def neighbor_distances(self, k=1):
+        """Distances (km) de chaque ligne à ses k plus proches autres magasins, forme (n, k).
+
+        NaN sans coordonnées ou faute d'assez de voisins. Un seul passage du
+        KD-tree pour tous les magasins, sans boucle sur les paires.
+        """
+        distances = np.full((self.n_rows, k), np.nan)
+        if k <= 0 or len(self.positions) < 2:
+            return distances
+        # Requêtes dans l'ordre des feuilles du KD-tree : les points voisins se
+        # suivent en mémoire, deux fois plus rapide qu'en ordre de fichier
+        order = self.tree.indices
+        chord, _ = self.tree.query(self.tree.data[order], k=k + 1)
+        # Colonne 0 : le point lui-même (distance nulle, même en cas d'égalité)
+        chord = chord[:, 1:]
+        km = chord_to_km(np.where(np.isinf(chord), 0.0, chord))
+        km[np.isinf(chord)] = np.nan
+        distances[self.positions[order]] = km
+        return distances
+
+    def within(self, ref_lat, ref_lon, radius_km):
+        """Positions (croissantes) des magasins à moins de radius_km de la référence."""
+        hits = self.tree.query_ball_point(to_unit_xyz([ref_lat], [ref_lon])[0], km_to_chord(radius_km))
+        return np.sort(self.positions[np.asarray(hits, dtype=np.intp)])
+
+    def nearest(self, ref_lat, ref_lon, k=10, rows=None):
+        """(positions, distances km) des k magasins les plus proches.
+
+        `rows` restreint la recherche à une sélection : le KD-tree est
+        interrogé avec un k croissant jusqu'à trouver assez de candidats.
+        """
+        n_points = len(self.positions)
+        if n_points == 0 or k <= 0:
+            return np.empty(0, dtype=np.intp), np.empty(0)
+        allowed = None
+        if rows is not None:
+            allowed = np.zeros(self.n_rows, dtype=bool)
+            allowed[rows] = True
+            k = min(k, int(allowed[self.positions].sum()))
+            if k == 0:
+                return np.empty(0, dtype=np.intp), np.empty(0)
+        point = to_unit_xyz([ref_lat], [ref_lon])[0]
+        query_k = k
+        while True:
+            query_k = min(query_k, n_points)
+            chord, idx = self.tree.query(point, k=query_k)
+            chord, idx = np.atleast_1d(chord), np.atleast_1d(idx)
+            positions = self.positions[idx]
+            if allowed is not None:
+                keep = allowed[positions]
+                positions, chord = positions[keep], chord[keep]
+            if len(positions) >= k or query_k == n_points:
+                return positions[:k], chord_to_km(chord[:k])
+            query_k *= 4
@@ -0,0 +1,378 @@
+"""Agrégats calculés en SQL par DuckDB sur le snapshot Parquet.
+
+Même interface et même dictionnaire que AggregateService : seuls les
+résultats agrégés reviennent en Python, DuckDB parallélise et lit le
+Parquet sans le charger en mémoire. Activé par OPTIQUES_BACKEND=duckdb.
+
+Les corrélations (DuckDBCorrelationService) passent aussi par SQL. Restent
+en mémoire : le DataFrame et la sélection des lignes (FilterIndex), dont
+ont besoin les vues ligne à ligne (tableaux, carte, graphiques, export),
+ainsi que le score des prospects et les index spatiaux. Une nouvelle
+version du snapshot reconstruit les services (cache vide).
+
+    python -m optiques.duckdb_backend      # compare les deux moteurs
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+from .aggregates import AVIS_COL, DIGITAL_CHANNELS, DIGITAL_COL, SIZE_COL, AggregateService
+from .binning import HISTOGRAM_BINS
+from .cache import LRUCache
+from .correlation import EXCLUDED_COLS, pearson_matrix
+from .distance import EARTH_RADIUS_KM
+from .filters import CITY_COL, NOTE_COL
+
+try:
+    import duckdb
+except ImportError:  # dépendance optionnelle
+    duckdb = None
+
+
+def _quote(col):
+    return '"' + col.replace('"', '""') + '"'
+
+
+def _haversine_sql(ref_lat, ref_lon):
+    # Même formule que distance.haversine_km
+    lat, lon = "radians(\"Latitude\")", "radians(\"Longitude\")"
+    ref_lat, ref_lon = f"radians({float(ref_lat)!r})", f"radians({float(ref_lon)!r})"
+    a = (f"pow(sin(({ref_lat} - {lat}) / 2), 2) + "
+         f"cos({lat}) * cos({ref_lat}) * pow(sin(({ref_lon} - {lon}) / 2), 2)")
+    return f"2 * {EARTH_RADIUS_KM!r} * asin(sqrt(least(greatest({a}, 0), 1)))"
+
+
+# Types DuckDB des colonnes numériques (select_dtypes(np.number) côté pandas)
+NUMERIC_TYPES = {"TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT", "UTINYINT", "USMALLINT",
+                 "UINTEGER", "UBIGINT", "FLOAT", "DOUBLE"}
+
+
+def _float(value):
+    return np.nan if value is None else float(value)
+
+
+class DuckDBAggregateService:
+    """Agrégats par état de filtre, calculés par requête SQL et mis en cache (LRU)."""
+
+    def __init__(self, snapshot_path, filter_index, reference=None, max_entries=256,
+                 max_bytes=32 * 1024 * 1024):
+        if duckdb is None:
+            raise ImportError("Le backend DuckDB nécessite le paquet duckdb (pip install duckdb)")
+        self.snapshot_path = str(snapshot_path)
+        self.filter_index = filter_index
+        self.distance_col = filter_index.distance_col
+        # (lats, lons) des points de référence si la distance n'est pas une colonne du snapshot
+        self.reference = reference
+        self.cache = LRUCache(max_entries=max_entries, max_bytes=max_bytes)
+        self._con = duckdb.connect()
+        self._lock = threading.Lock()
+        described = self._query(f"DESCRIBE SELECT * FROM {self._source()}")
+        self.columns = [row[0] for row in described]
+        if reference is not None and self.distance_col not in self.columns:
+            self.columns.append(self.distance_col)
+        self.numeric_columns = [row[0] for row in described if row[0] != "file_row_number"
+                                and (row[1] in NUMERIC_TYPES or row[1].startswith("DECIMAL"))]
+        self._edges = self._histogram_edges()
+
+    key = staticmethod(AggregateService.key)
+
+    def _source(self):
+        path = self.snapshot_path.replace("'", "''")
+        source = f"read_parquet('{path}', file_row_number = true)"
+        if self.reference is None:
+            return source
+        ref_lats, ref_lons = self.reference
+        distances = [_haversine_sql(lat, lon) for lat, lon in zip(ref_lats, ref_lons)]
+        distance = distances[0] if len(distances) == 1 else f"least({', '.join(distances)})"
+        return f"(SELECT *, CAST(round({distance}, 2) AS FLOAT) AS {_quote(self.distance_col)} FROM {source})"
+
+    def _query(self, sql, params=None):
+        # Un curseur par requête : la connexion est partagée entre les sessions
+        with self._lock:
+            cursor = self._con.cursor()
+        try:
+            return cursor.execute(sql, params or []).fetchall()
+        finally:
+            cursor.close()
+
+    def _histogram_edges(self):
+        edges = {}
+        for col, bins in HISTOGRAM_BINS.items():
+            if col not in self.columns:
+                continue
+            low, high = self._query(f"SELECT min({_quote(col)}), max({_quote(col)}) FROM {self._source()}")[0]
+            if low is not None:
+                edges[col] = np.histogram_bin_edges([float(low), float(high)], bins=bins)
+        return edges
+
+    def _where(self, city, note_range, max_distance):
+        # Bornes converties en FLOAT comme FilterIndex les convertit en float32
+        clauses, params = [], []
+        if city is not None and CITY_COL in self.columns:
+            clauses.append(f"{_quote(CITY_COL)} = ?")
+            params.append(city)
+        if note_range is not None and NOTE_COL in self.columns:
+            clauses.append(f"{_quote(NOTE_COL)} BETWEEN CAST(? AS FLOAT) AND CAST(? AS FLOAT)")
+            params.extend([float(note_range[0]), float(note_range[1])])
+        if max_distance is not None and self.distance_col in self.columns:
+            clauses.append(f"{_quote(self.distance_col)} <= CAST(? AS FLOAT)")
+            params.append(float(max_distance))
+        return ("WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def get(self, city=None, note_range=None, max_distance=None, rows=None):
+        """Agrégats de la sélection ; `rows` (positions pandas) est ignoré."""
+        key = self.key(city, note_range, max_distance)
+        return self.cache.get_or_compute(key, lambda: self.compute_filtered(city, note_range, max_distance))
+
+    def compute_filtered(self, city=None, note_range=None, max_distance=None):
+        where, params = self._where(city, note_range, max_distance)
+        source = f"(SELECT * FROM {self._source()} {where}) AS selection"
+        has = set(self.columns)
+        note, avis, digital, distance = (
+            f"CAST({_quote(col)} AS DOUBLE)" if col in has else None
+            for col in (NOTE_COL, AVIS_COL, DIGITAL_COL, self.distance_col)
+        )
+
+        # Une seule passe pour les statistiques scalaires
+        exprs = {"n_rows": "count(*)"}
+        if note:
+            exprs.update(note_mean=f"avg({note})", note_q75=f"quantile_cont({note}, 0.75)",
+                         note_ge_4=f"count_if({note} >= 4.0)", note_ge_4_5=f"count_if({note} >= 4.5)")
+        if avis:
+            exprs.update(avis_median=f"quantile_cont({avis}, 0.5)", avis_ge_50=f"count_if({avis} >= 50)")
+        if note and avis:
+            exprs["top_performers"] = f"count_if({note} >= 4.0 AND {avis} >= 20)"
+        if digital:
+            exprs.update(digital_mean=f"avg({digital})", digital_q90=f"quantile_cont({digital}, 0.90)")
+        if distance:
+            exprs.update(distance_mean=f"avg({distance})", distance_le_10=f"count_if({distance} <= 10)")
+        present = {}
+        for channel in DIGITAL_CHANNELS:
+            if channel in has:
+                present[channel] = f"{_quote(channel)} IS NOT NULL"
+        for i, expr in enumerate(present.values()):
+            exprs[f"channel_{i}"] = f"count_if({expr})"
+        if len(present) == len(DIGITAL_CHANNELS):
+            exprs["complete_digital"] = f"count_if({' AND '.join(present.values())})"
+
+        names = list(exprs)
+        values = self._query(
+            f"SELECT {', '.join(f'{expr} AS {name}' for name, expr in exprs.items())} FROM {source}", params
+        )[0]
+        row = dict(zip(names, values))
+
+        agg = {"n_rows": int(row["n_rows"])}
+        for name in names:
+            if name == "n_rows" or name.startswith("channel_"):
+                continue
+            if name in ("note_mean", "note_q75", "avis_median", "digital_mean", "digital_q90", "distance_mean"):
+                agg[name] = _float(row[name])
+            else:
+                # count_if vaut NULL sur une sélection vide
+                agg[name] = int(row[name] or 0)
+        agg["channels"] = {channel: int(row[f"channel_{i}"] or 0) for i, channel in enumerate(present)}
+
+        # Villes : comptages (égalités départagées par première apparition) et notes moyennes
+        if CITY_COL in has:
+            city_rows = self._query(
+                f"SELECT {_quote(CITY_COL)}, count(*), avg({note or 'NULL'}) FROM {source} "
+                f"WHERE {_quote(CITY_COL)} IS NOT NULL GROUP BY 1 "
+                f"ORDER BY count(*) DESC, min(file_row_number)", params
+            )
+            names_col = [r[0] for r in city_rows]
+            city_counts = pd.Series([int(r[1]) for r in city_rows], index=pd.Index(names_col, name=CITY_COL),
+                                    name="count", dtype="int64")
+            agg["city_counts"] = city_counts
+            agg["n_cities"] = len(city_counts)
+            if note:
+                top5 = city_rows[:5]
+                agg["top5_city_notes"] = pd.Series(
+                    [_float(r[2]) for r in top5], index=pd.Index([r[0] for r in top5], name=CITY_COL),
+                    name=NOTE_COL
+                ).sort_index()
+
+        if SIZE_COL in has:
+            measured = [col for col in (NOTE_COL, AVIS_COL, DIGITAL_COL) if col in has]
+            size_rows = self._query(
+                f"SELECT {_quote(SIZE_COL)}"
+                + "".join(f", avg(CAST({_quote(col)} AS DOUBLE))" for col in measured)
+                + f" FROM {source} WHERE {_quote(SIZE_COL)} IS NOT NULL GROUP BY 1 ORDER BY 1", params
+            )
+            agg["size_analysis"] = pd.DataFrame(
+                [[_float(v) for v in r[1:]] for r in size_rows], columns=measured,
+                index=pd.Index([r[0] for r in size_rows], name=SIZE_COL)
+            ).round(2)
+
+        # Histogrammes : indice de case calculé en SQL comme np.histogram (mêmes
+        # corrections aux bords, dernière case fermée) : n_bins lignes au plus.
+        # Bornes passées en paramètre DOUBLE[] : un littéral serait lu en DECIMAL
+        histograms = {}
+        for col, edges in self._edges.items():
+            n_bins = len(edges) - 1
+            counts = self._query(
+                f"WITH v AS (SELECT CAST({_quote(col)} AS DOUBLE) AS x FROM {source} "
+                f"WHERE {_quote(col)} IS NOT NULL), e AS (SELECT CAST(? AS DOUBLE[]) AS e), "
+                f"b AS (SELECT x, e, least(CAST(floor((x - e[1]) / (e[-1] - e[1]) * {n_bins}) AS BIGINT), "
+                f"{n_bins - 1}) AS i FROM v, e WHERE x >= e[1] AND x <= e[-1]) "
+                f"SELECT i - CAST(x < e[i + 1] AS BIGINT) + CAST(x >= e[i + 2] AND i < {n_bins - 1} AS BIGINT), "
+                f"count(*) FROM b GROUP BY 1",
+                params + [[float(e) for e in edges]]
+            )
+            hist = np.zeros(n_bins, dtype=np.int64)
+            for index, count in counts:
+                hist[index] = count
+            histograms[col] = (hist, edges)
+        agg["histograms"] = histograms
+        return agg
+
+
+class DuckDBCorrelationService:
+    """Corrélations par (sélection, méthode) calculées en SQL, même interface que CorrelationService.
+
+    Pearson : une requête renvoie les statistiques suffisantes par paire
+    (effectifs, sommes, carrés, produits croisés), transformées par
+    pearson_matrix comme côté pandas. Spearman : rangs moyens (ex æquo) par
+    fenêtre, sur les lignes où la paire est renseignée.
+    """
+
+    def __init__(self, aggregates, max_entries=128):
+        self.aggregates = aggregates
+        self.columns = [col for col in aggregates.numeric_columns if col not in EXCLUDED_COLS]
+        self.cache = LRUCache(max_entries=max_entries, max_bytes=16 * 1024 * 1024)
+
+    def get(self, city=None, note_range=None, max_distance=None, method="pearson", complete=False, rows=None):
+        """DataFrame de corrélation ; `rows` (positions pandas) est ignoré."""
+        key = (city, None if note_range is None else tuple(note_range), max_distance, method, complete)
+
+        def compute():
+            where, params = self.aggregates._where(city, note_range, max_distance)
+            source = f"(SELECT * FROM {self.aggregates._source()} {where}) AS selection"
+            if method == "spearman":
+                stats = self._rank_stats(source, params, complete)
+            else:
+                stats = self._stats(source, params)
+            matrix = pearson_matrix(stats, complete and method != "spearman")
+            return pd.DataFrame(matrix, index=self.columns, columns=self.columns)
+
+        return self.cache.get_or_compute(key, compute)
+
+    def _values(self):
+        return [f"CAST({_quote(col)} AS DOUBLE)" for col in self.columns]
+
+    def _stats(self, source, params):
+        # Mêmes statistiques que correlation.sufficient_stats, en une passe
+        x = self._values()
+        k = len(x)
+        present = [f"{v} IS NOT NULL" for v in x]
+        complete = " AND ".join(present)
+        exprs = []
+        for i in range(k):
+            for j in range(k):
+                exprs += [f"count_if({present[i]} AND {present[j]})",
+                          f"sum({x[i]}) FILTER (WHERE {present[j]})",
+                          f"sum({x[i]} * {x[i]}) FILTER (WHERE {present[j]})",
+                          f"sum({x[i]} * {x[j]})",
+                          f"sum({x[i]} * {x[j]}) FILTER (WHERE {complete})"]
+        exprs += [f"count_if({complete})"] + [f"sum({v}) FILTER (WHERE {complete})" for v in x]
+        row = np.array([np.nan if v is None else float(v) for v in self.aggregates._query(
+            f"SELECT {', '.join(exprs)} FROM {source}", params)[0]])
+        row = np.nan_to_num(row)
+        pairs = row[:5 * k * k].reshape(k, k, 5)
+        return {
+            "n": pairs[..., 0], "s": pairs[..., 1], "ss": pairs[..., 2], "sp": pairs[..., 3],
+            "sp_complete": pairs[..., 4], "n_complete": row[5 * k * k], "s_complete": row[5 * k * k + 1:],
+        }
+
+    def _rank_stats(self, source, params, complete):
+        # Une sous-requête par paire (i <= j) : rangs moyens sur les lignes où la paire est renseignée
+        x = self._values()
+        k = len(x)
+        rows_filter = " AND ".join(f"{v} IS NOT NULL" for v in x) if complete else None
+        queries, query_params = [], []
+        for i in range(k):
+            for j in range(i, k):
+                keep = rows_filter or f"{x[i]} IS NOT NULL AND {x[j]} IS NOT NULL"
+                ranks = ", ".join(
+                    f"rank() OVER (ORDER BY {v}) + (count(*) OVER (PARTITION BY {v}) - 1) / 2.0 AS r{side}"
+                    for side, v in (("i", x[i]), ("j", x[j]))
+                )
+                queries.append(
+                    f"SELECT {i} AS i, {j} AS j, count(*), sum(ri), sum(rj), sum(ri * ri), sum(rj * rj), "
+                    f"sum(ri * rj) FROM (SELECT {ranks} FROM {source} WHERE {keep})"
+                )
+                query_params += params
+        stats = {name: np.zeros((k, k)) for name in ("n", "s", "ss", "sp")}
+        for i, j, n, s_i, s_j, ss_i, ss_j, sp in self.aggregates._query(" UNION ALL ".join(queries), query_params):
+            s_i, s_j, ss_i, ss_j, sp = (0.0 if v is None else float(v) for v in (s_i, s_j, ss_i, ss_j, sp))
+            stats["n"][i, j] = stats["n"][j, i] = n
+            stats["s"][i, j], stats["s"][j, i] = s_i, s_j
+            stats["ss"][i, j], stats["ss"][j, i] = ss_i, ss_j
+            stats["sp"][i, j] = stats["sp"][j, i] = sp
+        return stats
+
+
+def compare_aggregates(expected, actual, rtol=1e-5):
+    """Clés dont les valeurs diffèrent entre deux dictionnaires d'agrégats."""
+    mismatches = []
+    for key in expected:
+        a, b = expected[key], actual.get(key)
+        try:
+            if isinstance(a, (pd.Series, pd.DataFrame)):
+                assert type(a) is type(b)
+                if isinstance(a, pd.Series):
+                    pd.testing.assert_series_equal(a, b, check_dtype=False, check_index_type=False, rtol=rtol)
+                else:
+                    pd.testing.assert_frame_equal(a, b, check_dtype=False, check_index_type=False, rtol=rtol)
+            elif isinstance(a, dict) and key == "histograms":
+                assert a.keys() == b.keys()
+                for col in a:
+                    np.testing.assert_array_equal(a[col][0], b[col][0])
+                    np.testing.assert_allclose(a[col][1], b[col][1], rtol=rtol)
+            elif isinstance(a, float):
+                np.testing.assert_allclose(a, b, rtol=rtol)
+            else:
+                assert a == b
+        except AssertionError:
+            mismatches.append(key)
+    return mismatches
+
+
+def main():
+    import itertools
+
+    from .correlation import CorrelationService
+    from .filters import FilterIndex
+    from .ingestion import DEFAULT_SOURCE, ensure_snapshot, read_snapshot
+
+    manifest = ensure_snapshot(DEFAULT_SOURCE)
+    df = read_snapshot(manifest)
+    filter_index = FilterIndex(df)
+    pandas_service = AggregateService(df, filter_index)
+    sql_service = DuckDBAggregateService(manifest["snapshot"], filter_index)
+
+    note_range = filter_index.bounds(NOTE_COL) if filter_index.has(NOTE_COL) else None
+    max_distance = filter_index.bounds(filter_index.distance_col)[1] if filter_index.has(filter_index.distance_col) else None
+    queries = [(city, note_range, max_distance) for city in [None] + filter_index.cities]
+    queries += [(None, (4.0, 5.0), None), (None, None, 10.0), (None, None, None)]
+    pandas_correlations = CorrelationService(df, filter_index)
+    sql_correlations = DuckDBCorrelationService(sql_service)
+    failures = 0
+    for query in queries:
+        mismatches = compare_aggregates(pandas_service.get(*query), sql_service.get(*query))
+        for method, complete in itertools.product(["pearson", "spearman"], [False, True]):
+            expected = pandas_correlations.get(*query, method=method, complete=complete)
+            actual = sql_correlations.get(*query, method=method, complete=complete)
+            try:
+                pd.testing.assert_frame_equal(expected, actual, rtol=1e-6)
+            except AssertionError:
+                mismatches.append(f"corrélations {method}{' complètes' if complete else ''}")
+        if mismatches:
+            failures += 1
+            print(f"{query} : {', '.join(mismatches)}")
+    print(f"{len(queries) - failures}/{len(queries)} sélections identiques (agrégats et corrélations)")
+    return failures
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,64 @@
+"""Export des données filtrées, sérialisées par blocs à la demande.
+
+Rien n'est sérialisé pendant le rendu de la page : Streamlit appelle le
+producteur uniquement au clic sur le bouton de téléchargement. Les blocs
+sont écrits dans un fichier temporaire (sur disque au-delà de SPOOL_BYTES)
+plutôt que dans un tampon mémoire : seul le contenu final, que Streamlit
+conserve de toute façon pour le servir, est chargé en mémoire.
+"""
+import gzip
+import tempfile
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+CHUNK_ROWS = 50_000
+SPOOL_BYTES = 8 * 1024 * 1024
+
+EXPORT_FORMATS = {
+    "CSV": (".csv", "text/csv"),
+    "CSV (gzip)": (".csv.gz", "application/gzip"),
+    "Parquet": (".parquet", "application/vnd.apache.parquet"),
+}
+
+
+def iter_csv_chunks(df, chunk_rows=CHUNK_ROWS):
+    """Générateur de blocs CSV encodés (en-tête dans le premier bloc)."""
+    if len(df) == 0:
+        yield df.to_csv(index=False).encode("utf-8")
+        return
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        yield chunk.to_csv(index=False, header=start == 0).encode("utf-8")
+
+
+def write_csv(df, fileobj, compress=False, chunk_rows=CHUNK_ROWS):
+    target = gzip.GzipFile(fileobj=fileobj, mode="wb") if compress else fileobj
+    for chunk in iter_csv_chunks(df, chunk_rows):
+        target.write(chunk)
+    if compress:
+        target.close()
+
+
+def write_parquet(df, fileobj, chunk_rows=CHUNK_ROWS):
+    # Schéma inféré sur tout le frame pour que chaque bloc ait les mêmes types
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    with pq.ParquetWriter(fileobj, schema) as writer:
+        for start in range(0, max(len(df), 1), chunk_rows):
+            chunk = df.iloc[start:start + chunk_rows]
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+def export_bytes(df, fmt="CSV", chunk_rows=CHUNK_ROWS):
+    """Contenu du fichier d'export au format demandé (clé de EXPORT_FORMATS)."""
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES) as spool:
+        if fmt == "Parquet":
+            write_parquet(df, spool, chunk_rows)
+        else:
+            write_csv(df, spool, compress=fmt == "CSV (gzip)", chunk_rows=chunk_rows)
+        spool.seek(0)
+        return spool.read()
+
+
+def export_file_name(prefix, fmt, stamp):
+    return f"{prefix}_{stamp}{EXPORT_FORMATS[fmt][0]}"
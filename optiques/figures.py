@@ -0,0 +1,335 @@
+"""Construction des figures Plotly du dashboard.
+
+Fonctions pures (DataFrame filtré -> figure) : l'application les appelle
+uniquement pour l'onglet actif et met le résultat en cache par état de filtre.
+Les histogrammes reçoivent des comptages déjà calculés (comptages, bornes)
+et sont tracés en barres : le navigateur ne reçoit pas la colonne brute.
+"""
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+from .binning import HISTOGRAM_BINS, density_bins, histogram
+from .config import SCATTER_BINS, SCATTER_POINT_LIMIT
+from .correlation import correlation_columns
+
+# Palettes proposées dans la barre latérale (la première est celle par défaut)
+COLOR_THEMES = ["Viridis", "Plasma", "Inferno", "Magma", "Cividis"]
+
+
+def _map_layout(fig):
+    fig.update_layout(
+        title_font_size=16,
+        title_x=0.5,
+        margin=dict(t=50, b=0, l=0, r=0)
+    )
+    return fig
+
+
+def _histogram_counts(df, col, histograms):
+    if histograms is not None and col in histograms:
+        return histograms[col]
+    return histogram(df[col].to_numpy(dtype=np.float64, na_value=np.nan), HISTOGRAM_BINS[col])
+
+
+def _histogram_bar(counts, edges, name, color):
+    """Barre par case, jointives comme un go.Histogram."""
+    if edges is None:
+        return go.Bar(x=[], y=[], name=name, marker_color=color)
+    return go.Bar(
+        x=(edges[:-1] + edges[1:]) / 2, y=counts, width=np.diff(edges),
+        name=name, marker_color=color,
+        customdata=np.column_stack([edges[:-1], edges[1:]]),
+        hovertemplate="[%{customdata[0]:.4g} ; %{customdata[1]:.4g}] : %{y}<extra></extra>"
+    )
+
+
+def _histogram_figure(counts, edges, col, color, title):
+    fig = go.Figure(_histogram_bar(counts, edges, col, color))
+    fig.update_layout(title=title, xaxis_title=col, yaxis_title="count")
+    return fig
+
+
+def _scatter_trace(x, y, name, color, point_limit, bins):
+    """Nuage SVG sous le seuil ; au-delà, Scattergl d'un point par case de densité."""
+    if len(x) <= point_limit:
+        return go.Scatter(x=x, y=y, mode="markers", name=name, marker=dict(color=color, size=6))
+    cells = density_bins(x, y, bins)
+    counts = cells["Nombre"].to_numpy()
+    return go.Scattergl(
+        x=cells["x"], y=cells["y"], mode="markers", name=name,
+        customdata=counts,
+        hovertemplate="%{x:.2f} ; %{y:.2f}<br>%{customdata} optiques<extra></extra>",
+        marker=dict(color=color, size=4 + 14 * np.sqrt(counts / counts.max()) if len(counts) else 6,
+                    opacity=0.7)
+    )
+
+
+def map_points_figure(geo_df, color_theme):
+    fig_map = px.scatter_mapbox(
+        geo_df,
+        lat="Latitude",
+        lon="Longitude",
+        hover_name="Nom",
+        hover_data=["Ville","Note_Google","Nb_Avis_Google"],
+        color="Note_Google",
+        size="Nb_Avis_Google",
+        color_continuous_scale=color_theme,
+        mapbox_style="open-street-map",
+        height=600,
+        title="🗺️ Répartition Géographique Interactive"
+    )
+    return _map_layout(fig_map)
+
+
+def map_cells_figure(map_cells, color_theme):
+    fig_map = px.scatter_mapbox(
+        map_cells,
+        lat="Latitude",
+        lon="Longitude",
+        hover_data={"Nombre": True, "Note_Google": ":.2f"},
+        color="Note_Google",
+        size="Nombre",
+        color_continuous_scale=color_theme,
+        mapbox_style="open-street-map",
+        height=600,
+        title="🗺️ Répartition Géographique Agrégée"
+    )
+    return _map_layout(fig_map)
+
+
+def _weighted_bounds(values, weights, tail=0.01):
+    order = np.argsort(values)
+    cumulative = np.cumsum(weights[order])
+    low, high = np.searchsorted(cumulative, [tail * cumulative[-1], (1 - tail) * cumulative[-1]])
+    return values[order[low]], values[order[min(high, len(order) - 1)]]
+
+
+def _map_view(lat, lon, weights, width_px=800, height_px=600):
+    """(centre, zoom) qui cadrent 98 % du poids des points ; les cartes choroplèthes
+    ne se cadrent pas seules, et quelques coordonnées aberrantes dézoomeraient tout."""
+    lat, lon, weights = (np.asarray(v, dtype=np.float64) for v in (lat, lon, weights))
+    (lat_min, lat_max), (lon_min, lon_max) = _weighted_bounds(lat, weights), _weighted_bounds(lon, weights)
+    center = {"lat": float(lat_min + lat_max) / 2, "lon": float(lon_min + lon_max) / 2}
+    # Au zoom z, une tuile de 256 px couvre 360 / 2^z degrés ; marge de 20 %
+    zoom = min(np.log2(360 * width_px / 256 / max(1.2 * (lon_max - lon_min), 1e-3)),
+               np.log2(180 * height_px / 256 / max(1.2 * (lat_max - lat_min), 1e-3)))
+    return center, float(np.clip(zoom, 1, 14))
+
+
+def map_hex_figure(hex_cells, geojson, color_col, color_theme, title):
+    center, zoom = _map_view(hex_cells["Latitude"], hex_cells["Longitude"], hex_cells["Nombre"])
+    fig_map = px.choropleth_mapbox(
+        hex_cells,
+        geojson=geojson,
+        locations="Cellule",
+        color=color_col,
+        hover_data={"Cellule": False, "Nombre": True, "Densité": ":.2f", "Concurrent (km)": ":.2f"},
+        color_continuous_scale=color_theme,
+        mapbox_style="open-street-map",
+        center=center,
+        zoom=zoom,
+        opacity=0.6,
+        height=600,
+        title=title
+    )
+    fig_map.update_traces(marker_line_width=0.5)
+    return _map_layout(fig_map)
+
+
+def top_cities_figure(top_cities, color_theme):
+    fig_cities = px.bar(
+        y=top_cities.index,
+        x=top_cities.values,
+        orientation='h',
+        color=top_cities.values,
+        color_continuous_scale=color_theme,
+        title="Nombre d'optiques par ville"
+    )
+    fig_cities.update_layout(
+        height=400,
+        showlegend=False,
+        title_font_size=14
+    )
+    return fig_cities
+
+
+def performance_figure(df_filtered, city_notes, distance_col="Distance-TARMIZ(KM)",
+                       point_limit=SCATTER_POINT_LIMIT, bins=SCATTER_BINS, histograms=None):
+    """Dashboard 2x3 de l'onglet Performance (nuages agrégés au-delà de point_limit lignes).
+
+    `histograms` : comptages pré-calculés {colonne: (comptages, bornes)}.
+    """
+    fig_perf = make_subplots(
+        rows=2, cols=3,
+        subplot_titles=(
+            "Distribution des Notes",
+            "Notes vs Nombre d'Avis",
+            "Top 5 Villes - Notes Moyennes",
+            "Évolution par Score Digital",
+            "Distribution Nb d'Avis",
+            "Performance par Distance"
+        ),
+        specs=[[{"type": "bar"}, {"type": "scatter"}, {"type": "bar"}],
+               [{"type": "scatter"}, {"type": "bar"}, {"type": "scatter"}]]
+    )
+
+    # Distribution des notes
+    fig_perf.add_trace(
+        _histogram_bar(*_histogram_counts(df_filtered, "Note_Google", histograms), "Notes", 'lightblue'),
+        row=1, col=1
+    )
+
+    # Notes vs Nb d'avis
+    fig_perf.add_trace(
+        _scatter_trace(df_filtered["Note_Google"], df_filtered["Nb_Avis_Google"],
+                       "Performance", 'orange', point_limit, bins),
+        row=1, col=2
+    )
+
+    # Top 5 villes - notes moyennes
+    fig_perf.add_trace(
+        go.Bar(x=city_notes.index, y=city_notes.values,
+              name="Moyenne", marker_color='green'),
+        row=1, col=3
+    )
+
+    # Score digital vs notes
+    if "Score_Presence_Digitale" in df_filtered.columns:
+        fig_perf.add_trace(
+            _scatter_trace(df_filtered["Score_Presence_Digitale"], df_filtered["Note_Google"],
+                           "Digital vs Note", 'purple', point_limit, bins),
+            row=2, col=1
+        )
+
+    # Distribution Nb d'avis
+    fig_perf.add_trace(
+        _histogram_bar(*_histogram_counts(df_filtered, "Nb_Avis_Google", histograms), "Nb Avis", 'red'),
+        row=2, col=2
+    )
+
+    # Distance vs notes
+    if distance_col in df_filtered.columns:
+        fig_perf.add_trace(
+            _scatter_trace(df_filtered[distance_col], df_filtered["Note_Google"],
+                           "Distance vs Note", 'brown', point_limit, bins),
+            row=2, col=3
+        )
+
+    fig_perf.update_layout(
+        height=800,
+        title_text="📊 Dashboard Performance Complet",
+        title_x=0.5,
+        showlegend=False
+    )
+    return fig_perf
+
+
+def digital_channels_figure(digital_df, color_theme):
+    fig_digital = px.bar(
+        digital_df,
+        x='Canal',
+        y='Pourcentage',
+        color='Pourcentage',
+        color_continuous_scale=color_theme,
+        title="📊 Taux de Présence par Canal",
+        text='Pourcentage'
+    )
+    fig_digital.update_traces(
+        texttemplate='%{text:.1f}%',
+        textposition='outside'
+    )
+    fig_digital.update_layout(height=400)
+    return fig_digital
+
+
+def digital_pie_figure(digital_df):
+    fig_pie = px.pie(
+        digital_df,
+        values='Nombre',
+        names='Canal',
+        title="🥧 Répartition des Canaux",
+        color_discrete_sequence=px.colors.qualitative.Set3
+    )
+    fig_pie.update_layout(height=400)
+    return fig_pie
+
+
+def score_distribution_figure(df_filtered, histograms=None):
+    counts, edges = _histogram_counts(df_filtered, "Score_Presence_Digitale", histograms)
+    return _histogram_figure(counts, edges, "Score_Presence_Digitale", 'lightcoral', "📈 Distribution Score Digital")
+
+
+def digital_scatter_figure(df_filtered, point_limit=SCATTER_POINT_LIMIT, bins=SCATTER_BINS):
+    if len(df_filtered) <= point_limit:
+        return px.scatter(
+            df_filtered,
+            x="Score_Presence_Digitale",
+            y="Note_Google",
+            color="Ville",
+            size="Nb_Avis_Google" if "Nb_Avis_Google" in df_filtered.columns else None,
+            hover_data=["Nom"],
+            title="🔗 Score Digital vs Performance"
+        )
+
+    # Une bulle par (ville, case de densité), taille = nombre d'optiques
+    city_codes, city_names = pd.factorize(df_filtered["Ville"])
+    cells = density_bins(df_filtered["Score_Presence_Digitale"], df_filtered["Note_Google"], bins, groups=city_codes)
+    cells = cells.rename(columns={"x": "Score_Presence_Digitale", "y": "Note_Google"})
+    cells["Ville"] = np.asarray(city_names)[cells.pop("groupe").to_numpy()]
+    return px.scatter(
+        cells,
+        x="Score_Presence_Digitale",
+        y="Note_Google",
+        color="Ville",
+        size="Nombre",
+        hover_data={"Nombre": True},
+        render_mode="webgl",
+        title="🔗 Score Digital vs Performance"
+    )
+
+
+def correlation_figure(df_filtered, color_theme, correlation_matrix=None):
+    """Heatmap des corrélations (matrice pré-calculée ou Pearson de df_filtered),
+    None s'il y a moins de deux colonnes numériques."""
+    if correlation_matrix is None:
+        numeric_columns = correlation_columns(df_filtered)
+        if len(numeric_columns) <= 1:
+            return None
+        correlation_matrix = df_filtered[numeric_columns].corr()
+    elif len(correlation_matrix.columns) <= 1:
+        return None
+
+    fig_corr = px.imshow(
+        correlation_matrix,
+        color_continuous_scale=color_theme,
+        title="Corrélations entre variables numériques"
+    )
+    fig_corr.update_layout(height=500)
+    return fig_corr
+
+
+def size_pie_figure(df_filtered):
+    return px.pie(
+        df_filtered,
+        names="Taille_Entreprise",
+        title="Répartition par Taille",
+        color_discrete_sequence=px.colors.qualitative.Pastel
+    )
+
+
+def age_histogram_figure(df_filtered, histograms=None):
+    counts, edges = _histogram_counts(df_filtered, "Anciennete_Estimee", histograms)
+    return _histogram_figure(counts, edges, "Anciennete_Estimee", 'lightseagreen', "Distribution de l'Ancienneté")
+
+
+def age_scatter_figure(df_filtered):
+    return px.scatter(
+        df_filtered,
+        x="Anciennete_Estimee",
+        y="Note_Google",
+        color="Score_Presence_Digitale" if "Score_Presence_Digitale" in df_filtered.columns else None,
+        title="Ancienneté vs Performance"
+    )
@@ -0,0 +1,259 @@
+"""Moteur de filtrage de la sidebar (ville, plage de notes, distance max).
+
+L'index est construit une fois par version du jeu de données : un index
+inversé ville -> positions et des tableaux triés pour les colonnes à plage.
+Une sélection se résout alors en recherches dichotomiques et en une
+intersection de positions, sans copier ni rebalayer le DataFrame.
+"""
+import copy
+
+import numpy as np
+import pandas as pd
+
+CITY_COL = "Ville"
+NOTE_COL = "Note_Google"
+DISTANCE_COL = "Distance-TARMIZ(KM)"
+
+_EMPTY = np.empty(0, dtype=np.intp)
+
+
+def _as_bound(value):
+    # str() donne la décimale la plus courte du float32 (4.1 et non 4.0999999)
+    return float(str(value))
+
+
+def sidebar_summary(df, city_col=CITY_COL, distance_col=DISTANCE_COL):
+    """Lignes, colonnes, villes et bornes des curseurs, aux mêmes valeurs que
+    FilterIndex : de quoi dessiner la sidebar avant d'avoir chargé les données."""
+    cities = sorted(df[city_col].dropna().unique().tolist()) if city_col in df.columns else []
+    bounds = {}
+    for col in (NOTE_COL, distance_col):
+        if col in df.columns:
+            values = df[col].to_numpy()
+            if values.dtype.kind != "f":
+                values = values.astype(np.float64)
+            values = values[~np.isnan(values)]
+            if len(values):
+                bounds[col] = [_as_bound(values.min()), _as_bound(values.max())]
+    return {"rows": len(df), "columns": list(df.columns), "cities": cities, "bounds": bounds}
+
+
+class FilterIndex:
+    def __init__(self, df, city_col=CITY_COL, distance_col=DISTANCE_COL):
+        self.n_rows = len(df)
+        self.all_rows = np.arange(self.n_rows, dtype=np.intp)
+        self._city_col = city_col
+        self.distance_col = distance_col
+
+        # Index inversé ville -> positions croissantes
+        self._city_codes = None
+        self._city_rows = {}
+        self._city_names = np.empty(0, dtype=object)
+        self.cities = []
+        if city_col in df.columns:
+            codes, uniques = pd.factorize(df[city_col])
+            order = np.argsort(codes, kind="stable")
+            bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+            self._city_codes = codes
+            self._city_code = {city: i for i, city in enumerate(uniques)}
+            self._city_names = np.asarray(uniques, dtype=object)
+            self._city_rows = {city: order[bounds[i]:bounds[i + 1]] for i, city in enumerate(uniques)}
+            self.cities = sorted(self._city_rows)
+        else:
+            self._city_code = {}
+
+        # Colonnes à plage : valeurs brutes + positions triées par valeur (NaN exclus)
+        self._values = {}
+        self._order = {}
+        self._sorted = {}
+        for col in (NOTE_COL, distance_col):
+            if col in df.columns:
+                self._index_range(df, col)
+
+    def _index_range(self, df, col):
+        # Type natif conservé (float32) : les bornes sont converties au même type
+        values = df[col].to_numpy()
+        if values.dtype.kind != "f":
+            values = values.astype(np.float64)
+        order = np.argsort(values, kind="stable")
+        order = order[:np.count_nonzero(~np.isnan(values))]
+        self._values[col] = values
+        self._order[col] = order
+        self._sorted[col] = values[order]
+
+    def with_distance(self, df, distance_col):
+        """Index identique dont le filtre de distance porte sur une autre colonne de df.
+
+        L'index des villes et celui des notes sont partagés ; seule la nouvelle
+        colonne de distance est triée.
+        """
+        new = copy.copy(self)
+        new.distance_col = distance_col
+        new._values = {NOTE_COL: self._values[NOTE_COL]} if self.has(NOTE_COL) else {}
+        new._order = {NOTE_COL: self._order[NOTE_COL]} if self.has(NOTE_COL) else {}
+        new._sorted = {NOTE_COL: self._sorted[NOTE_COL]} if self.has(NOTE_COL) else {}
+        new._index_range(df, distance_col)
+        return new
+
+    def has(self, col):
+        return col in self._sorted
+
+    def bounds(self, col):
+        """(min, max) d'une colonne indexée, sans rebalayer les données."""
+        sorted_values = self._sorted[col]
+        if len(sorted_values) == 0:
+            return (np.nan, np.nan)
+        return (_as_bound(sorted_values[0]), _as_bound(sorted_values[-1]))
+
+    def covers(self, col, low=None, high=None):
+        """Vrai si la plage [low, high] retient toutes les valeurs renseignées de col."""
+        start, stop = self._range_slice(col, low, high)
+        return start == 0 and stop == len(self._sorted[col])
+
+    def city_counts(self, rows):
+        """Équivalent de value_counts() sur la ville, limité aux positions données."""
+        if self._city_codes is None:
+            return pd.Series(dtype="int64", name="count")
+        codes = self._city_codes[rows]
+        counts = np.bincount(codes[codes >= 0], minlength=len(self._city_names))
+        order = np.argsort(-counts, kind="stable")
+        order = order[counts[order] > 0]
+        return pd.Series(counts[order], index=pd.Index(self._city_names[order], name=CITY_COL), name="count")
+
+    def city_code(self, city):
+        return self._city_code.get(city, -2)
+
+    def city_codes(self, rows):
+        return None if self._city_codes is None else self._city_codes[rows]
+
+    @property
+    def city_names(self):
+        return self._city_names
+
+    def _range_slice(self, col, low, high):
+        sorted_values = self._sorted[col]
+        low = None if low is None else sorted_values.dtype.type(low)
+        high = None if high is None else sorted_values.dtype.type(high)
+        start = 0 if low is None else np.searchsorted(sorted_values, low, side="left")
+        stop = len(sorted_values) if high is None else np.searchsorted(sorted_values, high, side="right")
+        return start, max(start, stop)
+
+    def select(self, city=None, note_range=None, max_distance=None):
+        """Positions (croissantes) des lignes retenues par la sélection."""
+        # Chaque contrainte : (taille, positions candidates, test vectorisé, déjà triée)
+        constraints = []
+
+        if city is not None and self._city_codes is not None:
+            rows = self._city_rows.get(city, _EMPTY)
+            code = self.city_code(city)
+            constraints.append((len(rows), rows, lambda r, c=code: self._city_codes[r] == c, True))
+
+        ranges = []
+        if note_range is not None and self.has(NOTE_COL):
+            ranges.append((NOTE_COL, note_range[0], note_range[1]))
+        if max_distance is not None and self.has(self.distance_col):
+            ranges.append((self.distance_col, None, max_distance))
+        for col, low, high in ranges:
+            start, stop = self._range_slice(col, low, high)
+            values = self._values[col]
+            low_v = values.dtype.type(-np.inf if low is None else low)
+            high_v = values.dtype.type(np.inf if high is None else high)
+            constraints.append((
+                stop - start,
+                self._order[col][start:stop],
+                lambda r, v=values, lo=low_v, hi=high_v: (v[r] >= lo) & (v[r] <= hi),
+                False,
+            ))
+
+        # Les contraintes qui couvrent toutes les lignes n'éliminent rien
+        constraints = [c for c in constraints if c[0] < self.n_rows]
+        if not constraints:
+            return self.all_rows
+
+        # Intersection pilotée par l'ensemble le plus petit, vérifié contre les autres
+        constraints.sort(key=lambda c: c[0])
+        _, rows, _, is_sorted = constraints[0]
+        for _, _, check, _ in constraints[1:]:
+            if len(rows) == 0:
+                break
+            rows = rows[check(rows)]
+        if not is_sorted:
+            rows = np.sort(rows)
+        return rows
+
+    def matches(self, rows, city=None, note_range=None, max_distance=None):
+        """Masque des positions `rows` qui satisfont la sélection."""
+        mask = np.ones(len(rows), dtype=bool)
+        if city is not None and self._city_codes is not None:
+            mask &= self._city_codes[rows] == self.city_code(city)
+        if note_range is not None and self.has(NOTE_COL):
+            values = self._values[NOTE_COL][rows]
+            cast = values.dtype.type
+            mask &= (values >= cast(note_range[0])) & (values <= cast(note_range[1]))
+        if max_distance is not None and self.has(self.distance_col):
+            values = self._values[self.distance_col][rows]
+            mask &= values <= values.dtype.type(max_distance)
+        return mask
+
+    def updated(self, df, changed):
+        """Index de `df` = ancien jeu dont les lignes `changed` ont été modifiées
+        et auquel des lignes ont été ajoutées en fin.
+
+        Seules les lignes touchées sont retirées puis réinsérées dans les
+        structures existantes : ni nouveau tri global, ni nouvelle factorisation.
+        L'index courant n'est pas modifié (les sessions en cours le lisent encore).
+        """
+        changed = np.asarray(changed, dtype=np.intp)
+        touched = np.concatenate([changed, np.arange(self.n_rows, len(df), dtype=np.intp)])
+
+        new = copy.copy(self)
+        new.n_rows = len(df)
+        new.all_rows = np.arange(new.n_rows, dtype=np.intp)
+
+        if self._city_codes is not None:
+            new._city_code = dict(self._city_code)
+            names = list(self._city_names)
+            touched_cities = pd.Series(df[self._city_col].to_numpy()[touched])
+            for city in touched_cities.dropna().unique():
+                if city not in new._city_code:
+                    new._city_code[city] = len(names)
+                    names.append(city)
+            touched_codes = touched_cities.map(new._city_code).fillna(-1).to_numpy(dtype=np.intp)
+
+            codes = np.concatenate([self._city_codes, np.full(len(df) - self.n_rows, -1, dtype=np.intp)])
+            affected = set(codes[changed].tolist()) | set(touched_codes.tolist())
+            codes[touched] = touched_codes
+            new._city_codes = codes
+            new._city_names = np.asarray(names, dtype=object)
+
+            new._city_rows = dict(self._city_rows)
+            for code in affected - {-1}:
+                city = names[code]
+                rows = self._city_rows.get(city, _EMPTY)
+                rows = rows[~np.isin(rows, changed)]
+                new._city_rows[city] = np.union1d(rows, touched[touched_codes == code])
+            new.cities = sorted(city for city, rows in new._city_rows.items() if len(rows))
+
+        new._values, new._order, new._sorted = {}, {}, {}
+        for col, old_values in self._values.items():
+            values = df[col].to_numpy()
+            if values.dtype != old_values.dtype:
+                values = values.astype(old_values.dtype)
+            order, sorted_values = self._order[col], self._sorted[col]
+            if len(changed):
+                keep = ~np.isin(order, changed)
+                order, sorted_values = order[keep], sorted_values[keep]
+            inserted = touched[~np.isnan(values[touched])]
+            inserted = inserted[np.argsort(values[inserted], kind="stable")]
+            at = np.searchsorted(sorted_values, values[inserted], side="right")
+            new._values[col] = values
+            new._order[col] = np.insert(order, at, inserted)
+            new._sorted[col] = np.insert(sorted_values, at, values[inserted])
+        return new
+
+
+def filter_frame(df, rows):
+    """Vue filtrée : le DataFrame lui-même si rien n'est exclu, sinon un take."""
+    if len(rows) == len(df):
+        return df
+    return df.take(rows)
@@ -0,0 +1,353 @@
+"""Ingestion des sources (classeurs, CSV, Parquet) dans un snapshot Parquet typé.
+
+Une source est un fichier, un dossier ou un motif glob. Le parsing openpyxl
+est lent : les fichiers sont lus en parallèle (un processus par fichier), puis
+le jeu combiné est dédoublonné (optiques.dedup) puis relu depuis le snapshot
+(memory-map) tant qu'aucun fichier source ne change.
+"""
+import glob
+import hashlib
+import json
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .config import DATA_SOURCE, DEDUP_RADIUS_M, INGEST_WORKERS
+from .dedup import REPORT_COLUMNS, deduplicate
+from .filters import sidebar_summary
+from .schema import REQUIRED_COLS, align_categories, apply_schema, missing_columns
+
+DEFAULT_SOURCE = DATA_SOURCE
+CACHE_DIRNAME = ".optiques_cache"
+SOURCE_EXTENSIONS = (".xlsx", ".xls", ".csv", ".parquet")
+
+# Incrémenter dès que la conversion change, pour invalider les anciens snapshots
+SNAPSHOT_FORMAT = 7
+
+
+def resolve_sources(source=DEFAULT_SOURCE):
+    """Fichiers d'une source, triés : le fichier lui-même, les fichiers pris
+    en charge d'un dossier, ou ceux qui correspondent à un motif glob."""
+    source = str(source)
+    if glob.has_magic(source):
+        files = glob.glob(source)
+    elif os.path.isdir(source):
+        files = [os.path.join(source, name) for name in os.listdir(source)]
+    else:
+        return [source]
+    # "~$..." : fichiers de verrouillage d'Excel
+    return sorted(
+        f for f in files
+        if f.lower().endswith(SOURCE_EXTENSIONS) and os.path.isfile(f) and not os.path.basename(f).startswith("~$")
+    )
+
+
+def source_fingerprint(source=DEFAULT_SOURCE):
+    """Signature bon marché [[fichier, mtime, taille], ...] de la source,
+    None si un fichier manque ou si la source est vide."""
+    fingerprint = []
+    for path in resolve_sources(source):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        fingerprint.append([path, stat.st_mtime_ns, stat.st_size])
+    return fingerprint or None
+
+
+def file_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sources_hash(files):
+    """SHA-256 du contenu ; pour plusieurs fichiers, combiné avec leurs noms."""
+    if len(files) == 1:
+        return file_hash(files[0])
+    digest = hashlib.sha256()
+    for path in files:
+        digest.update(f"{os.path.basename(path)}:{file_hash(path)}\n".encode())
+    return digest.hexdigest()
+
+
+def coerce_frame(df):
+    """Typage appliqué une seule fois, au moment de la conversion."""
+    # Parquet exige une colonne homogène : les objets mixtes passent en texte
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return apply_schema(df)
+
+
+def read_source_file(path):
+    """DataFrames typés d'un fichier source (une par feuille utile d'un classeur).
+
+    Exécuté dans un processus du pool : le typage (catégories, float32) y est
+    appliqué avant le retour, ce qui réduit aussi le volume transféré.
+    """
+    lower = path.lower()
+    if lower.endswith((".xlsx", ".xls")):
+        sheets = pd.read_excel(path, sheet_name=None, engine="openpyxl" if lower.endswith(".xlsx") else None)
+        # Les feuilles annexes (notes, tableaux croisés) sont ignorées
+        frames = [df for df in sheets.values() if not missing_columns(df)]
+        if not frames:
+            raise ValueError(f"{path} : aucune feuille avec les colonnes {', '.join(REQUIRED_COLS)}")
+    elif lower.endswith(".csv"):
+        frames = [pd.read_csv(path)]
+    elif lower.endswith(".parquet"):
+        frames = [pd.read_parquet(path)]
+    else:
+        raise ValueError(f"Format non supporté : {path}")
+
+    for df in frames:
+        missing = missing_columns(df)
+        if missing:
+            raise ValueError(f"{path} : colonnes manquantes {', '.join(missing)}")
+    return [coerce_frame(df) for df in frames]
+
+
+def combine_frames(frames):
+    """Un seul DataFrame : catégories alignées puis une unique concaténation."""
+    if len(frames) == 1:
+        return frames[0]
+    # Le schéma est réappliqué : une colonne absente d'un fichier ou entière
+    # dans l'un et manquante dans l'autre change de type à la concaténation
+    return apply_schema(pd.concat(align_categories(*frames), ignore_index=True))
+
+
+def read_sources(source=DEFAULT_SOURCE, max_workers=INGEST_WORKERS):
+    """Lit tous les fichiers de la source, en parallèle s'il y en a plusieurs."""
+    files = resolve_sources(source)
+    if not files:
+        raise FileNotFoundError(source)
+    workers = min(len(files), max_workers or os.cpu_count() or 1)
+    if workers <= 1:
+        results = [read_source_file(path) for path in files]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(read_source_file, files))
+    return combine_frames([df for frames in results for df in frames])
+
+
+def load_sources(source=DEFAULT_SOURCE, radius_m=DEDUP_RADIUS_M):
+    """(fiches de la source dédoublonnées, rapport des fiches retirées)."""
+    df = read_sources(source)
+    if radius_m <= 0:
+        return df, pd.DataFrame(columns=REPORT_COLUMNS)
+    return deduplicate(df, radius_m)
+
+
+def _cache_paths(source, cache_dir):
+    path = Path(source)
+    if glob.has_magic(str(path)):
+        # Motif : nommé d'après son dossier racine et un hash du motif
+        digest = hashlib.sha256(str(path).encode()).hexdigest()[:8]
+        while glob.has_magic(str(path)):
+            path = path.parent
+        stem = f"{path.name or 'sources'}-{digest}"
+    else:
+        stem = path.stem
+    cache_dir = Path(cache_dir) if cache_dir else path.parent / CACHE_DIRNAME
+    return cache_dir / f"{stem}.parquet", cache_dir / f"{stem}.json"
+
+
+def _read_manifest(manifest_path):
+    try:
+        with open(manifest_path, encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_atomic(target, write):
+    tmp = target.with_name(target.name + ".tmp")
+    write(tmp)
+    os.replace(tmp, target)
+
+
+def _current_manifest(path, cache_dir):
+    """(manifeste à jour ou None, empreinte, sha256 calculé ou None)."""
+    snapshot_path, manifest_path = _cache_paths(path, cache_dir)
+    fingerprint = source_fingerprint(path)
+    if fingerprint is None:
+        raise FileNotFoundError(path)
+    files = [entry[0] for entry in fingerprint]
+
+    manifest = _read_manifest(manifest_path)
+    if not (manifest and manifest.get("format") == SNAPSHOT_FORMAT and snapshot_path.exists()
+            and manifest.get("dedup_radius_m") == DEDUP_RADIUS_M):
+        return None, fingerprint, sources_hash(files)
+    if manifest["fingerprint"] == fingerprint:
+        return manifest, fingerprint, None
+    sha256 = sources_hash(files)
+    if manifest["sha256"] == sha256:
+        manifest.update(fingerprint=fingerprint)
+        _write_atomic(manifest_path, lambda p: p.write_text(json.dumps(manifest), encoding="utf-8"))
+        return manifest, fingerprint, None
+    return None, fingerprint, sha256
+
+
+def write_snapshot(df, path, fingerprint, sha256, cache_dir=None, keys=None, hashes=None, duplicates=None):
+    """Écrit snapshot, clés de lignes, rapport de dédoublonnage et manifeste ; retourne le manifeste."""
+    snapshot_path, manifest_path = _cache_paths(path, cache_dir)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    keys = pa.table({
+        "key": row_keys(df) if keys is None else keys,
+        "hash": row_hashes(df) if hashes is None else hashes,
+    })
+    snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+    _write_atomic(snapshot_path, lambda p: pq.write_table(table, p))
+    _write_atomic(_keys_path(snapshot_path), lambda p: pq.write_table(keys, p))
+    if duplicates is None:
+        duplicates = pd.DataFrame(columns=REPORT_COLUMNS)
+    report = pa.Table.from_pandas(duplicates, preserve_index=False)
+    _write_atomic(_duplicates_path(snapshot_path), lambda p: pq.write_table(report, p))
+
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "source": str(path),
+        "snapshot": str(snapshot_path),
+        "fingerprint": fingerprint,
+        "sha256": sha256,
+        "rows": len(df),
+        "dedup_radius_m": DEDUP_RADIUS_M,
+        "duplicates": len(duplicates),
+        # Lu au démarrage, avant le snapshot : premier affichage de la sidebar
+        "summary": sidebar_summary(df),
+    }
+    _write_atomic(manifest_path, lambda p: p.write_text(json.dumps(manifest), encoding="utf-8"))
+    return manifest
+
+
+def ensure_snapshot(path=DEFAULT_SOURCE, cache_dir=None):
+    """Garantit un snapshot à jour et retourne son manifeste.
+
+    Les couples (mtime, taille) évitent de hacher les fichiers à chaque
+    démarrage ; le hash SHA-256 tranche quand un fichier a seulement été touché.
+    """
+    manifest, fingerprint, sha256 = _current_manifest(path, cache_dir)
+    if manifest is not None:
+        return manifest
+    df, duplicates = load_sources(path)
+    return write_snapshot(df, path, fingerprint, sha256, cache_dir, duplicates=duplicates)
+
+
+def read_summary(path=DEFAULT_SOURCE, cache_dir=None):
+    """Résumé (sidebar_summary) du dernier snapshot écrit, sans vérifier qu'il est
+    à jour ni lire les données ; None avant la première conversion."""
+    manifest = _read_manifest(_cache_paths(path, cache_dir)[1])
+    return manifest.get("summary") if manifest else None
+
+
+def read_snapshot(manifest):
+    # Un bloc par colonne : prendre quelques lignes d'une colonne texte en
+    # plusieurs blocs Arrow coûte un parcours de toute la colonne
+    return pq.read_table(manifest["snapshot"], memory_map=True).combine_chunks().to_pandas()
+
+
+def read_snapshot_keys(manifest):
+    keys = pq.read_table(_keys_path(Path(manifest["snapshot"])), memory_map=True)
+    return keys["key"].to_numpy(), keys["hash"].to_numpy()
+
+
+def read_duplicates(manifest):
+    """Fiches retirées au dédoublonnage de cette version (Nom, Ville, Nom conservé, Position conservée)."""
+    return pq.read_table(_duplicates_path(Path(manifest["snapshot"]))).to_pandas()
+
+
+def load_snapshot(path=DEFAULT_SOURCE, cache_dir=None):
+    return read_snapshot(ensure_snapshot(path, cache_dir))
+
+
+# ----------------------------
+# RAFRAÎCHISSEMENT INCRÉMENTAL
+# ----------------------------
+KEY_COLUMNS = ["Nom", "Ville"]
+ID_COLUMNS = ["ID", "Id", "id"]
+
+RowDelta = namedtuple("RowDelta", ["appended", "changed_old", "changed_new", "removed"])
+Refresh = namedtuple("Refresh", ["manifest", "df", "keys", "hashes", "delta"])
+
+
+def _keys_path(snapshot_path):
+    return snapshot_path.with_name(snapshot_path.stem + ".keys.parquet")
+
+
+def _duplicates_path(snapshot_path):
+    return snapshot_path.with_name(snapshot_path.stem + ".duplicates.parquet")
+
+
+def row_keys(df):
+    """Clé stable par ligne : colonne ID si présente, sinon Nom + Ville.
+
+    Le rang d'occurrence départage les doublons de clé (deux magasins
+    homonymes dans la même ville).
+    """
+    id_cols = [col for col in ID_COLUMNS if col in df.columns][:1]
+    key_cols = id_cols or [col for col in KEY_COLUMNS if col in df.columns]
+    keys = df[key_cols].astype(str)
+    keys["_occurrence"] = keys.groupby(key_cols, sort=False).cumcount()
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+
+def row_hashes(df):
+    """Empreinte du contenu de chaque ligne, pour détecter les modifications."""
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def diff_rows(old_keys, old_hashes, new_keys, new_hashes):
+    """Compare deux versions ligne à ligne via leurs clés stables."""
+    old_index = pd.Index(old_keys)
+    matched = old_index.get_indexer(new_keys)
+    appended = np.flatnonzero(matched < 0)
+    both = np.flatnonzero(matched >= 0)
+    modified = old_hashes[matched[both]] != new_hashes[both]
+    removed = np.setdiff1d(np.arange(len(old_keys)), matched[both], assume_unique=True)
+    return RowDelta(appended, matched[both][modified], both[modified], removed)
+
+
+def merged_order(old_keys, new_keys):
+    """Ordre des lignes de la nouvelle version : lignes conservées au rang
+    qu'elles avaient, lignes ajoutées en fin (ordre du classeur)."""
+    matched = pd.Index(old_keys).get_indexer(new_keys)
+    kept = np.flatnonzero(matched >= 0)
+    return np.concatenate([kept[np.argsort(matched[kept], kind="stable")], np.flatnonzero(matched < 0)])
+
+
+def refresh_snapshot(manifest, old_keys, old_hashes, path=DEFAULT_SOURCE, cache_dir=None):
+    """Détecte les lignes ajoutées / modifiées depuis la version `manifest`.
+
+    `old_keys` / `old_hashes` décrivent les lignes de la version chargée en
+    mémoire (le fichier de clés sur disque peut déjà avoir été réécrit par un
+    autre worker). Le classeur doit être relu pour comparer les lignes, mais
+    l'appelant n'applique ensuite que le delta à ses index et agrégats.
+    Le snapshot est écrit dans l'ordre fusionné (merged_order) : un worker
+    qui le charge à froid obtient les mêmes lignes, dans le même ordre, que
+    celui qui a appliqué le delta.
+    Les champs df, keys, hashes et delta valent None si le contenu n'a pas changé.
+    """
+    current, fingerprint, sha256 = _current_manifest(path, cache_dir)
+    if current is not None and current["sha256"] == manifest["sha256"]:
+        return Refresh(current, None, None, None, None)
+    if current is not None:
+        # Un autre worker a déjà converti la nouvelle version
+        new_df = read_snapshot(current)
+        new_keys, new_hashes = read_snapshot_keys(current)
+    else:
+        new_df, duplicates = load_sources(path)
+        new_keys, new_hashes = row_keys(new_df), row_hashes(new_df)
+        order = merged_order(old_keys, new_keys)
+        new_df = new_df.iloc[order].reset_index(drop=True)
+        new_keys, new_hashes = new_keys[order], new_hashes[order]
+        current = write_snapshot(new_df, path, fingerprint, sha256, cache_dir, new_keys, new_hashes, duplicates)
+    delta = diff_rows(old_keys, old_hashes, new_keys, new_hashes)
+    return Refresh(current, new_df, new_keys, new_hashes, delta)
@@ -0,0 +1,147 @@
+"""Instrumentation par étape : temps, lignes traitées et delta mémoire.
+
+Chaque rerun du script ouvre un `Profiler` (start_run) ; les sections sont
+entourées de `with stage("nom"):` ou décorées par `@profiled("nom")`. Les
+mesures alimentent le panneau de debug et sont ajoutées en JSON lines au
+fichier PROFILE_LOG, agrégeable entre sessions et workers.
+
+Le delta mémoire est celui du RSS du processus : avec plusieurs sessions
+simultanées il inclut leurs allocations, c'est un ordre de grandeur.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+from .config import PROFILE_LOG
+
+_current = contextvars.ContextVar("optiques_profiler", default=None)
+_log_lock = threading.Lock()
+
+try:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = None
+
+
+def rss_bytes():
+    """Mémoire résidente du processus, None hors Linux."""
+    if _PAGE_SIZE is None:
+        return None
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def write_log(path, records):
+    # Une écriture par ligne en mode append : pas d'entrelacement entre workers
+    with _log_lock, open(path, "a", encoding="utf-8") as fh:
+        for record in records:
+            fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+class Profiler:
+    def __init__(self, session_id=None, log_path=PROFILE_LOG):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.session_id = session_id
+        self.log_path = log_path
+        # Dans l'ordre d'entrée : un parent précède ses sous-étapes
+        self.records = []
+        self.total = None
+        self._depth = 0
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """Mesure le bloc ; `rows` peut être renseigné après coup via record["rows"]."""
+        record = {"stage": name, "depth": self._depth, "rows": rows, "seconds": None, "mem_delta": None}
+        self.records.append(record)
+        self._depth += 1
+        mem_before = rss_bytes()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - start
+            mem_after = rss_bytes()
+            if mem_before is not None and mem_after is not None:
+                record["mem_delta"] = mem_after - mem_before
+            self._depth -= 1
+
+    def finish(self):
+        """Clôt le rerun et écrit une ligne par étape dans le log."""
+        self.total = time.perf_counter() - self._start
+        if self.log_path:
+            common = {
+                "ts": datetime.now().isoformat(timespec="milliseconds"),
+                "pid": os.getpid(),
+                "session": self.session_id,
+                "run": self.run_id,
+            }
+            try:
+                write_log(self.log_path, [{**common, **record} for record in self.records])
+            except OSError:
+                pass
+        return self.records
+
+
+def start_run(session_id=None, log_path=PROFILE_LOG):
+    profiler = Profiler(session_id, log_path)
+    _current.set(profiler)
+    return profiler
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def fragment_run(session_id=None, log_path=PROFILE_LOG):
+    """Section rerunnable seule (st.fragment) : dans un rerun complet, ses
+    étapes en font partie ; rerun du fragment seul, elle ouvre et clôt sa propre mesure."""
+    profiler = _current.get()
+    if profiler is not None and profiler.total is None:
+        yield profiler
+        return
+    profiler = start_run(session_id, log_path)
+    try:
+        yield profiler
+    finally:
+        profiler.finish()
+
+
+@contextmanager
+def stage(name, rows=None):
+    """Étape du rerun courant ; hors rerun (callback différé), mesure isolée."""
+    profiler = _current.get()
+    if profiler is not None:
+        with profiler.stage(name, rows) as record:
+            yield record
+        return
+    profiler = Profiler()
+    try:
+        with profiler.stage(name, rows) as record:
+            yield record
+    finally:
+        profiler.finish()
+
+
+def profiled(name=None, rows=None):
+    """Décorateur ; `rows(result)` donne le nombre de lignes traitées."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name or func.__name__) as record:
+                result = func(*args, **kwargs)
+                if rows is not None and result is not None:
+                    record["rows"] = rows(result)
+                return result
+        return wrapper
+    return decorator
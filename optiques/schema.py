@@ -0,0 +1,62 @@
+"""Schéma typé du jeu de données, appliqué une seule fois à la conversion."""
+import numpy as np
+import pandas as pd
+
+NUMERIC_COLS = ["Note_Google", "Nb_Avis_Google", "Score_Presence_Digitale",
+                "Distance-TARMIZ(KM)", "Anciennete_Estimee"]
+
+# Mesures continues (notes, distances) : toujours flottantes, jamais entières
+FLOAT32_COLS = ["Note_Google", "Nb_Avis_Google", "Distance-TARMIZ(KM)", "Anciennete_Estimee"]
+
+# Colonnes texte à faible cardinalité : codes entiers + dictionnaire
+CATEGORICAL_COLS = ["Ville", "Taille_Entreprise", "catégorie", "Services_Principaux"]
+
+# Les coordonnées restent en float64 : la précision compte pour les distances
+FLOAT64_COLS = ["Latitude", "Longitude"]
+
+# Colonnes exigées de chaque source : clé des lignes (rafraîchissement incrémental)
+REQUIRED_COLS = ["Nom", "Ville"]
+
+
+def downcast_numeric(series):
+    """int32 si la colonne est entière, sans manquant et dans les bornes, sinon float32."""
+    values = pd.to_numeric(series, errors="coerce")
+    int32 = np.iinfo(np.int32)
+    if (values.notna().all() and (values % 1 == 0).all()
+            and (values.empty or int32.min <= values.min() <= values.max() <= int32.max)):
+        return values.astype(np.int32)
+    return values.astype(np.float32)
+
+
+def missing_columns(df):
+    return [col for col in REQUIRED_COLS if col not in df.columns]
+
+
+def apply_schema(df):
+    for col in df.columns:
+        if col in FLOAT64_COLS:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype(np.float64)
+        elif col in FLOAT32_COLS:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype(np.float32)
+        # is_numeric_dtype est vrai pour les booléens : ils gardent leur type
+        elif col in NUMERIC_COLS or (pd.api.types.is_numeric_dtype(df[col])
+                                     and not pd.api.types.is_bool_dtype(df[col])):
+            df[col] = downcast_numeric(df[col])
+        elif col in CATEGORICAL_COLS:
+            df[col] = df[col].astype("category")
+    return df
+
+
+def align_categories(*frames):
+    """Copies des frames dont les colonnes catégorielles communes partagent
+    les mêmes catégories, pour qu'une concaténation les garde catégorielles."""
+    frames = [f.copy(deep=False) for f in frames]
+    for col in frames[0].columns:
+        if not all(col in f.columns and isinstance(f[col].dtype, pd.CategoricalDtype) for f in frames):
+            continue
+        categories = frames[0][col].cat.categories
+        for f in frames[1:]:
+            categories = categories.union(f[col].cat.categories)
+        for f in frames:
+            f[col] = f[col].cat.set_categories(categories)
+    return frames
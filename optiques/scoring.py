@@ -0,0 +1,171 @@
+"""Score composite des optiques (prospects) et classement top-K.
+
+Chaque critère est ramené sur [0, 1] une fois par version du jeu de données
+(et par référence, pour la proximité). Un score pour des poids donnés n'est
+plus qu'un produit matrice-vecteur, mis en cache par configuration de poids ;
+un top-K passe par argpartition (linéaire) et ne trie que les K retenus.
+
+Critères :
+- note bayésienne : (v·R + m·C) / (v + m), note R tirée vers la moyenne C
+  tant que les avis v sont peu nombreux (m = SCORE_PRIOR_REVIEWS), sur 5 ;
+- avis : log(1 + avis) rapporté au maximum ;
+- présence digitale et ancienneté : rapportées à leur plage ;
+- proximité : exp(-distance / SCORE_DISTANCE_KM), distance de la référence choisie.
+Une valeur manquante vaut 0 ; une colonne absente ou vide sort du calcul.
+"""
+import numpy as np
+
+from .aggregates import AVIS_COL, DIGITAL_COL
+from .cache import LRUCache
+from .config import SCORE_DISTANCE_KM, SCORE_PRIOR_REVIEWS
+from .filters import NOTE_COL
+
+AGE_COL = "Anciennete_Estimee"
+# Critère -> libellé affiché
+CRITERIA = {
+    "note": "Note bayésienne",
+    "avis": "Nombre d'avis",
+    "digital": "Présence digitale",
+    "anciennete": "Ancienneté",
+    "proximite": "Proximité",
+}
+DEFAULT_WEIGHTS = {"note": 0.35, "avis": 0.2, "digital": 0.25, "anciennete": 0.1, "proximite": 0.1}
+MAX_NOTE = 5.0
+
+
+def _column(df, col):
+    if col not in df.columns:
+        return None
+    values = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+    return None if np.isnan(values).all() else values
+
+
+def _scaled(values):
+    # Plage [min, max] -> [0, 1], NaN -> 0
+    low, high = np.nanmin(values), np.nanmax(values)
+    scaled = (values - low) / (high - low) if high > low else np.ones_like(values)
+    return np.nan_to_num(scaled, nan=0.0)
+
+
+def bayesian_rating(notes, reviews, prior_reviews=SCORE_PRIOR_REVIEWS):
+    """Note pondérée par le nombre d'avis ; sans note ni avis : la moyenne générale.
+
+    `reviews` None (colonne absente) : aucun avis, toutes les notes valent la moyenne.
+    """
+    notes = np.clip(notes, 0.0, MAX_NOTE)
+    mean = np.nanmean(notes)
+    if reviews is None:
+        reviews = np.zeros_like(notes)
+    reviews = np.where(np.isnan(notes), 0.0, np.nan_to_num(reviews, nan=0.0))
+    notes = np.nan_to_num(notes, nan=mean)
+    return (reviews * notes + prior_reviews * mean) / (reviews + prior_reviews)
+
+
+def criteria_values(df, distance_col, prior_reviews=SCORE_PRIOR_REVIEWS, distance_km=SCORE_DISTANCE_KM):
+    """{critère: valeurs sur [0, 1]} des critères calculables sur df."""
+    notes, reviews = _column(df, NOTE_COL), _column(df, AVIS_COL)
+    digital, age, distance = _column(df, DIGITAL_COL), _column(df, AGE_COL), _column(df, distance_col)
+    values = {}
+    if notes is not None:
+        values["note"] = bayesian_rating(notes, reviews, prior_reviews) / MAX_NOTE
+    if reviews is not None:
+        logs = np.log1p(np.clip(np.nan_to_num(reviews, nan=0.0), 0.0, None))
+        values["avis"] = logs / logs.max() if logs.max() > 0 else logs
+    if digital is not None:
+        values["digital"] = _scaled(digital)
+    if age is not None:
+        values["anciennete"] = _scaled(age)
+    if distance is not None:
+        values["proximite"] = np.nan_to_num(np.exp(-np.clip(distance, 0.0, None) / distance_km), nan=0.0)
+    return values
+
+
+class ScoringEngine:
+    """Scores composites (0 à 100) par configuration de poids, en cache LRU."""
+
+    def __init__(self, df, filter_index, max_entries=16):
+        self.filter_index = filter_index
+        values = criteria_values(df, filter_index.distance_col)
+        self.criteria = [name for name in CRITERIA if name in values]
+        # Une ligne par critère : le score est poids @ composantes
+        self._components = np.vstack([values[name] for name in self.criteria]).astype(np.float32) \
+            if self.criteria else np.zeros((0, len(df)), dtype=np.float32)
+        self.cache = LRUCache(max_entries=max_entries, max_bytes=max_entries * self._components.shape[1] * 4)
+
+    def normalized(self, weights):
+        """Poids des critères disponibles, de somme 1 (clé du cache)."""
+        raw = np.array([max(float(weights.get(name, 0.0)), 0.0) for name in self.criteria])
+        if raw.sum() <= 0:
+            raise ValueError("Au moins un critère disponible doit avoir un poids positif")
+        # Arrondi : deux réglages équivalents partagent la même entrée
+        return tuple(np.round(raw / raw.sum(), 6).tolist())
+
+    def scores(self, weights=DEFAULT_WEIGHTS):
+        """Score de chaque ligne pour ces poids."""
+        key = self.normalized(weights)
+        return self.cache.get_or_compute(
+            key, lambda: np.asarray(key, dtype=np.float32) @ self._components * np.float32(100)
+        )
+
+    def top_k(self, weights=DEFAULT_WEIGHTS, k=10, rows=None):
+        """Positions des k meilleurs scores parmi `rows` (toutes les lignes si None), du meilleur au moins bon."""
+        scores = self.scores(weights)
+        if rows is None:
+            return self._best(scores, k)
+        rows = np.asarray(rows)
+        return rows[self._best(scores[rows], k)]
+
+    def top_k_by_city(self, weights=DEFAULT_WEIGHTS, k=10, rows=None):
+        """{ville: positions de ses k meilleurs scores} parmi `rows`, villes dans l'ordre alphabétique."""
+        scores = self.scores(weights)
+        rows = self.filter_index.all_rows if rows is None else np.asarray(rows)
+        codes = self.filter_index.city_codes(rows)
+        if codes is None:
+            return {}
+        # Lignes regroupées par ville, puis un argpartition par groupe ; codes
+        # sur 16 bits quand c'est possible : numpy les trie par base (radix)
+        names = self.filter_index.city_names
+        if len(names) < np.iinfo(np.int16).max:
+            codes = codes.astype(np.int16)
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(names) + 1))
+        result = {}
+        for code in np.flatnonzero(np.diff(bounds)):
+            group = rows[order[bounds[code]:bounds[code + 1]]]
+            result[names[code]] = group[self._best(scores[group], k)]
+        return dict(sorted(result.items()))
+
+    @staticmethod
+    def _best(scores, k):
+        # argpartition isole les k plus grands en O(n) ; seuls ceux-là sont triés
+        # (décroissant, égalités dans l'ordre des positions)
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.empty(0, dtype=np.intp)
+        best = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        return best[np.lexsort((best, -scores[best]))]
+
+
+def main():
+    """Contrôle : un score fini sur [0, 100] pour le classeur et pour ses
+    variantes privées d'une colonne de critère (chaque critère absent sort du calcul)."""
+    from .filters import FilterIndex
+    from .ingestion import DEFAULT_SOURCE, load_snapshot
+
+    df = load_snapshot(DEFAULT_SOURCE)
+    variants = {"classeur": df}
+    for col in [AVIS_COL, NOTE_COL, DIGITAL_COL, AGE_COL]:
+        if col in df.columns:
+            variants[f"sans {col}"] = df.drop(columns=col)
+    failures = 0
+    for name, frame in variants.items():
+        engine = ScoringEngine(frame, FilterIndex(frame))
+        scores = engine.scores()
+        ok = bool(np.isfinite(scores).all() and (scores >= 0).all() and (scores <= 100 + 1e-3).all())
+        failures += not ok
+        print(f"{name} : {'ok' if ok else 'ÉCHEC'} ({', '.join(engine.criteria)})")
+    return failures
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
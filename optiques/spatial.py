@@ -0,0 +1,211 @@
+"""Agrégation spatiale des magasins, calculée côté serveur avec NumPy.
+
+Grille régulière adaptée à l'emprise (carte agrégée), hexagones de taille fixe
+(densité) et couverture du marché : distance de chaque optique à ses plus
+proches concurrents, par le KD-tree de optiques.distance.
+"""
+import numpy as np
+import pandas as pd
+
+from .aggregates import share
+from .config import COVERAGE_NEIGHBORS, ISOLATION_KM
+
+KM_PER_DEGREE = 111.32
+# Tailles proposées (km, du centre à un sommet) et rayons de concurrence affichés
+HEX_SIZES_KM = [1, 2, 5, 10, 20]
+COVERAGE_RADII_KM = [1, 2, 5, 10]
+# Coordonnées axiales décalées pour tenir dans une clé entière positive
+_HEX_OFFSET = 1 << 20
+
+
+def bounding_box(lat, lon):
+    """(lat_min, lat_max, lon_min, lon_max) des points valides."""
+    return (float(np.min(lat)), float(np.max(lat)), float(np.min(lon)), float(np.max(lon)))
+
+
+def grid_cell_size(lat, lon, cells_across):
+    """Taille de cellule (degrés) adaptée à l'emprise : plus la zone est petite, plus la grille est fine."""
+    lat_min, lat_max, lon_min, lon_max = bounding_box(lat, lon)
+    extent = max(lat_max - lat_min, lon_max - lon_min)
+    return max(extent / max(cells_across, 1), 1e-4)
+
+
+def grid_aggregate(lat, lon, note=None, cell_deg=0.1):
+    """Regroupe les points dans une grille régulière.
+
+    Retourne une ligne par cellule non vide : centroïde des points, nombre de
+    magasins et note Google moyenne (NaN ignorés).
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    if len(lat) == 0:
+        return pd.DataFrame(columns=["Latitude", "Longitude", "Nombre", "Note_Google"])
+
+    ix = np.floor((lat - lat.min()) / cell_deg).astype(np.int64)
+    iy = np.floor((lon - lon.min()) / cell_deg).astype(np.int64)
+    cell_keys = ix * (iy.max() + 1) + iy
+    _, cell = np.unique(cell_keys, return_inverse=True)
+    n_cells = cell.max() + 1
+
+    counts = np.bincount(cell, minlength=n_cells)
+    cells = pd.DataFrame({
+        "Latitude": np.bincount(cell, weights=lat, minlength=n_cells) / counts,
+        "Longitude": np.bincount(cell, weights=lon, minlength=n_cells) / counts,
+        "Nombre": counts,
+    })
+    if note is not None:
+        note = np.asarray(note, dtype=np.float64)
+        valid = ~np.isnan(note)
+        note_sums = np.bincount(cell[valid], weights=note[valid], minlength=n_cells)
+        note_counts = np.bincount(cell[valid], minlength=n_cells)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cells["Note_Google"] = np.round(note_sums / note_counts, 2)
+    return cells
+
+
+def map_grid(geo_df, cells_across):
+    """(cellules, taille de cellule en degrés) : grille adaptée à l'emprise des magasins géolocalisés."""
+    lat = geo_df["Latitude"].to_numpy(dtype=float)
+    lon = geo_df["Longitude"].to_numpy(dtype=float)
+    note = geo_df["Note_Google"].to_numpy(dtype=float, na_value=np.nan) if "Note_Google" in geo_df else None
+    cell_deg = grid_cell_size(lat, lon, cells_across)
+    return grid_aggregate(lat, lon, note, cell_deg), cell_deg
+
+
+# ----------------------------
+# HEXAGONES
+# ----------------------------
+# Hexagones « pointe en haut » sur une projection équirectangulaire centrée sur
+# ref_lat : réguliers à quelques % près sur ±3° de latitude (un pays comme le Maroc)
+
+def _project(lat, lon, ref_lat):
+    return lon * KM_PER_DEGREE * np.cos(np.radians(ref_lat)), lat * KM_PER_DEGREE
+
+
+def _unproject(x, y, ref_lat):
+    return y / KM_PER_DEGREE, x / (KM_PER_DEGREE * np.cos(np.radians(ref_lat)))
+
+
+def hex_area_km2(size_km):
+    return 3 * np.sqrt(3) / 2 * size_km ** 2
+
+
+def hex_cells(lat, lon, size_km, ref_lat):
+    """Clé de l'hexagone (`size_km` du centre aux sommets) de chaque point ; -1 sans coordonnées."""
+    x, y = _project(np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64), ref_lat)
+    valid = ~(np.isnan(x) | np.isnan(y))
+    q = (np.sqrt(3) / 3 * x - y / 3) / size_km
+    r = 2 / 3 * y / size_km
+    # Arrondi en coordonnées cubiques (q + r + s = 0) : la coordonnée la plus
+    # mal arrondie est recalculée à partir des deux autres
+    s = -q - r
+    round_q, round_r, round_s = np.round(q), np.round(r), np.round(s)
+    error_q, error_r, error_s = np.abs(round_q - q), np.abs(round_r - r), np.abs(round_s - s)
+    fix_q = (error_q > error_r) & (error_q > error_s)
+    fix_r = ~fix_q & (error_r > error_s)
+    round_q, round_r = np.where(fix_q, -round_r - round_s, round_q), np.where(fix_r, -round_q - round_s, round_r)
+    q = np.nan_to_num(round_q).astype(np.int64) + _HEX_OFFSET
+    r = np.nan_to_num(round_r).astype(np.int64) + _HEX_OFFSET
+    return np.where(valid, q * (2 * _HEX_OFFSET) + r, -1)
+
+
+def _hex_centers_xy(keys, size_km):
+    q = keys // (2 * _HEX_OFFSET) - _HEX_OFFSET
+    r = keys % (2 * _HEX_OFFSET) - _HEX_OFFSET
+    return size_km * np.sqrt(3) * (q + r / 2), size_km * 1.5 * r
+
+
+def hex_centers(keys, size_km, ref_lat):
+    """(latitudes, longitudes) des centres des hexagones."""
+    return _unproject(*_hex_centers_xy(np.asarray(keys, dtype=np.int64), size_km), ref_lat)
+
+
+def hex_geojson(keys, size_km, ref_lat):
+    """FeatureCollection des hexagones (id : clé), pour une carte choroplèthe."""
+    x, y = _hex_centers_xy(np.asarray(keys, dtype=np.int64), size_km)
+    # Sommets à 30° + k·60°, le premier répété pour fermer l'anneau
+    angles = np.radians(30 + 60 * np.arange(7))
+    lat, lon = _unproject(x[:, None] + size_km * np.cos(angles), y[:, None] + size_km * np.sin(angles), ref_lat)
+    rings = np.stack([lon, lat], axis=-1).round(5).tolist()
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature", "id": key, "geometry": {"type": "Polygon", "coordinates": [ring]}}
+            for key, ring in zip(np.asarray(keys).tolist(), rings)
+        ],
+    }
+
+
+class CoverageIndex:
+    """Concurrence et couverture de chaque optique, calculées une fois par version.
+
+    nearest_km : distance au concurrent le plus proche ; coverage_km : rayon qui
+    contient ses `neighbors` plus proches concurrents (plus il est petit, plus le
+    marché est dense). Les deux portent sur toutes les optiques, quels que soient
+    les filtres. Les clés d'hexagones sont calculées par taille à la première demande.
+    """
+
+    def __init__(self, distance_index, neighbors=COVERAGE_NEIGHBORS):
+        distances = distance_index.neighbor_distances(max(neighbors, 1))
+        self.nearest_km = distances[:, 0]
+        self.coverage_km = distances[:, -1]
+        self.neighbors = neighbors
+        self.lat, self.lon = distance_index.lat, distance_index.lon
+        positions = distance_index.positions
+        self.ref_lat = float(np.median(self.lat[positions])) if len(positions) else 0.0
+        self._hex_keys = {}
+
+    def hex_keys(self, size_km):
+        if size_km not in self._hex_keys:
+            self._hex_keys[size_km] = hex_cells(self.lat, self.lon, size_km, self.ref_lat)
+        return self._hex_keys[size_km]
+
+    def hex_density(self, rows, size_km):
+        """Une ligne par hexagone occupé par la sélection : centre, nombre d'optiques,
+        densité (pour 100 km²) et distance moyenne au concurrent le plus proche."""
+        rows = np.asarray(rows)
+        keys = self.hex_keys(size_km)[rows]
+        rows, keys = rows[keys >= 0], keys[keys >= 0]
+        cells, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(cells))
+        nearest = self.nearest_km[rows]
+        valid = ~np.isnan(nearest)
+        nearest_sums = np.bincount(inverse[valid], weights=nearest[valid], minlength=len(cells))
+        nearest_counts = np.bincount(inverse[valid], minlength=len(cells))
+        lat, lon = hex_centers(cells, size_km, self.ref_lat)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_nearest = np.round(nearest_sums / nearest_counts, 2)
+        return pd.DataFrame({
+            "Cellule": cells,
+            "Latitude": lat,
+            "Longitude": lon,
+            "Nombre": counts,
+            "Densité": np.round(counts / hex_area_km2(size_km) * 100, 2),
+            "Concurrent (km)": mean_nearest,
+        })
+
+    def summary(self, rows, isolation_km=ISOLATION_KM, radii=COVERAGE_RADII_KM):
+        """Indicateurs de concurrence de la sélection (optiques géolocalisées)."""
+        nearest = self.nearest_km[rows]
+        valid = ~np.isnan(nearest)
+        nearest, coverage = nearest[valid], self.coverage_km[rows][valid]
+        coverage = coverage[~np.isnan(coverage)]
+        return {
+            "n_geo": len(nearest),
+            "nearest_median": float(np.median(nearest)) if len(nearest) else np.nan,
+            "coverage_median": float(np.median(coverage)) if len(coverage) else np.nan,
+            "isolated": int((nearest > isolation_km).sum()),
+            # Part des optiques qui ont un concurrent à moins de r km
+            "within": {r: share(int((nearest <= r).sum()), len(nearest)) for r in radii},
+        }
+
+    def most_isolated(self, rows, k=10):
+        """Positions des k optiques de `rows` les plus éloignées de leur concurrent, de la plus isolée à la moins isolée."""
+        rows = np.asarray(rows)
+        rows = rows[~np.isnan(self.nearest_km[rows])]
+        k = min(k, len(rows))
+        if k <= 0:
+            return np.empty(0, dtype=np.intp)
+        nearest = self.nearest_km[rows]
+        best = np.argpartition(-nearest, k - 1)[:k] if k < len(rows) else np.arange(len(rows))
+        return rows[best[np.argsort(-nearest[best], kind="stable")]]
@@ -0,0 +1,125 @@
+"""Générateur de jeux de données synthétiques au schéma d'OPTIQUESS.xlsx.
+
+    python -m optiques.synthetic --rows 100000 --out synth.parquet
+
+Le format de sortie suit l'extension (.xlsx, .csv, .parquet). Excel est
+limité à 1 048 576 lignes : au-delà, utiliser CSV ou Parquet.
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from .distance import haversine_km
+
+# Villes (centre approximatif) et poids relatifs ; le nord domine comme dans l'échantillon
+CITIES = {
+    "Tanger": (35.7595, -5.8340, 30),
+    "Tetouan": (35.5785, -5.3684, 12),
+    "Martil": (35.6167, -5.2750, 4),
+    "M'diq": (35.6858, -5.3253, 3),
+    "Fnideq": (35.8500, -5.3575, 3),
+    "Al Hoceïma": (35.2517, -3.9372, 5),
+    "Chefchaouen": (35.1688, -5.2636, 3),
+    "Larache": (35.1932, -6.1557, 4),
+    "Ksar El-Kébir": (35.0017, -5.9053, 4),
+    "Ksar Sghir": (35.8425, -5.5586, 1),
+    "Ouazzane": (34.7936, -5.5836, 2),
+    "Casablanca": (33.5731, -7.5898, 40),
+    "Rabat": (34.0209, -6.8416, 20),
+    "Marrakech": (31.6295, -7.9811, 18),
+    "Fès": (34.0181, -5.0078, 16),
+    "Meknès": (33.8935, -5.5473, 10),
+    "Agadir": (30.4278, -9.5981, 10),
+    "Oujda": (34.6814, -1.9086, 8),
+    "Kénitra": (34.2610, -6.5802, 8),
+    "Nador": (35.1681, -2.9335, 6),
+}
+TARMIZ = (35.7595, -5.8340)
+
+# Modalités et fréquences observées dans l'échantillon
+AGES = {"5-10 ans": 177, "5-15 ans": 112, "15+ ans": 2, "0-5 ans": 2}
+DIGITAL_SCORES = {0: 4, 15: 65, 35: 79, 50: 79, 75: 50, 85: 9}
+SERVICES = "Examens vue,Lunettes,Lentilles,Montures"
+NAME_PREFIXES = ["Optique", "Centre Optique", "Vision", "Opticien", "Lunetterie"]
+NAME_SUFFIXES = ["Atlas", "Lumière", "Nour", "Medina", "Plus", "Centre", "Royal", "Vision", "Style", "Santé"]
+
+
+def generate(rows, seed=0):
+    """DataFrame brut (avant typage) de `rows` magasins synthétiques."""
+    rng = np.random.default_rng(seed)
+    names = np.array(list(CITIES))
+    weights = np.array([w for _, _, w in CITIES.values()], dtype=float)
+    city_idx = rng.choice(len(names), size=rows, p=weights / weights.sum())
+    centers = np.array([(lat, lon) for lat, lon, _ in CITIES.values()])
+
+    # Magasins dispersés autour du centre-ville (~3 km), quelques-uns plus loin
+    spread = np.where(rng.random(rows) < 0.9, 0.03, 0.15)
+    lat = centers[city_idx, 0] + rng.normal(0, 1, rows) * spread
+    lon = centers[city_idx, 1] + rng.normal(0, 1, rows) * spread
+
+    def draw(freqs):
+        p = np.array(list(freqs.values()), dtype=float)
+        return rng.choice(np.array(list(freqs)), size=rows, p=p / p.sum())
+
+    has_site = rng.random(rows) < 0.10
+    has_social = rng.random(rows) < 0.55
+    has_email = rng.random(rows) < 0.33
+    size = np.where(rng.random(rows) < 0.055, "PME", "TPE")
+    n_reviews = np.floor(rng.lognormal(1.3, 1.2, rows))
+    note = np.clip(np.round(rng.normal(4.1, 0.8, rows), 1), 1.0, 5.0)
+    note[n_reviews == 0] = np.nan
+    ids = np.arange(rows)
+
+    def sparse(mask, values):
+        return pd.Series(values).where(mask)
+
+    return pd.DataFrame({
+        "Nom": pd.Series(np.char.add(
+            np.char.add(rng.choice(NAME_PREFIXES, rows), " "),
+            np.char.add(rng.choice(NAME_SUFFIXES, rows), np.char.add(" ", ids.astype(str)))
+        )),
+        "catégorie": "Optique",
+        "Téléphone": np.char.add("+212 6", rng.integers(10_000_000, 100_000_000, rows).astype(str)),
+        "Site web": sparse(has_site, np.char.add("https://optique", np.char.add(ids.astype(str), ".ma"))),
+        "Réseaux sociaux": sparse(has_social, np.char.add("https://www.instagram.com/optique", ids.astype(str))),
+        "Email": sparse(has_email, np.char.add("contact", np.char.add(ids.astype(str), "@optique.ma"))),
+        "Ville": names[city_idx],
+        "Adresse": np.char.add(rng.integers(1, 200, rows).astype(str), np.char.add(" Rue ", names[city_idx])),
+        "Latitude": lat,
+        "Longitude": lon,
+        "Note_Google": note,
+        "Nb_Avis_Google": n_reviews,
+        "Taille_Entreprise": size,
+        "Anciennete_Estimee": draw(AGES),
+        "Services_Principaux": SERVICES,
+        "Score_Presence_Digitale": draw(DIGITAL_SCORES),
+        "Distance-TARMIZ(KM)": np.round(haversine_km(lat, lon, *TARMIZ), 2),
+        "A TEL": (rng.random(rows) < 0.4).astype(int),
+        "A EMAIL": has_email.astype(int),
+    })
+
+
+def write(df, path):
+    path = str(path)
+    if path.endswith(".xlsx"):
+        df.to_excel(path, index=False, engine="openpyxl")
+    elif path.endswith(".csv"):
+        df.to_csv(path, index=False)
+    elif path.endswith(".parquet"):
+        df.to_parquet(path, index=False)
+    else:
+        raise ValueError(f"Format non supporté : {path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", required=True, help="fichier .xlsx, .csv ou .parquet")
+    args = parser.parse_args(argv)
+    write(generate(args.rows, args.seed), args.out)
+
+
+if __name__ == "__main__":
+    main()
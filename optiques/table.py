@@ -0,0 +1,141 @@
+"""Tableau paginé côté serveur : tri pré-calculé et recherche plein texte.
+
+Les ordres de tri et l'index de recherche sont construits une fois par
+version du jeu de données ; une page ne coûte ensuite qu'un masque sur des
+positions déjà triées, et seules les lignes de la page partent au navigateur.
+"""
+import unicodedata
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Colonnes triables (plus la colonne de distance de la référence choisie)
+SORT_COLS = ["Note_Google", "Nb_Avis_Google", "Score_Presence_Digitale"]
+SEARCH_COLS = ["Nom", "Ville"]
+PAGE_SIZES = [25, 50, 100, 250, 500]
+_SEPARATORS = r"[^\p{L}\p{N}]+"
+
+
+def fold(word):
+    """Mot sans diacritiques (« fès » -> « fes »)."""
+    return "".join(c for c in unicodedata.normalize("NFKD", word) if not unicodedata.combining(c))
+
+
+def split_words(values):
+    """(parents, ids, vocabulaire) : mots en minuscules sans accents de chaque valeur.
+
+    Le mot i de la valeur parents[i] est vocabulaire[ids[i]]. Découpage
+    vectorisé par pyarrow ; les accents ne sont retirés que sur les mots
+    distincts non ASCII, pas sur chaque occurrence.
+    """
+    values = pa.array(pd.Series(values, dtype=object).astype("string"), type=pa.string())
+    split = pc.split_pattern_regex(pc.utf8_lower(values), _SEPARATORS)
+    parents = pc.list_parent_indices(split).to_numpy()
+    encoded = pc.dictionary_encode(pc.list_flatten(split))
+    vocabulary = encoded.dictionary.to_numpy(zero_copy_only=False)
+    for i in np.flatnonzero(~pc.string_is_ascii(encoded.dictionary).to_numpy(zero_copy_only=False)):
+        vocabulary[i] = fold(vocabulary[i])
+    ids = encoded.indices.to_numpy()
+    keep = vocabulary[ids] != ""
+    return parents[keep], ids[keep], vocabulary
+
+
+def tokenize(text):
+    _, ids, vocabulary = split_words([text])
+    return list(vocabulary[ids])
+
+
+def _sorted_unique(values):
+    # np.unique passe par une table de hachage sur les entiers : un tri est plus rapide ici
+    values = np.sort(values)
+    return values[np.r_[True, values[1:] != values[:-1]]] if len(values) else values
+
+
+class SortIndex:
+    """Positions triées par valeur décroissante (NaN en fin, égalités dans l'ordre du fichier)."""
+
+    def __init__(self, df, columns):
+        self._order = {}
+        for col in columns:
+            if col in df.columns:
+                values = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+                # -NaN reste NaN, que argsort range en dernier
+                self._order[col] = np.argsort(-values, kind="stable")
+
+    def has(self, col):
+        return col in self._order
+
+    def order(self, col):
+        return self._order[col]
+
+
+class SearchIndex:
+    """Index inversé mot -> positions sur les colonnes texte.
+
+    Les mots (lettres et chiffres, minuscules, sans accents) sont triés : les mots qui commencent
+    par un terme forment une plage contiguë, dont les positions sont lues
+    d'un seul bloc. Plusieurs termes : intersection (ET).
+    """
+
+    def __init__(self, df, columns=SEARCH_COLS):
+        self.n_rows = len(df)
+        row_parts, id_parts, vocabularies = [], [], []
+        for col in columns:
+            if col not in df.columns:
+                continue
+            # Découpage une fois par valeur distincte (villes répétées, noms uniques)
+            codes, uniques = pd.factorize(df[col])
+            parents, ids, vocabulary = split_words(np.asarray(uniques, dtype=object))
+            # Chaque (valeur, mot) vaut pour toutes les lignes de cette valeur
+            order = np.argsort(codes, kind="stable")
+            counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+            starts = np.searchsorted(codes[order], np.arange(len(uniques)))
+            repeat = counts[parents]
+            first = np.repeat(starts[parents], repeat)
+            within = np.arange(repeat.sum()) - np.repeat(np.cumsum(repeat) - repeat, repeat)
+            row_parts.append(order[first + within])
+            # Identifiants décalés : vocabulaires des colonnes mis bout à bout
+            id_parts.append(np.repeat(ids, repeat) + sum(len(v) for v in vocabularies))
+            vocabularies.append(vocabulary)
+        rows = np.concatenate(row_parts) if row_parts else np.empty(0, dtype=np.intp)
+        ids = np.concatenate(id_parts) if id_parts else np.empty(0, dtype=np.int64)
+
+        # Vocabulaire commun trié : un code par mot distinct
+        vocab_codes, vocabulary = pd.factorize(
+            np.concatenate(vocabularies) if vocabularies else np.empty(0, dtype=object), sort=True
+        )
+        n = max(self.n_rows, 1)
+        keys = _sorted_unique(vocab_codes[ids].astype(np.int64) * n + rows)
+        self.vocabulary = np.asarray(vocabulary, dtype=object)
+        # Positions groupées par mot, croissantes dans chaque groupe
+        self._rows = (keys % n).astype(np.intp)
+        self._offsets = np.searchsorted(keys // n, np.arange(len(self.vocabulary) + 1))
+
+    def search(self, query):
+        """Positions (croissantes) des lignes dont un mot commence par chaque terme ; None si requête vide."""
+        result = None
+        for term in tokenize(query):
+            # Mots commençant par term : de term à term + le plus grand caractère
+            start = np.searchsorted(self.vocabulary, term, side="left")
+            stop = np.searchsorted(self.vocabulary, term + "\U0010ffff", side="left")
+            matched = _sorted_unique(self._rows[self._offsets[start]:self._offsets[stop]])
+            result = matched if result is None else np.intersect1d(result, matched, assume_unique=True)
+        return result
+
+
+def sorted_rows(order, rows, n_rows):
+    """Positions `rows` dans l'ordre de `order` (permutation de toutes les lignes)."""
+    if len(rows) == n_rows:
+        return order
+    mask = np.zeros(n_rows, dtype=bool)
+    mask[rows] = True
+    return order[mask[order]]
+
+
+def page_bounds(n_rows, page, page_size):
+    """(début, fin) de la page (numérotée à partir de 1), bornée au nombre de pages."""
+    n_pages = max(1, -(-n_rows // page_size))
+    start = (min(max(page, 1), n_pages) - 1) * page_size
+    return start, min(start + page_size, n_rows)
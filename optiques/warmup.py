@@ -0,0 +1,115 @@
+"""Préchauffage en arrière-plan des caches pour les sélections fréquentes.
+
+Après chaque chargement (et chaque nouvelle version du jeu de données), un
+thread calcule pour « Toutes » et les N villes les plus représentées, curseurs
+aux valeurs par défaut : vue filtrée, agrégats, corrélations, couverture du
+marché et figures des onglets avec les options par défaut. Les clés sont celles qu'utilise le
+script : le premier utilisateur à choisir ces villes trouve tout en cache.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import MAP_GRID_CELLS, MAP_POINT_LIMIT, WARMUP_CITIES
+from .core import ALL_CITIES, city_filter, default_ranges, filter_key, select
+from .correlation import CORRELATION_METHODS
+from .figures import (
+    COLOR_THEMES, age_histogram_figure, age_scatter_figure, correlation_figure, digital_scatter_figure,
+    map_cells_figure, map_points_figure, performance_figure, score_distribution_figure, size_pie_figure
+)
+from .filters import NOTE_COL
+from .spatial import map_grid
+
+
+def page_figures(df, df_filtered, agg, distance_col, correlation_matrix, figure_cache, key,
+                 color_theme=COLOR_THEMES[0]):
+    """Figures des onglets avec les options par défaut, sous les clés de cached_figure."""
+    def build(name, builder, *variant):
+        figure_cache.get_or_compute((name, key) + variant, builder)
+
+    if {"Latitude", "Longitude"}.issubset(df.columns):
+        geo_df = df_filtered.dropna(subset=["Latitude", "Longitude"])
+        if 0 < len(geo_df) <= MAP_POINT_LIMIT:
+            build("map_points", lambda: map_points_figure(geo_df, color_theme), color_theme)
+        elif len(geo_df) > 0:
+            cells, _ = figure_cache.get_or_compute(("map_grid", key), lambda: map_grid(geo_df, MAP_GRID_CELLS))
+            build("map_cells", lambda: map_cells_figure(cells, color_theme), color_theme)
+    if NOTE_COL in df.columns:
+        build("performance", lambda: performance_figure(
+            df_filtered, agg["top5_city_notes"], distance_col, histograms=agg["histograms"]
+        ))
+    if "Score_Presence_Digitale" in df.columns:
+        build("score_distribution", lambda: score_distribution_figure(df_filtered, agg["histograms"]))
+        if NOTE_COL in df.columns:
+            build("digital_scatter", lambda: digital_scatter_figure(df_filtered))
+    if correlation_matrix is not None and len(correlation_matrix.columns) > 1:
+        method = next(iter(CORRELATION_METHODS.values()))
+        build("correlation", lambda: correlation_figure(df_filtered, color_theme, correlation_matrix),
+              color_theme, method, False)
+    if "Taille_Entreprise" in df.columns:
+        build("size_pie", lambda: size_pie_figure(df_filtered))
+    if "Anciennete_Estimee" in df.columns:
+        build("age_histogram", lambda: age_histogram_figure(df_filtered, agg["histograms"]))
+        if NOTE_COL in df.columns:
+            build("age_scatter", lambda: age_scatter_figure(df_filtered))
+
+
+class CacheWarmer:
+    """Un thread de fond, un préchauffage par version du jeu de données."""
+
+    def __init__(self, dataset, top_n=WARMUP_CITIES):
+        self.dataset = dataset
+        self.top_n = top_n
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="optiques-warmup")
+        self._lock = threading.Lock()
+        self._scheduled = set()
+        # Dernier préchauffage : version, état, sélections traitées, durée
+        self.last_run = None
+
+    def schedule(self, state, figure_cache):
+        """Lance le préchauffage de `state` s'il n'a pas déjà été demandé ; sans attente."""
+        if self.top_n < 0:
+            return None
+        with self._lock:
+            if state.version in self._scheduled:
+                return None
+            self._scheduled.add(state.version)
+        return self._executor.submit(self.warm, state, figure_cache)
+
+    def selections(self, state):
+        """Villes à préchauffer : « Toutes » puis les top_n plus représentées."""
+        note_range, max_distance = default_ranges(state.filter_index)
+        city_counts = state.aggregates.get(None, note_range, max_distance)["city_counts"]
+        return [ALL_CITIES] + list(city_counts.index[:self.top_n])
+
+    def warm(self, state, figure_cache):
+        start = time.perf_counter()
+        self.last_run = {"version": state.version, "status": "en cours", "selections": 0, "seconds": None}
+        try:
+            note_range, max_distance = default_ranges(state.filter_index)
+            correlations = self.dataset.correlations(state)
+            self.dataset.coverage(state)
+            for city in self.selections(state):
+                # Une version plus récente est installée : inutile de continuer
+                if self.dataset.state.version != state.version:
+                    self.last_run["status"] = "interrompu"
+                    break
+                self.warm_selection(state, figure_cache, correlations, city, note_range, max_distance)
+                self.last_run["selections"] += 1
+            else:
+                self.last_run["status"] = "terminé"
+        except Exception as e:  # le préchauffage ne doit jamais gêner l'application
+            self.last_run["status"] = f"erreur : {e}"
+        self.last_run["seconds"] = time.perf_counter() - start
+        return self.last_run
+
+    def warm_selection(self, state, figure_cache, correlations, city, note_range, max_distance):
+        selected_city = city_filter(city)
+        key = filter_key(city, note_range, max_distance)
+        rows, agg = select(state, city, note_range, max_distance)
+        df_filtered = self.dataset.view(state, key, rows)
+        correlation_matrix = None
+        if len(correlations.columns) > 1:
+            correlation_matrix = correlations.get(selected_city, note_range, max_distance, rows=rows)
+        page_figures(state.df, df_filtered, agg, state.filter_index.distance_col, correlation_matrix,
+                     figure_cache, key)
@@ -1,10 +1,31 @@
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import streamlit as st
 import numpy as np
+from concurrent.futures import wait
 from datetime import datetime
+from uuid import uuid4
+
+from optiques.aggregates import share
+from optiques.cache import LRUCache
+from optiques import core
+from optiques.config import (
+    COVERAGE_NEIGHBORS, DEBUG_PANEL, ISOLATION_KM, MAP_GRID_CELLS, MAP_HEX_LIMIT, MAP_POINT_LIMIT,
+    SCATTER_POINT_LIMIT, SCORE_PRIOR_REVIEWS
+)
+from optiques.correlation import CORRELATION_METHODS
+from optiques.figures import (
+    COLOR_THEMES, age_histogram_figure, age_scatter_figure, correlation_figure, digital_channels_figure,
+    digital_pie_figure, digital_scatter_figure, map_cells_figure, map_hex_figure, map_points_figure,
+    performance_figure, score_distribution_figure, size_pie_figure, top_cities_figure
+)
+from optiques.export import EXPORT_FORMATS, export_bytes, export_file_name
+from optiques.filters import DISTANCE_COL, NOTE_COL, filter_frame
+from optiques.ingestion import DEFAULT_SOURCE, read_summary
+from optiques.profiling import fragment_run, profiled, stage, start_run
+from optiques.scoring import CRITERIA, DEFAULT_WEIGHTS
+from optiques.spatial import HEX_SIZES_KM, KM_PER_DEGREE, hex_geojson, map_grid
+from optiques.table import PAGE_SIZES, SORT_COLS, page_bounds
+from optiques.warmup import CacheWarmer
 
 # ----------------------------
 # CONFIGURATION DE LA PAGE
@@ -16,6 +37,11 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Mesures par étape de ce rerun (panneau de debug et log JSON lines)
+if "session_id" not in st.session_state:
+    st.session_state["session_id"] = uuid4().hex[:12]
+profiler = start_run(st.session_state["session_id"])
+
 # ----------------------------
 # CSS PERSONNALISÉ
 # ----------------------------
@@ -87,24 +113,81 @@ st.markdown("""
 # ----------------------------
 # CHARGEMENT DES DONNÉES
 # ----------------------------
-@st.cache_data
+@st.cache_resource
+def get_dataset():
+    # Jeu de données, index et agrégats partagés par le processus (et l'API) ;
+    # les lignes ajoutées ou modifiées dans le classeur sont intégrées en place
+    return core.shared_dataset(DEFAULT_SOURCE)
+
+# Widgets de la sidebar : mêmes paramètres pendant et après le chargement, donc
+# même identifiant Streamlit, et les choix faits pendant l'attente sont conservés
+def city_widget(cities):
+    return st.sidebar.selectbox("🏙️ Filtrer par ville", [core.ALL_CITIES] + cities)
+
+def note_widget(note_min, note_max):
+    return st.sidebar.slider("⭐ Plage de notes Google", note_min, note_max, (note_min, note_max), step=0.1)
+
+def reference_widget():
+    return st.sidebar.selectbox("📌 Référence des distances", core.reference_options())
+
+def distance_widget(reference, distance_max):
+    return st.sidebar.slider(f"📍 Distance max de {reference} (km)", 0.0, distance_max, distance_max)
+
+def render_loading(loading):
+    """Premier affichage sans les données : sidebar et chiffres du résumé écrit avec
+    le snapshot, puis attente du chargement (thread de fond) et rerun complet."""
+    summary = read_summary(DEFAULT_SOURCE)
+    if summary is not None:
+        st.sidebar.markdown("## 🔍 Filtres et Options")
+        city_widget(summary["cities"])
+        if NOTE_COL in summary["bounds"]:
+            note_widget(*summary["bounds"][NOTE_COL])
+        if {"Latitude", "Longitude"}.issubset(summary["columns"]):
+            reference = reference_widget()
+        else:
+            reference = core.DEFAULT_REFERENCE
+        # Autre référence : bornes de distance inconnues avant le calcul des distances
+        if reference == core.DEFAULT_REFERENCE and DISTANCE_COL in summary["bounds"]:
+            distance_widget(reference, summary["bounds"][DISTANCE_COL][1])
+
+        st.markdown("## 📊 Métriques Clés")
+        col1, col2 = st.columns(2)
+        col1.metric("📊 Total Optiques", summary["rows"])
+        col2.metric("🏙️ Villes", len(summary["cities"]))
+    with stage("attente_chargement"), \
+            st.spinner("⏳ Chargement des données… les onglets s'affichent dès qu'elles sont prêtes"):
+        wait([loading])
+    # Le rerun interrompt le script : ce run (attente comprise) est clos ici
+    profiler.finish()
+    st.rerun()
+
+@profiled("chargement", rows=lambda state: len(state.df))
 def load_data():
     try:
-        df = pd.read_excel('OPTIQUESS.xlsx', engine='openpyxl')
-        
-        # Nettoyage des colonnes numériques
-        numeric_cols = ["Note_Google", "Nb_Avis_Google", "Score_Presence_Digitale",
-                       "Distance-TARMIZ(KM)", "Anciennete_Estimee"]
-        for col in numeric_cols:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors="coerce")
-        
-        return df
+        dataset = get_dataset()
+        dataset.refresh()
+        return dataset.state
     except Exception as e:
         st.error(f"Erreur de chargement: {e}")
         return None
 
-df = load_data()
+@st.cache_resource(max_entries=2)
+def get_figure_cache(version):
+    # Figures par (onglet, état de filtre), bornées en nombre et en mémoire
+    return LRUCache(max_entries=128, max_bytes=128 * 1024 * 1024)
+
+@st.cache_resource
+def get_warmer():
+    # Thread de préchauffage partagé : une passe par nouvelle version des données
+    return CacheWarmer(get_dataset())
+
+# Chargement en arrière-plan : tant qu'il dure, la page s'affiche depuis le résumé
+loading = core.load_in_background(DEFAULT_SOURCE)
+if not loading.done():
+    render_loading(loading)
+
+data = load_data()
+df = data.df if data is not None else None
 
 if df is not None:
     # ----------------------------
@@ -112,50 +195,54 @@ if df is not None:
     # ----------------------------
     st.sidebar.markdown("## 🔍 Filtres et Options")
     
+    version = data.version
+    filter_index = data.filter_index
+    
+    # Préchauffage en arrière-plan de « Toutes » et des villes principales
+    get_warmer().schedule(data, get_figure_cache(version))
+
     # Filtre par ville
-    cities = ['Toutes'] + sorted(df['Ville'].dropna().unique().tolist())
-    selected_city = st.sidebar.selectbox("🏙️ Filtrer par ville", cities)
+    selected_city = city_widget(filter_index.cities)
     
     # Filtre par note
-    if 'Note_Google' in df.columns:
-        note_range = st.sidebar.slider(
-            "⭐ Plage de notes Google",
-            float(df['Note_Google'].min()),
-            float(df['Note_Google'].max()),
-            (float(df['Note_Google'].min()), float(df['Note_Google'].max())),
-            step=0.1
-        )
+    note_range = None
+    if filter_index.has('Note_Google'):
+        note_range = note_widget(*filter_index.bounds('Note_Google'))
+    
+    # Point de référence des distances (TARMIZ = colonne du classeur)
+    reference = core.DEFAULT_REFERENCE
+    reference_point = None
+    if {"Latitude","Longitude"}.issubset(df.columns):
+        reference = reference_widget()
+        
+        custom_point = None
+        if reference == core.CUSTOM_POINT:
+            custom_point = (
+                st.sidebar.number_input("Latitude", -90.0, 90.0, float(df['Latitude'].median()), format="%.5f"),
+                st.sidebar.number_input("Longitude", -180.0, 180.0, float(df['Longitude'].median()), format="%.5f")
+            )
+        reference_point = core.reference_point(reference, custom_point)
+        
+        with stage("référence", rows=len(df)):
+            data = core.reference_state(get_dataset(), data, reference, custom_point)
+        df = data.df
+        filter_index = data.filter_index
+    distance_col = filter_index.distance_col
     
     # Filtre par distance
-    if 'Distance-TARMIZ(KM)' in df.columns:
-        max_distance = st.sidebar.slider(
-            "📍 Distance max de TARMIZ (km)",
-            0.0,
-            float(df['Distance-TARMIZ(KM)'].max()),
-            float(df['Distance-TARMIZ(KM)'].max())
-        )
-    
-    # Application des filtres
-    df_filtered = df.copy()
-    
-    if selected_city != 'Toutes':
-        df_filtered = df_filtered[df_filtered['Ville'] == selected_city]
-    
-    if 'Note_Google' in df.columns:
-        df_filtered = df_filtered[
-            (df_filtered['Note_Google'] >= note_range[0]) & 
-            (df_filtered['Note_Google'] <= note_range[1])
-        ]
-    
-    if 'Distance-TARMIZ(KM)' in df.columns:
-        df_filtered = df_filtered[df_filtered['Distance-TARMIZ(KM)'] <= max_distance]
-    
-    # Options d'affichage
-    st.sidebar.markdown("## 🎨 Options d'affichage")
-    color_theme = st.sidebar.selectbox(
-        "Thème de couleurs",
-        ["Viridis", "Plasma", "Inferno", "Magma", "Cividis"]
-    )
+    max_distance = None
+    if filter_index.has(distance_col):
+        max_distance = distance_widget(reference, filter_index.bounds(distance_col)[1])
+    
+    # Application des filtres (positions pré-indexées, sans copie du DataFrame)
+    with stage("filtres") as record:
+        filtered_rows = core.selected_rows(data, selected_city, note_range, max_distance)
+        # Sélection complète (référence incluse) : clé des vues et figures partagées
+        filter_key = core.filter_key(selected_city, note_range, max_distance, reference, reference_point)
+        df_filtered = get_dataset().view(data, filter_key, filtered_rows)
+        record["rows"] = len(filtered_rows)
+    with stage("agrégats", rows=len(filtered_rows)):
+        agg = core.aggregates(data, selected_city, note_range, max_distance, rows=filtered_rows)
     
     # ----------------------------
     # MÉTRIQUES PRINCIPALES
@@ -165,7 +252,7 @@ if df is not None:
     col1, col2, col3, col4, col5 = st.columns(5)
     
     with col1:
-        total_optiques = len(df_filtered)
+        total_optiques = agg['n_rows']
         st.markdown(f"""
         <div class="metric-card">
             <div class="metric-value">{total_optiques}</div>
@@ -175,7 +262,7 @@ if df is not None:
     
     with col2:
         if 'Note_Google' in df.columns:
-            avg_note = df_filtered['Note_Google'].mean()
+            avg_note = agg['note_mean']
             st.markdown(f"""
             <div class="metric-card">
                 <div class="metric-value">{avg_note:.2f}</div>
@@ -185,7 +272,7 @@ if df is not None:
     
     with col3:
         if 'Site web' in df.columns:
-            web_presence = (df_filtered['Site web'].notna().sum() / len(df_filtered)) * 100
+            web_presence = share(agg['channels']['Site web'], agg['n_rows'])
             st.markdown(f"""
             <div class="metric-card">
                 <div class="metric-value">{web_presence:.1f}%</div>
@@ -194,18 +281,18 @@ if df is not None:
             """, unsafe_allow_html=True)
     
     with col4:
-        if 'Distance-TARMIZ(KM)' in df.columns:
-            avg_distance = df_filtered['Distance-TARMIZ(KM)'].mean()
+        if distance_col in df.columns:
+            avg_distance = agg['distance_mean']
             st.markdown(f"""
             <div class="metric-card">
                 <div class="metric-value">{avg_distance:.1f}</div>
-                <div class="metric-label">📍 Distance Moy. TARMIZ</div>
+                <div class="metric-label">📍 Distance Moy. {reference}</div>
             </div>
             """, unsafe_allow_html=True)
     
     with col5:
         if 'Score_Presence_Digitale' in df.columns:
-            avg_digital = df_filtered['Score_Presence_Digitale'].mean()
+            avg_digital = agg['digital_mean']
             st.markdown(f"""
             <div class="metric-card">
                 <div class="metric-value">{avg_digital:.0f}</div>
@@ -216,417 +303,500 @@ if df is not None:
     # ----------------------------
     # ONGLETS PRINCIPAUX
     # ----------------------------
-    tab1, tab2, tab3, tab4, tab5 = st.tabs([
+    # st.tabs exécute tous les onglets à chaque rerun : seul l'onglet actif est calculé ici
+    TABS = [
         "🌍 Géographie", 
         "⭐ Performance", 
         "📱 Digital", 
         "📊 Analytics", 
         "📋 Données"
-    ])
-    
-    with tab1:
-        st.markdown('<div class="section-header"><h3>🌍 Analyse Géographique</h3></div>', 
-                   unsafe_allow_html=True)
-        
-        col1, col2 = st.columns([2, 1])
-        
-        with col1:
-            # Carte géographique améliorée
-            if {"Latitude","Longitude"}.issubset(df.columns):
-                geo_df = df_filtered.dropna(subset=["Latitude","Longitude"])
-                if len(geo_df) > 0:
-                    fig_map = px.scatter_mapbox(
-                        geo_df,
-                        lat="Latitude",
-                        lon="Longitude",
-                        hover_name="Nom",
-                        hover_data=["Ville","Note_Google","Nb_Avis_Google"],
-                        color="Note_Google",
-                        size="Nb_Avis_Google",
-                        color_continuous_scale=color_theme,
-                        mapbox_style="open-street-map",
-                        height=600,
-                        title="🗺️ Répartition Géographique Interactive"
-                    )
-                    fig_map.update_layout(
-                        title_font_size=16,
-                        title_x=0.5,
-                        margin=dict(t=50, b=0, l=0, r=0)
-                    )
-                    st.plotly_chart(fig_map, use_container_width=True)
-        
-        with col2:
-            # Top villes avec style amélioré
-            st.markdown("### 🏆 Top 10 Villes")
-            top_cities = df_filtered["Ville"].value_counts().head(10)
-            fig_cities = px.bar(
-                y=top_cities.index,
-                x=top_cities.values,
-                orientation='h',
-                color=top_cities.values,
-                color_continuous_scale=color_theme,
-                title="Nombre d'optiques par ville"
-            )
-            fig_cities.update_layout(
-                height=400,
-                showlegend=False,
-                title_font_size=14
-            )
-            st.plotly_chart(fig_cities, use_container_width=True)
-            
-            # Statistiques géographiques
-            st.markdown("### 📈 Stats Géo")
-            total_cities = df_filtered['Ville'].nunique()
-            st.metric("🏙️ Villes couvertes", total_cities)
-            
-            if len(top_cities) > 0:
-                concentration = (top_cities.iloc[0] / len(df_filtered)) * 100
-                st.metric("🎯 Concentration", f"{concentration:.1f}%")
-    
-    with tab2:
-        st.markdown('<div class="section-header"><h3>⭐ Analyse de Performance</h3></div>', 
-                   unsafe_allow_html=True)
+    ]
+    # Calques de la carte : magasins (points ou grille), puis hexagones de densité / d'isolement
+    MAP_LAYERS = ["Optiques", "Densité", "Isolement"]
+    # Fragment : un widget des onglets (onglet actif, thème, options, tableau)
+    # ne relance que cette section ; filtres, agrégats et métriques du dernier
+    # rerun complet sont réutilisés tels quels
+    @st.fragment
+    def render_tabs():
+        col_tabs, col_theme = st.columns([4, 1])
+        with col_tabs:
+            active_tab = st.radio("Onglet", TABS, horizontal=True, label_visibility="collapsed", key="active_tab")
+        with col_theme:
+            color_theme = st.selectbox("🎨 Thème de couleurs", COLOR_THEMES, label_visibility="collapsed")
         
-        if 'Note_Google' in df.columns:
-            # Dashboard des notes avec sous-graphiques
-            fig_perf = make_subplots(
-                rows=2, cols=3,
-                subplot_titles=(
-                    "Distribution des Notes", 
-                    "Notes vs Nombre d'Avis",
-                    "Top 5 Villes - Notes Moyennes",
-                    "Évolution par Score Digital",
-                    "Distribution Nb d'Avis",
-                    "Performance par Distance"
-                ),
-                specs=[[{"type": "histogram"}, {"type": "scatter"}, {"type": "bar"}],
-                       [{"type": "scatter"}, {"type": "histogram"}, {"type": "scatter"}]]
-            )
-            
-            # Distribution des notes
-            fig_perf.add_trace(
-                go.Histogram(x=df_filtered["Note_Google"].dropna(), 
-                           nbinsx=20, name="Notes", marker_color='lightblue'),
-                row=1, col=1
-            )
+        figure_cache = get_figure_cache(version)
+        
+        def cached_figure(name, build, *variant):
+            # Figure construite une fois par (onglet, état de filtre, options d'affichage)
+            def timed_build():
+                with stage(f"figure.{name}", rows=len(df_filtered)):
+                    return build()
+            return figure_cache.get_or_compute((name, filter_key) + variant, timed_build)
+        
+        # Temps de l'onglet actif : calculs, figures et sérialisation vers le navigateur
+        # (mesure à part lors d'un rerun du fragment seul)
+        with fragment_run(st.session_state["session_id"]), \
+                stage(f"onglet.{active_tab.split(' ', 1)[1]}", rows=len(df_filtered)):
+            if active_tab == TABS[0]:
+                st.markdown('<div class="section-header"><h3>🌍 Analyse Géographique</h3></div>', 
+                           unsafe_allow_html=True)
+        
+                col1, col2 = st.columns([2, 1])
+        
+                with col1:
+                    # Carte géographique améliorée
+                    if {"Latitude","Longitude"}.issubset(df.columns):
+                        map_layer = st.radio("Calque", MAP_LAYERS, horizontal=True)
+                        if map_layer == MAP_LAYERS[0]:
+                            map_mode = st.radio(
+                                "Affichage de la carte",
+                                ["Auto", "Points", "Grille"],
+                                horizontal=True,
+                                help=f"Auto : points individuels jusqu'à {MAP_POINT_LIMIT} magasins, grille agrégée au-delà"
+                            )
+                        else:
+                            hex_size = st.select_slider("Taille des hexagones (km)", HEX_SIZES_KM, value=5)
+                        geo_df = df_filtered.dropna(subset=["Latitude","Longitude"])
+                        show_points = map_layer == MAP_LAYERS[0] and (
+                            map_mode == "Points" or (map_mode == "Auto" and len(geo_df) <= MAP_POINT_LIMIT)
+                        )
+                        if len(geo_df) > 0 and map_layer != MAP_LAYERS[0]:
+                            # Hexagones de la sélection ; taille supérieure si trop nombreux pour le navigateur
+                            coverage = get_dataset().coverage(data)
+                            def timed_hexagons():
+                                with stage("hexagones_carte", rows=len(geo_df)):
+                                    for size in [s for s in HEX_SIZES_KM if s >= hex_size]:
+                                        cells = coverage.hex_density(filtered_rows, size)
+                                        if len(cells) <= MAP_HEX_LIMIT:
+                                            break
+                                    return cells, size
+                            hex_cells, shown_size = figure_cache.get_or_compute(
+                                ("map_hexagons", filter_key, hex_size), timed_hexagons
+                            )
+                            color_col = "Densité" if map_layer == MAP_LAYERS[1] else "Concurrent (km)"
+                            fig_map = cached_figure(
+                                "map_hexagons", lambda: map_hex_figure(
+                                    hex_cells, hex_geojson(hex_cells["Cellule"], shown_size, coverage.ref_lat),
+                                    color_col, color_theme, f"🗺️ {map_layer}"
+                                ), hex_size, color_col, color_theme
+                            )
+                            st.plotly_chart(fig_map, use_container_width=True)
+                            st.caption(
+                                f"⬡ {len(geo_df)} optiques dans {len(hex_cells)} hexagones de {shown_size} km"
+                                + (f" (agrandis : plus de {MAP_HEX_LIMIT} hexagones à {hex_size} km)"
+                                   if shown_size != hex_size else "")
+                                + ". Densité en optiques pour 100 km² ; distance au concurrent le plus proche "
+                                  "mesurée sur toutes les optiques, quels que soient les filtres."
+                            )
+                        elif len(geo_df) > 0 and show_points:
+                            fig_map = cached_figure("map_points", lambda: map_points_figure(geo_df, color_theme), color_theme)
+                            st.plotly_chart(fig_map, use_container_width=True)
+                        elif len(geo_df) > 0:
+                            # Agrégation serveur : une bulle par cellule (nombre + note moyenne)
+                            # Grille adaptée à l'emprise, calculée une fois par état de filtre
+                            def timed_grid():
+                                with stage("grille_carte", rows=len(geo_df)):
+                                    return map_grid(geo_df, MAP_GRID_CELLS)
+                            map_cells, cell_deg = figure_cache.get_or_compute(("map_grid", filter_key), timed_grid)
+                            fig_map = cached_figure("map_cells", lambda: map_cells_figure(map_cells, color_theme), color_theme)
+                            st.plotly_chart(fig_map, use_container_width=True)
+                            st.caption(
+                                f"🔎 {len(geo_df)} optiques regroupées en {len(map_cells)} cellules "
+                                f"d'environ {cell_deg * KM_PER_DEGREE:.1f} km. Filtrez par ville ou distance "
+                                f"pour afficher les points individuels."
+                            )
+        
+                with col2:
+                    # Top villes avec style amélioré
+                    st.markdown("### 🏆 Top 10 Villes")
+                    top_cities = agg["city_counts"].head(10)
+                    fig_cities = top_cities_figure(top_cities, color_theme)
+                    st.plotly_chart(fig_cities, use_container_width=True)
             
-            # Notes vs Nb d'avis
-            fig_perf.add_trace(
-                go.Scatter(x=df_filtered["Note_Google"], y=df_filtered["Nb_Avis_Google"],
-                          mode="markers", name="Performance", 
-                          marker=dict(color='orange', size=6)),
-                row=1, col=2
-            )
+                    # Statistiques géographiques
+                    st.markdown("### 📈 Stats Géo")
+                    total_cities = agg['n_cities']
+                    st.metric("🏙️ Villes couvertes", total_cities)
             
-            # Top 5 villes - notes moyennes
-            top5_cities = df_filtered["Ville"].value_counts().head(5).index
-            city_notes = df_filtered[df_filtered["Ville"].isin(top5_cities)].groupby("Ville")["Note_Google"].mean()
-            fig_perf.add_trace(
-                go.Bar(x=city_notes.index, y=city_notes.values, 
-                      name="Moyenne", marker_color='green'),
-                row=1, col=3
-            )
+                    if len(top_cities) > 0:
+                        concentration = share(top_cities.iloc[0], agg['n_rows'])
+                        st.metric("🎯 Concentration", f"{concentration:.1f}%")
             
-            # Score digital vs notes
-            if "Score_Presence_Digitale" in df.columns:
-                fig_perf.add_trace(
-                    go.Scatter(x=df_filtered["Score_Presence_Digitale"], 
-                             y=df_filtered["Note_Google"],
-                             mode="markers", name="Digital vs Note",
-                             marker=dict(color='purple', size=6)),
-                    row=2, col=1
-                )
+                    # Concurrence : plus proche concurrent et rayon de couverture (KD-tree, par version)
+                    if {"Latitude","Longitude"}.issubset(df.columns):
+                        coverage = get_dataset().coverage(data)
+                        coverage_stats = coverage.summary(filtered_rows)
+                        if coverage_stats["n_geo"] > 0:
+                            st.markdown("### 🧭 Concurrence")
+                            st.metric("📏 Concurrent le plus proche (médiane)", f"{coverage_stats['nearest_median']:.2f} km")
+                            isolated = coverage_stats["isolated"]
+                            st.metric(
+                                f"🏝️ Isolées (> {ISOLATION_KM} km)",
+                                f"{isolated} ({share(isolated, coverage_stats['n_geo']):.1f}%)",
+                                help="Optiques sans concurrent à moins de cette distance : zones peu desservies"
+                            )
+                            if not np.isnan(coverage_stats["coverage_median"]):
+                                st.metric(
+                                    "🎯 Rayon de couverture (médiane)", f"{coverage_stats['coverage_median']:.2f} km",
+                                    help=f"Distance des {COVERAGE_NEIGHBORS} concurrents les plus proches"
+                                )
+                            st.dataframe(
+                                pd.DataFrame({
+                                    "Rayon": [f"{r} km" for r in coverage_stats["within"]],
+                                    "Avec un concurrent": [f"{v:.1f}%" for v in coverage_stats["within"].values()]
+                                }),
+                                use_container_width=True,
+                                hide_index=True
+                            )
+                            st.markdown("### 🏝️ Les plus isolées")
+                            isolated_rows = coverage.most_isolated(filtered_rows, k=10)
+                            st.dataframe(
+                                pd.DataFrame({
+                                    "Nom": df["Nom"].to_numpy()[isolated_rows],
+                                    "Ville": df["Ville"].to_numpy()[isolated_rows],
+                                    "Concurrent (km)": coverage.nearest_km[isolated_rows].round(2)
+                                }),
+                                use_container_width=True,
+                                hide_index=True
+                            )
+
+                    # Plus proches voisins du point de référence (KD-tree)
+                    if reference_point is not None:
+                        st.markdown(f"### 📍 Plus proches de {reference}")
+                        nearest_rows, nearest_km = get_dataset().distance_index(data).nearest(
+                            *reference_point, k=10, rows=filtered_rows
+                        )
+                        st.dataframe(
+                            pd.DataFrame({
+                                "Nom": df["Nom"].to_numpy()[nearest_rows],
+                                "Ville": df["Ville"].to_numpy()[nearest_rows],
+                                "Distance (km)": nearest_km.round(2)
+                            }),
+                            use_container_width=True,
+                            hide_index=True
+                        )
+    
+            elif active_tab == TABS[1]:
+                st.markdown('<div class="section-header"><h3>⭐ Analyse de Performance</h3></div>', 
+                           unsafe_allow_html=True)
+        
+                if 'Note_Google' in df.columns:
+                    # Dashboard des notes avec sous-graphiques
+                    fig_perf = cached_figure(
+                        "performance", lambda: performance_figure(
+                            df_filtered, agg["top5_city_notes"], distance_col, histograms=agg["histograms"]
+                        )
+                    )
+                    st.plotly_chart(fig_perf, use_container_width=True)
+                    if len(df_filtered) > SCATTER_POINT_LIMIT:
+                        st.caption(
+                            f"🔎 Au-delà de {SCATTER_POINT_LIMIT} optiques, les nuages sont regroupés par densité "
+                            f"(taille des points = nombre d'optiques)."
+                        )
             
-            # Distribution Nb d'avis
-            fig_perf.add_trace(
-                go.Histogram(x=df_filtered["Nb_Avis_Google"].dropna(), 
-                           nbinsx=30, name="Nb Avis", marker_color='red'),
-                row=2, col=2
-            )
+                    # Insights de performance
+                    col1, col2, col3 = st.columns(3)
             
-            # Distance vs notes
-            if "Distance-TARMIZ(KM)" in df.columns:
-                fig_perf.add_trace(
-                    go.Scatter(x=df_filtered["Distance-TARMIZ(KM)"], 
-                             y=df_filtered["Note_Google"],
-                             mode="markers", name="Distance vs Note",
-                             marker=dict(color='brown', size=6)),
-                    row=2, col=3
-                )
+                    with col1:
+                        high_rated = agg['note_ge_4']
+                        st.metric("🌟 Notes ≥ 4.0", f"{high_rated} ({share(high_rated, agg['n_rows']):.1f}%)")
             
-            fig_perf.update_layout(
-                height=800, 
-                title_text="📊 Dashboard Performance Complet",
-                title_x=0.5,
-                showlegend=False
-            )
-            st.plotly_chart(fig_perf, use_container_width=True)
+                    with col2:
+                        high_reviews = agg['avis_ge_50']
+                        st.metric("💬 Avis ≥ 50", f"{high_reviews} ({share(high_reviews, agg['n_rows']):.1f}%)")
             
-            # Insights de performance
-            col1, col2, col3 = st.columns(3)
+                    with col3:
+                        top_performers = agg['top_performers']
+                        st.metric("🏆 Top Performers", f"{top_performers} ({share(top_performers, agg['n_rows']):.1f}%)")
             
-            with col1:
-                high_rated = len(df_filtered[df_filtered['Note_Google'] >= 4.0])
-                st.metric("🌟 Notes ≥ 4.0", f"{high_rated} ({high_rated/len(df_filtered)*100:.1f}%)")
+                # Classement des prospects : score composite pondéré, top-K sans tri complet
+                scoring = get_dataset().scoring(data)
+                if scoring.criteria:
+                    st.markdown("### 🎯 Classement des prospects")
+                    with st.expander("⚖️ Pondération des critères"):
+                        weights = {}
+                        for weight_col, name in zip(st.columns(len(scoring.criteria)), scoring.criteria):
+                            with weight_col:
+                                weights[name] = st.slider(
+                                    CRITERIA[name], 0, 100, int(DEFAULT_WEIGHTS[name] * 100), step=5, key=f"weight_{name}"
+                                )
+                        st.caption(
+                            f"Note bayésienne : note Google ramenée vers la moyenne générale tant que les avis "
+                            f"sont peu nombreux (comme {SCORE_PRIOR_REVIEWS} avis supplémentaires à la moyenne)."
+                        )
             
-            with col2:
-                high_reviews = len(df_filtered[df_filtered['Nb_Avis_Google'] >= 50])
-                st.metric("💬 Avis ≥ 50", f"{high_reviews} ({high_reviews/len(df_filtered)*100:.1f}%)")
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        top_k = st.number_input("Nombre d'optiques (K):", 1, 100, 10)
+                    with col2:
+                        per_city = st.checkbox(
+                            "K meilleures de chaque ville", False, disabled=selected_city != core.ALL_CITIES
+                        )
             
-            with col3:
-                top_performers = len(df_filtered[
-                    (df_filtered['Note_Google'] >= 4.0) & 
-                    (df_filtered['Nb_Avis_Google'] >= 20)
-                ])
-                st.metric("🏆 Top Performers", f"{top_performers} ({top_performers/len(df_filtered)*100:.1f}%)")
-    
-    with tab3:
-        st.markdown('<div class="section-header"><h3>📱 Présence Digitale</h3></div>', 
-                   unsafe_allow_html=True)
-        
-        # Analyse présence digitale
-        digital_cols = ["Site web","Réseaux sociaux","Email"]
-        digital_data = []
-        
-        for col in digital_cols:
-            if col in df.columns:
-                count = df_filtered[col].notna().sum()
-                percentage = (count / len(df_filtered)) * 100
-                digital_data.append({
-                    'Canal': col,
-                    'Nombre': count,
-                    'Pourcentage': percentage
-                })
-        
-        if digital_data:
-            col1, col2 = st.columns(2)
+                    if sum(weights.values()) == 0:
+                        st.warning("⚠️ Donnez un poids positif à au moins un critère.")
+                    else:
+                        with stage("classement", rows=len(filtered_rows)):
+                            if per_city and selected_city == core.ALL_CITIES:
+                                parts = list(scoring.top_k_by_city(weights, top_k, filtered_rows).values())
+                                ranked = np.concatenate(parts) if parts else np.empty(0, dtype=np.intp)
+                            else:
+                                ranked = scoring.top_k(weights, top_k, filtered_rows)
+                            ranking_cols = [col for col in ["Nom", "Ville", "Note_Google", "Nb_Avis_Google",
+                                                            "Score_Presence_Digitale", distance_col] if col in df.columns]
+                            ranking = df[ranking_cols].take(ranked)
+                            ranking.insert(0, "Score", scoring.scores(weights)[ranked].astype(float).round(1))
+                        st.dataframe(ranking, use_container_width=True, hide_index=True)
+    
+            elif active_tab == TABS[2]:
+                st.markdown('<div class="section-header"><h3>📱 Présence Digitale</h3></div>', 
+                           unsafe_allow_html=True)
+        
+                # Analyse présence digitale
+                digital_cols = ["Site web","Réseaux sociaux","Email"]
+                digital_data = []
+        
+                for col in digital_cols:
+                    if col in df.columns:
+                        count = agg['channels'][col]
+                        percentage = share(count, agg['n_rows'])
+                        digital_data.append({
+                            'Canal': col,
+                            'Nombre': count,
+                            'Pourcentage': percentage
+                        })
+        
+                if digital_data:
+                    col1, col2 = st.columns(2)
             
-            with col1:
-                digital_df = pd.DataFrame(digital_data)
-                fig_digital = px.bar(
-                    digital_df,
-                    x='Canal',
-                    y='Pourcentage',
-                    color='Pourcentage',
-                    color_continuous_scale=color_theme,
-                    title="📊 Taux de Présence par Canal",
-                    text='Pourcentage'
-                )
-                fig_digital.update_traces(
-                    texttemplate='%{text:.1f}%', 
-                    textposition='outside'
-                )
-                fig_digital.update_layout(height=400)
-                st.plotly_chart(fig_digital, use_container_width=True)
+                    with col1:
+                        digital_df = pd.DataFrame(digital_data)
+                        fig_digital = digital_channels_figure(digital_df, color_theme)
+                        st.plotly_chart(fig_digital, use_container_width=True)
             
-            with col2:
-                fig_pie = px.pie(
-                    digital_df,
-                    values='Nombre',
-                    names='Canal',
-                    title="🥧 Répartition des Canaux",
-                    color_discrete_sequence=px.colors.qualitative.Set3
-                )
-                fig_pie.update_layout(height=400)
-                st.plotly_chart(fig_pie, use_container_width=True)
+                    with col2:
+                        fig_pie = digital_pie_figure(digital_df)
+                        st.plotly_chart(fig_pie, use_container_width=True)
         
-        # Score présence digitale
-        if "Score_Presence_Digitale" in df.columns:
-            col1, col2 = st.columns(2)
+                # Score présence digitale
+                if "Score_Presence_Digitale" in df.columns:
+                    col1, col2 = st.columns(2)
             
-            with col1:
-                fig_score_dist = px.histogram(
-                    df_filtered, 
-                    x="Score_Presence_Digitale", 
-                    nbins=20,
-                    color_discrete_sequence=['lightcoral'],
-                    title="📈 Distribution Score Digital"
-                )
-                st.plotly_chart(fig_score_dist, use_container_width=True)
+                    with col1:
+                        fig_score_dist = cached_figure("score_distribution", lambda: score_distribution_figure(df_filtered, agg["histograms"]))
+                        st.plotly_chart(fig_score_dist, use_container_width=True)
             
-            with col2:
-                if 'Note_Google' in df.columns:
-                    fig_correlation = px.scatter(
-                        df_filtered, 
-                        x="Score_Presence_Digitale", 
-                        y="Note_Google",
-                        color="Ville",
-                        size="Nb_Avis_Google" if "Nb_Avis_Google" in df.columns else None,
-                        hover_data=["Nom"],
-                        title="🔗 Score Digital vs Performance"
-                    )
-                    st.plotly_chart(fig_correlation, use_container_width=True)
-    
-    with tab4:
-        st.markdown('<div class="section-header"><h3>📊 Analytics Avancés</h3></div>', 
-                   unsafe_allow_html=True)
+                    with col2:
+                        if 'Note_Google' in df.columns:
+                            fig_correlation = cached_figure("digital_scatter", lambda: digital_scatter_figure(df_filtered))
+                            st.plotly_chart(fig_correlation, use_container_width=True)
+                            if len(df_filtered) > SCATTER_POINT_LIMIT:
+                                st.caption("🔎 Points regroupés par ville et par densité.")
+    
+            elif active_tab == TABS[3]:
+                st.markdown('<div class="section-header"><h3>📊 Analytics Avancés</h3></div>', 
+                           unsafe_allow_html=True)
         
-        # Matrice de corrélation
-        numeric_columns = df_filtered.select_dtypes(include=[np.number]).columns
-        if len(numeric_columns) > 1:
-            st.markdown("### 🔗 Matrice de Corrélation")
-            correlation_matrix = df_filtered[numeric_columns].corr()
+                # Matrice de corrélation (statistiques par ville, en cache par sélection)
+                correlations = get_dataset().correlations(data)
+                if len(correlations.columns) > 1:
+                    st.markdown("### 🔗 Matrice de Corrélation")
+                    col1, col2 = st.columns(2)
             
-            fig_corr = px.imshow(
-                correlation_matrix,
-                color_continuous_scale=color_theme,
-                title="Corrélations entre variables numériques"
-            )
-            fig_corr.update_layout(height=500)
-            st.plotly_chart(fig_corr, use_container_width=True)
+                    with col1:
+                        corr_method = CORRELATION_METHODS[st.selectbox("Méthode:", list(CORRELATION_METHODS))]
+            
+                    with col2:
+                        corr_complete = st.checkbox(
+                            "Lignes complètes uniquement", False,
+                            help="Par défaut, chaque paire de variables utilise les lignes où les deux sont renseignées."
+                        )
+            
+                    with stage("corrélations", rows=len(filtered_rows)):
+                        corr_matrix = correlations.get(
+                            core.city_filter(selected_city),
+                            note_range,
+                            max_distance,
+                            method=corr_method,
+                            complete=corr_complete,
+                            rows=filtered_rows
+                        )
+                    fig_corr = cached_figure(
+                        "correlation", lambda: correlation_figure(df_filtered, color_theme, corr_matrix),
+                        color_theme, corr_method, corr_complete
+                    )
+                    st.plotly_chart(fig_corr, use_container_width=True)
         
-        # Analyse par segments
-        col1, col2 = st.columns(2)
+                # Analyse par segments
+                col1, col2 = st.columns(2)
         
-        with col1:
-            if "Taille_Entreprise" in df.columns:
-                st.markdown("### 🏢 Analyse par Taille")
-                size_analysis = df_filtered.groupby('Taille_Entreprise').agg({
-                    'Note_Google': 'mean',
-                    'Nb_Avis_Google': 'mean',
-                    'Score_Presence_Digitale': 'mean'
-                }).round(2)
+                with col1:
+                    if "Taille_Entreprise" in df.columns:
+                        st.markdown("### 🏢 Analyse par Taille")
+                        size_analysis = agg['size_analysis']
                 
-                st.dataframe(size_analysis, use_container_width=True)
+                        st.dataframe(size_analysis, use_container_width=True)
                 
-                fig_size = px.pie(
-                    df_filtered, 
-                    names="Taille_Entreprise",
-                    title="Répartition par Taille",
-                    color_discrete_sequence=px.colors.qualitative.Pastel
-                )
-                st.plotly_chart(fig_size, use_container_width=True)
-        
-        with col2:
-            if "Anciennete_Estimee" in df.columns:
-                st.markdown("### 📅 Analyse Temporelle")
-                fig_age = px.histogram(
-                    df_filtered,
-                    x="Anciennete_Estimee",
-                    nbins=15,
-                    color_discrete_sequence=['lightseagreen'],
-                    title="Distribution de l'Ancienneté"
-                )
-                st.plotly_chart(fig_age, use_container_width=True)
+                        fig_size = cached_figure("size_pie", lambda: size_pie_figure(df_filtered))
+                        st.plotly_chart(fig_size, use_container_width=True)
+        
+                with col2:
+                    if "Anciennete_Estimee" in df.columns:
+                        st.markdown("### 📅 Analyse Temporelle")
+                        fig_age = cached_figure("age_histogram", lambda: age_histogram_figure(df_filtered, agg["histograms"]))
+                        st.plotly_chart(fig_age, use_container_width=True)
                 
-                # Ancienneté vs Performance
-                if 'Note_Google' in df.columns:
-                    fig_age_perf = px.scatter(
-                        df_filtered,
-                        x="Anciennete_Estimee",
-                        y="Note_Google",
-                        color="Score_Presence_Digitale" if "Score_Presence_Digitale" in df.columns else None,
-                        title="Ancienneté vs Performance"
-                    )
-                    st.plotly_chart(fig_age_perf, use_container_width=True)
+                        # Ancienneté vs Performance
+                        if 'Note_Google' in df.columns:
+                            fig_age_perf = cached_figure("age_scatter", lambda: age_scatter_figure(df_filtered))
+                            st.plotly_chart(fig_age_perf, use_container_width=True)
         
-        # Benchmarking
-        st.markdown("### 🎯 Benchmarking")
+                # Benchmarking
+                st.markdown("### 🎯 Benchmarking")
         
-        col1, col2, col3, col4 = st.columns(4)
+                col1, col2, col3, col4 = st.columns(4)
         
-        with col1:
-            if 'Note_Google' in df.columns:
-                top_25_pct = df_filtered['Note_Google'].quantile(0.75)
-                st.metric("🥇 Top 25% Notes", f"{top_25_pct:.2f}+")
+                with col1:
+                    if 'Note_Google' in df.columns:
+                        top_25_pct = agg['note_q75']
+                        st.metric("🥇 Top 25% Notes", f"{top_25_pct:.2f}+")
         
-        with col2:
-            if 'Nb_Avis_Google' in df.columns:
-                median_reviews = df_filtered['Nb_Avis_Google'].median()
-                st.metric("📊 Médiane Avis", f"{median_reviews:.0f}")
+                with col2:
+                    if 'Nb_Avis_Google' in df.columns:
+                        median_reviews = agg['avis_median']
+                        st.metric("📊 Médiane Avis", f"{median_reviews:.0f}")
         
-        with col3:
-            if 'Score_Presence_Digitale' in df.columns:
-                top_digital = df_filtered['Score_Presence_Digitale'].quantile(0.90)
-                st.metric("🚀 Top 10% Digital", f"{top_digital:.0f}+")
+                with col3:
+                    if 'Score_Presence_Digitale' in df.columns:
+                        top_digital = agg['digital_q90']
+                        st.metric("🚀 Top 10% Digital", f"{top_digital:.0f}+")
         
-        with col4:
-            if 'Distance-TARMIZ(KM)' in df.columns:
-                close_to_tarmiz = len(df_filtered[df_filtered['Distance-TARMIZ(KM)'] <= 10])
-                st.metric("📍 Proche TARMIZ (<10km)", close_to_tarmiz)
-    
-    with tab5:
-        st.markdown('<div class="section-header"><h3>📋 Données Détaillées</h3></div>', 
-                   unsafe_allow_html=True)
+                with col4:
+                    if distance_col in df.columns:
+                        close_to_reference = agg['distance_le_10']
+                        st.metric(f"📍 Proche {reference} (<10km)", close_to_reference)
+    
+            elif active_tab == TABS[4]:
+                st.markdown('<div class="section-header"><h3>📋 Données Détaillées</h3></div>', 
+                           unsafe_allow_html=True)
+
+                duplicates = get_dataset().duplicates(data)
+                if len(duplicates):
+                    with st.expander(f"🧹 {len(duplicates)} doublons fusionnés à l'import"):
+                        st.dataframe(duplicates, use_container_width=True, hide_index=True)
         
-        # Options d'affichage
-        col1, col2, col3 = st.columns(3)
+                # Options d'affichage
+                col1, col2, col3 = st.columns(3)
         
-        with col1:
-            show_all = st.checkbox("Afficher toutes les colonnes", False)
+                with col1:
+                    show_all = st.checkbox("Afficher toutes les colonnes", False)
         
-        with col2:
-            if not show_all:
-                display_cols = st.multiselect(
-                    "Colonnes à afficher:",
-                    df_filtered.columns.tolist(),
-                    default=['Nom', 'Ville', 'Note_Google', 'Nb_Avis_Google'][:4]
-                )
-            else:
-                display_cols = df_filtered.columns.tolist()
+                with col2:
+                    if not show_all:
+                        display_cols = st.multiselect(
+                            "Colonnes à afficher:",
+                            df_filtered.columns.tolist(),
+                            default=['Nom', 'Ville', 'Note_Google', 'Nb_Avis_Google'][:4]
+                        )
+                    else:
+                        display_cols = df_filtered.columns.tolist()
         
-        with col3:
-            sort_by = st.selectbox(
-                "Trier par:",
-                ['Note_Google', 'Nb_Avis_Google', 'Score_Presence_Digitale', 'Distance-TARMIZ(KM)']
-            )
+                with col3:
+                    sort_by = st.selectbox(
+                        "Trier par:",
+                        SORT_COLS + [distance_col]
+                    )
         
-        # Affichage du tableau
-        if display_cols:
-            df_display = df_filtered[display_cols].copy()
-            
-            if sort_by in df_display.columns:
-                df_display = df_display.sort_values(sort_by, ascending=False)
+                # Recherche plein texte et pagination (index pré-calculés par version)
+                col1, col2 = st.columns([3, 1])
+        
+                with col1:
+                    search_query = st.text_input("🔎 Rechercher (nom, ville):", "")
+        
+                with col2:
+                    page_size = st.selectbox("Lignes par page:", PAGE_SIZES, index=1)
+        
+                # Affichage du tableau : seule la page visible est envoyée au navigateur
+                if display_cols:
+                    with stage("tableau", rows=len(filtered_rows)) as record:
+                        table_rows = get_dataset().table_rows(
+                            data, filter_key, filtered_rows,
+                            sort_col=sort_by if sort_by in display_cols else None,
+                            query=search_query
+                        )
+                        n_pages = max(1, -(-len(table_rows) // page_size))
+                        # Nouvelle sélection, recherche ou tri : retour en page 1
+                        page = st.number_input(
+                            f"Page (sur {n_pages}):", 1, n_pages, 1,
+                            key=f"table_page_{hash((filter_key, search_query, sort_by, page_size))}"
+                        )
+                        start, stop = page_bounds(len(table_rows), page, page_size)
+                        # Colonnes d'abord : le take ne copie que ce qui est affiché
+                        df_page = df[display_cols].take(table_rows[start:stop])
+                        record["rows"] = len(table_rows)
             
-            st.dataframe(
-                df_display,
-                use_container_width=True,
-                height=400
-            )
+                    st.dataframe(
+                        df_page,
+                        use_container_width=True,
+                        height=400
+                    )
+                    st.caption(f"Lignes {start + 1}–{stop} sur {len(table_rows)}" if len(table_rows)
+                               else "Aucune ligne ne correspond à la recherche")
             
-            # Statistiques du tableau
-            st.markdown("### 📈 Statistiques")
-            col1, col2, col3, col4 = st.columns(4)
+                    # Statistiques du tableau
+                    st.markdown("### 📈 Statistiques")
+                    col1, col2, col3, col4 = st.columns(4)
             
-            with col1:
-                st.metric("📊 Lignes affichées", len(df_display))
+                    with col1:
+                        st.metric("📊 Lignes affichées", len(table_rows))
             
-            with col2:
-                st.metric("📋 Colonnes", len(display_cols))
+                    with col2:
+                        st.metric("📋 Colonnes", len(display_cols))
             
-            with col3:
-                if 'Note_Google' in df_display.columns:
-                    avg_note_filtered = df_display['Note_Google'].mean()
-                    st.metric("⭐ Moyenne filtrée", f"{avg_note_filtered:.2f}")
+                    with col3:
+                        if 'Note_Google' in display_cols:
+                            avg_note_filtered = agg['note_mean'] if len(table_rows) == len(filtered_rows) else \
+                                df['Note_Google'].iloc[table_rows].mean()
+                            st.metric("⭐ Moyenne filtrée", f"{avg_note_filtered:.2f}")
             
-            with col4:
-                if 'Score_Presence_Digitale' in df_display.columns:
-                    avg_digital_filtered = df_display['Score_Presence_Digitale'].mean()
-                    st.metric("📱 Score moy. filtré", f"{avg_digital_filtered:.0f}")
+                    with col4:
+                        if 'Score_Presence_Digitale' in display_cols:
+                            avg_digital_filtered = agg['digital_mean'] if len(table_rows) == len(filtered_rows) else \
+                                df['Score_Presence_Digitale'].iloc[table_rows].mean()
+                            st.metric("📱 Score moy. filtré", f"{avg_digital_filtered:.0f}")
         
-        # Export des données
-        st.markdown("### 📥 Export")
+                # Export des données (sérialisé par blocs, uniquement au clic)
+                st.markdown("### 📥 Export")
         
-        col1, col2 = st.columns(2)
+                export_format = st.selectbox("Format d'export:", list(EXPORT_FORMATS))
+                export_mime = EXPORT_FORMATS[export_format][1]
+                export_stamp = datetime.now().strftime('%Y%m%d')
+            
+                def export_data(frame):
+                    # Appelé au clic, éventuellement hors du rerun : mesuré isolément
+                    with stage(f"export.{export_format}", rows=len(frame)):
+                        return export_bytes(frame, export_format)
         
-        with col1:
-            csv = df_filtered.to_csv(index=False)
-            st.download_button(
-                label="📊 Télécharger CSV (Filtré)",
-                data=csv,
-                file_name=f"optiques_filtered_{datetime.now().strftime('%Y%m%d')}.csv",
-                mime="text/csv"
-            )
+                col1, col2 = st.columns(2)
         
-        with col2:
-            if display_cols:
-                csv_display = df_display.to_csv(index=False)
-                st.download_button(
-                    label="📋 Télécharger Sélection",
-                    data=csv_display,
-                    file_name=f"optiques_selection_{datetime.now().strftime('%Y%m%d')}.csv",
-                    mime="text/csv"
-                )
+                with col1:
+                    st.download_button(
+                        label=f"📊 Télécharger {export_format} (Filtré)",
+                        data=lambda: export_data(df_filtered),
+                        file_name=export_file_name("optiques_filtered", export_format, export_stamp),
+                        mime=export_mime
+                    )
+        
+                with col2:
+                    if display_cols:
+                        st.download_button(
+                            label="📋 Télécharger Sélection",
+                            data=lambda: export_data(filter_frame(df[display_cols], table_rows)),
+                            file_name=export_file_name("optiques_selection", export_format, export_stamp),
+                            mime=export_mime
+                        )
+    
+    render_tabs()
     
     # ----------------------------
     # FOOTER AVEC RÉSUMÉ
@@ -639,32 +809,72 @@ if df is not None:
     with col1:
         st.markdown("### 🏆 Performance")
         if 'Note_Google' in df.columns:
-            excellent = len(df_filtered[df_filtered['Note_Google'] >= 4.5])
-            st.write(f"• **Excellentes** (≥4.5): {excellent} ({excellent/len(df_filtered)*100:.1f}%)")
-            good = len(df_filtered[df_filtered['Note_Google'] >= 4.0])
-            st.write(f"• **Bonnes** (≥4.0): {good} ({good/len(df_filtered)*100:.1f}%)")
+            excellent = agg['note_ge_4_5']
+            st.write(f"• **Excellentes** (≥4.5): {excellent} ({share(excellent, agg['n_rows']):.1f}%)")
+            good = agg['note_ge_4']
+            st.write(f"• **Bonnes** (≥4.0): {good} ({share(good, agg['n_rows']):.1f}%)")
     
     with col2:
         st.markdown("### 📱 Digital")
         if all(col in df.columns for col in ['Site web', 'Email', 'Réseaux sociaux']):
-            complete_digital = len(df_filtered[
-                df_filtered['Site web'].notna() & 
-                df_filtered['Email'].notna() & 
-                df_filtered['Réseaux sociaux'].notna()
-            ])
-            st.write(f"• **Présence complète**: {complete_digital} ({complete_digital/len(df_filtered)*100:.1f}%)")
+            complete_digital = agg['complete_digital']
+            st.write(f"• **Présence complète**: {complete_digital} ({share(complete_digital, agg['n_rows']):.1f}%)")
     
     with col3:
         st.markdown("### 🌍 Géographie")
-        total_cities = df_filtered['Ville'].nunique()
-        top_city = df_filtered['Ville'].value_counts().index[0]
-        top_count = df_filtered['Ville'].value_counts().iloc[0]
+        total_cities = agg['n_cities']
         st.write(f"• **Villes couvertes**: {total_cities}")
-        st.write(f"• **Leader**: {top_city} ({top_count})")
+        if total_cities:
+            top_city = agg['city_counts'].index[0]
+            top_count = agg['city_counts'].iloc[0]
+            st.write(f"• **Leader**: {top_city} ({top_count})")
     
     # Timestamp
     st.markdown(f"*Dernière mise à jour: {datetime.now().strftime('%d/%m/%Y à %H:%M')}*")
 
 else:
-    st.error("❌ Impossible de charger le fichier OPTIQUESS.xlsx")
-    st.info("Vérifiez que le fichier existe dans le même répertoire que ce script.")
+    st.error(f"❌ Impossible de charger les données ({DEFAULT_SOURCE})")
+    st.info("Vérifiez que la source (fichier, dossier ou motif défini par OPTIQUES_SOURCE) existe.")
+
+# ----------------------------
+# PROFILAGE (opt-in : ?debug=1)
+# ----------------------------
+records = profiler.finish()
+if DEBUG_PANEL or st.query_params.get("debug") == "1":
+    if st.sidebar.checkbox("🛠️ Profilage", False):
+        st.sidebar.markdown(f"**Rerun** : {profiler.total * 1000:.0f} ms")
+        st.sidebar.dataframe(
+            pd.DataFrame({
+                "Étape": ["· " * r["depth"] + r["stage"] for r in records],
+                "ms": [round(r["seconds"] * 1000, 1) for r in records],
+                "Lignes": [r["rows"] for r in records],
+                "Δ Mo": [None if r["mem_delta"] is None else round(r["mem_delta"] / 2**20, 1) for r in records]
+            }),
+            use_container_width=True,
+            hide_index=True
+        )
+        
+        # Taux de succès des caches, pour régler OPTIQUES_WARMUP_CITIES
+        if df is not None:
+            cache_stats = {**get_dataset().cache_stats(data), "Figures": get_figure_cache(version).stats()}
+            st.sidebar.markdown("**Caches**")
+            st.sidebar.dataframe(
+                pd.DataFrame({
+                    "Cache": list(cache_stats),
+                    "Entrées": [c["entries"] for c in cache_stats.values()],
+                    "Mo": [round(c["bytes"] / 2**20, 1) for c in cache_stats.values()],
+                    "Succès": [c["hits"] for c in cache_stats.values()],
+                    "Échecs": [c["misses"] for c in cache_stats.values()],
+                    "Taux %": [None if c["hit_rate"] is None else round(c["hit_rate"] * 100, 1)
+                               for c in cache_stats.values()]
+                }),
+                use_container_width=True,
+                hide_index=True
+            )
+            warmup = get_warmer().last_run
+            if warmup is not None:
+                duration = "" if warmup["seconds"] is None else f" en {warmup['seconds']:.1f} s"
+                st.sidebar.caption(
+                    f"Préchauffage ({warmup['version'][:8]}) : {warmup['status']}, "
+                    f"{warmup['selections']} sélections{duration}"
+                )